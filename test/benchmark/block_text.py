@@ -0,0 +1,51 @@
+import sys
+import os
+import argparse
+import time
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.reader.tglyph import TglyphReader
+from thothglyph.reader.md import MdReader
+from thothglyph.node import logging
+
+# Parses documents made of one long block (e.g. a generated register map in
+# a code block) and prints the time per line; it stays flat while the text
+# of a block is assembled in linear time.
+
+BLOCKS = {
+    'code': (TglyphReader, '⸌⸌⸌ c\n{}⸌⸌⸌\n', 'reg_{n:06x} = 0x{n:08x};  // register {n}\n'),
+    'custom': (TglyphReader, '¤¤¤csv\n{}¤¤¤\n', '{n},reg_{n:06x},0x{n:08x}\n'),
+    'paragraph': (TglyphReader, '{}\n', 'Line {n} of a long paragraph of plain text.\n'),
+    'config': (TglyphReader, '⑇⑇⑇\n{}⑇⑇⑇\n', 'reg_{n:06x} = 0x{n:08x}\n'),
+    'md-config': (MdReader, '```{{config}} python\n{}```\n', 'reg_{n:06x} = 0x{n:08x}\n'),
+}
+
+
+def measure(name: str, nlines: int) -> float:
+    readercls, block, line = BLOCKS[name]
+    data = block.format(''.join([line.format(n=n) for n in range(nlines)]))
+    reader = readercls()
+    reader.path = 'block.' + readercls.ext
+    t = time.perf_counter()
+    reader.parser.parse(data)
+    return time.perf_counter() - t
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--lines', '-n', type=int, nargs='+', default=[10000, 50000])
+    argparser.add_argument('--block', '-b', nargs='+', default=list(BLOCKS), choices=BLOCKS)
+    args = argparser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print('{:>10} {:>8} {:>10} {:>10}'.format('block', 'lines', 'seconds', 'us/line'))
+    for name in args.block:
+        for nlines in args.lines:
+            t = measure(name, nlines)
+            print('{:>10} {:>8} {:>10.3f} {:>10.2f}'.format(name, nlines, t, t / nlines * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import sys
+import os
+import argparse
+import time
+from typing import Set, Tuple
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.reader.reader import exprcache
+from thothglyph.reader.tglyph import TglyphReader
+from thothglyph.reader.md import MdReader
+from thothglyph.node import logging
+
+# Parses a document of many ⑇if/⑇elif sections (one source for several
+# product variants) with an empty and with a warm expression cache, and
+# prints the attrs the preprocessed lines depend on.
+
+CONFIG = {
+    'tglyph': (TglyphReader, "⑇⑇⑇\nattrs = {'sku': 'sku3', 'rev': 2, 'unused': 0}\n⑇⑇⑇\n\n"),
+    'md': (MdReader, "--- python\nattrs = {'sku': 'sku3', 'rev': 2, 'unused': 0}\n---\n\n"),
+}
+CHUNK = '''\
+⑇if sku in ('sku{a}', 'sku{b}') and rev >= {rev}
+Text {n} for some products.
+⑇elif sku == 'sku{c}'
+Text {n} for another product.
+⑇end
+
+'''
+
+
+def generate(ext: str, nconds: int, nvariants: int) -> str:
+    chunks = [CONFIG[ext][1]]
+    for n in range(nconds):
+        a, b, c = n % nvariants, (n + 1) % nvariants, (n * 7) % nvariants
+        chunk = CHUNK.format(n=n, a=a, b=b, c=c, rev=n % 3)
+        if ext == 'md':
+            chunk = chunk.replace('⑇', '%#')
+        chunks.append(chunk)
+    return ''.join(chunks)
+
+
+def measure(ext: str, data: str) -> Tuple[float, Set[str]]:
+    reader = CONFIG[ext][0]()
+    reader.path = 'conditions.' + ext
+    t = time.perf_counter()
+    reader.parser.parse(data)
+    return time.perf_counter() - t, reader.attrnames
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--conds', '-n', type=int, default=5000)
+    argparser.add_argument('--variants', '-v', type=int, default=30)
+    args = argparser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print('{:>8} {:>10} {:>10} {:>10}'.format('format', 'cache', 'seconds', 'compiled'))
+    for ext in CONFIG:
+        data = generate(ext, args.conds, args.variants)
+        exprcache.exprs.clear()
+        for state in ('empty', 'warm'):
+            misses = exprcache.misses
+            t, attrnames = measure(ext, data)
+            print('{:>8} {:>10} {:>10.3f} {:>10}'.format(
+                ext, state, t, exprcache.misses - misses))
+        print('{:>8} depends on: {}'.format(ext, ', '.join(sorted(attrnames))))
+
+
+if __name__ == '__main__':
+    main()
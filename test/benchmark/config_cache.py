@@ -0,0 +1,93 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.reader.tglyph import TglyphReader
+from thothglyph.reader import doccache
+from thothglyph.node import nd
+from thothglyph.node import logging
+
+# Reads a document including many sub-documents, each of which includes the
+# same sub.conf.py in a config block, with and without nd.configcache, and
+# prints the time and the number of config texts compiled and run.
+
+CONF = '''\
+title = 'Sub Document'
+version = '1.0.0'
+author = 'Foo Bar'
+attrs = {{
+{attrs}
+}}
+'''
+SUB = '''\
+⑇⑇⑇
+¤include⸨sub.conf.py⸩
+⑇⑇⑇
+
+▮ Sub {n}
+
+Text of sub-document {n}, ⁅attr0⁆.
+'''
+
+
+def measure(nsubs: int, cached: bool) -> float:
+    cache = nd.configcache
+    params = cache.params
+
+    def uncached(text, lang, node):
+        cache._codes.clear()
+        cache._params.clear()
+        return params(text, lang, node)
+
+    cache._codes.clear()
+    cache._params.clear()
+    if not cached:
+        cache.params = uncached
+    doccache.documentcache.entries.clear()
+    try:
+        t = time.perf_counter()
+        TglyphReader().read('main.tglyph')
+        return time.perf_counter() - t
+    finally:
+        cache.params = params
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--subs', '-n', type=int, default=1000)
+    argparser.add_argument('--attrs', '-a', type=int, default=200)
+    args = argparser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            attrs = '\n'.join(["    'attr{0}': 'value {0}',".format(i) for i in range(args.attrs)])
+            with open('sub.conf.py', 'w', encoding='utf-8') as f:
+                f.write(CONF.format(attrs=attrs))
+            includes = list()
+            for n in range(args.subs):
+                with open('sub{}.tglyph'.format(n), 'w', encoding='utf-8') as f:
+                    f.write(SUB.format(n=n))
+                includes.append('¤include⸨sub{}.tglyph⸩\n'.format(n))
+            with open('main.tglyph', 'w', encoding='utf-8') as f:
+                f.write('▮ Main\n\n' + '\n'.join(includes))
+
+            print('{:>8} {:>10} {:>10}'.format('cache', 'seconds', 'compiled'))
+            for cached in (False, True):
+                misses = nd.configcache.misses
+                t = measure(args.subs, cached)
+                print('{:>8} {:>10.3f} {:>10}'.format(
+                    'yes' if cached else 'no', t, nd.configcache.misses - misses))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
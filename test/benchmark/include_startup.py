@@ -0,0 +1,85 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.reader.tglyph import TglyphReader
+from thothglyph.reader.md import MdReader
+from thothglyph.node import logging
+
+# Measures the fixed cost of a reader: creating readers, and reading a root
+# document that includes many small documents (each include creates a reader).
+
+SUBDOC = {
+    'tglyph': '''\
+▮ Included {n}
+
+Text of document {n} with ⧫strong⧫ words.
+
+''',
+    'md': '''\
+# Included {n}
+
+Text of document {n} with **strong** words.
+
+''',
+}
+INCLUDE = {
+    'tglyph': '¤include⸨sub{n}.tglyph⸩\n\n',
+    'md': '```{{include}} sub{n}.md\n```\n\n',
+}
+READERS = {
+    'tglyph': TglyphReader,
+    'md': MdReader,
+}
+
+
+def measure_readers(ext: str, count: int) -> float:
+    t = time.perf_counter()
+    for i in range(count):
+        READERS[ext]()
+    return time.perf_counter() - t
+
+
+def measure_includes(ext: str, count: int, tmpdir: str) -> float:
+    for i in range(count):
+        path = os.path.join(tmpdir, 'sub{}.{}'.format(i, ext))
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(SUBDOC[ext].format(n=i))
+    path = os.path.join(tmpdir, 'main.{}'.format(ext))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(''.join([INCLUDE[ext].format(n=i) for i in range(count)]))
+    cwd = os.getcwd()
+    os.chdir(tmpdir)  # include paths are relative to the working directory
+    try:
+        reader = READERS[ext]()
+        t = time.perf_counter()
+        reader.read(path)
+        return time.perf_counter() - t
+    finally:
+        os.chdir(cwd)
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--count', '-c', type=int, default=500)
+    args = argparser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print('{:>8} {:>24} {:>10} {:>10}'.format('format', 'case', 'seconds', 'ms/each'))
+    for ext in READERS:
+        t = measure_readers(ext, args.count)
+        print('{:>8} {:>24} {:>10.3f} {:>10.3f}'.format(
+            ext, '{} readers'.format(args.count), t, t / args.count * 1e3))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            t = measure_includes(ext, args.count, tmpdir)
+        print('{:>8} {:>24} {:>10.3f} {:>10.3f}'.format(
+            ext, '{} includes'.format(args.count), t, t / args.count * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.reader.incremental import IncrementalParser, TextEdit
+from thothglyph.error import ThothglyphError
+from thothglyph.node import logging
+from parse_scaling import generate
+
+# Types a sentence into a paragraph in the middle of a generated document,
+# one character per update, and compares the time per update with a full
+# parse of the document. Intermediate states such as an unclosed ⧫ fail to
+# parse, as they do in an editor.
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--lines', '-n', type=int, nargs='+', default=[1000, 10000, 50000])
+    argparser.add_argument('--text', '-t', default='Typed text with ⧫markup⧫.')
+    args = argparser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print('{:>8} {:>10} {:>12} {:>12} {:>10} {:>8}'.format(
+        'lines', 'full [s]', 'update [ms]', 'reparsed', 'changed', 'errors'))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for nlines in args.lines:
+            path = os.path.join(tmpdir, 'doc{}.tglyph'.format(nlines))
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(generate(nlines))
+            iparser = IncrementalParser(path)
+            t = time.perf_counter()
+            iparser.parse()
+            full = time.perf_counter() - t
+
+            lineno = nlines // 2
+            while not iparser.lines[lineno].startswith('Paragraph'):
+                lineno += 1
+            total = 0.0
+            reparsed = nchanged = errors = 0
+            for i in range(len(args.text)):
+                line = iparser.lines[lineno] + args.text[i]
+                t = time.perf_counter()
+                try:
+                    doc, changed = iparser.update(TextEdit(lineno, lineno + 1, [line]))
+                    nchanged += len(changed)
+                except ThothglyphError:
+                    errors += 1
+                total += time.perf_counter() - t
+                reparsed += iparser.reparsed
+            n = len(args.text)
+            print('{:>8} {:>10.3f} {:>12.2f} {:>12.1f} {:>10.1f} {:>8}'.format(
+                nlines, full, total / n * 1e3, reparsed / n, nchanged / n, errors))
+
+
+if __name__ == '__main__':
+    main()
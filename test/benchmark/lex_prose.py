@@ -0,0 +1,62 @@
+import sys
+import os
+import argparse
+import random
+import time
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.reader.tglyph import Lexer
+
+# Lexes a generated prose-heavy tglyph document: paragraphs of plain text
+# (with the odd '|', '-' or '>' inside a line), few sections and lists.
+
+WORDS = (
+    'the quick brown fox jumps over a lazy dog while well-known words '
+    'such as input > output or a | b and x = y appear in the sentence'
+).split()
+
+
+def generate(nlines: int, seed: int = 1) -> str:
+    rand = random.Random(seed)
+    lines = list()
+    for i in range(nlines):
+        if i % 40 == 0:
+            lines.append('▮ Section {}'.format(i))
+        elif i % 40 == 20:
+            lines.append('• list item {}'.format(i))
+        elif i % 8 == 0:
+            lines.append('')
+        else:
+            lines.append(' '.join(rand.choice(WORDS) for _ in range(12)))
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--lines', '-n', type=int, default=100000)
+    argparser.add_argument('--repeat', '-r', type=int, default=5)
+    args = argparser.parse_args()
+
+    data = generate(args.lines)
+    pplines = list(enumerate(data.split('\n')))
+    lexer = Lexer()
+    cases = {
+        'preproc': lambda: lexer.lex_preproc(data),
+        'block': lambda: lexer.lex_block(pplines),
+        'inline': lambda: [lexer.lex_inline(line) for _, line in pplines],
+    }
+    print('{:>8} {:>10} {:>10}'.format('table', 'seconds', 'us/line'))
+    for name, func in cases.items():
+        best = None
+        for i in range(args.repeat):
+            t = time.perf_counter()
+            func()
+            t = time.perf_counter() - t
+            best = t if best is None else min(best, t)
+        print('{:>8} {:>10.3f} {:>10.2f}'.format(name, best, best / args.lines * 1e6))
+
+
+if __name__ == '__main__':
+    main()
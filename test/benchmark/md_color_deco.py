@@ -0,0 +1,58 @@
+import sys
+import os
+import argparse
+import time
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.reader.md import MdReader
+from thothglyph.node import logging
+
+# Parses a markdown status table whose cells are color decorations, e.g.
+# `🟢done`, and the same table with plain code spans, and prints the time
+# per span. The texts of decorations repeat, so most of them are parsed once.
+
+STATUSES = ['🟢done', '🟡wip', '🔴**blocked**', '🔵n/a']
+
+
+def generate(nrows: int, deco: bool) -> str:
+    lines = ['| item | a | b | c | d |', '| --- | --- | --- | --- | --- |']
+    for n in range(nrows):
+        cells = [STATUSES[(n + i) % len(STATUSES)] for i in range(4)]
+        if not deco:
+            cells = [c[1:] for c in cells]
+        lines.append('| item {} | {} |'.format(n, ' | '.join(['`{}`'.format(c) for c in cells])))
+    return '\n'.join(lines) + '\n'
+
+
+def measure(nrows: int, deco: bool, repeat: int) -> float:
+    data = generate(nrows, deco)
+    best = float('inf')
+    for i in range(repeat):
+        reader = MdReader()
+        reader.path = 'status.md'
+        t = time.perf_counter()
+        reader.parser.parse(data)
+        best = min(best, time.perf_counter() - t)
+    return best
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--rows', '-n', type=int, nargs='+', default=[1000, 5000])
+    argparser.add_argument('--repeat', '-r', type=int, default=3)
+    args = argparser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print('{:>8} {:>8} {:>10} {:>10}'.format('spans', 'color', 'seconds', 'us/span'))
+    for nrows in args.rows:
+        for deco in (False, True):
+            t = measure(nrows, deco, args.repeat)
+            nspans = nrows * 4
+            print('{:>8} {:>8} {:>10.3f} {:>10.2f}'.format(
+                nspans, 'yes' if deco else 'no', t, t / nspans * 1e6))
+
+
+if __name__ == '__main__':
+    main()
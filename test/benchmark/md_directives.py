@@ -0,0 +1,76 @@
+import sys
+import os
+import argparse
+import time
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.reader.md import MdReader
+from thothglyph.node import logging
+
+# Parses a generated markdown document made of figure, footnote, reference
+# and table directives and prints the time per directive.
+
+CHUNK = '''\
+# Section {n}
+
+Text of section {n} with a note. {{footnote}}`n{n}a` And another one. {{footnote}}`n{n}b`
+See also the book. {{cite}}`r{n}`
+
+```{{figure}} Figure {n}
+![Figure {n}](./fig{n}.png)
+```
+
+```{{figure}} Table {n}
+| head1 | head2 |
+|-------|-------|
+| cell {n} | *cell* |
+```
+
+```{{footnote}}
+:n{n}a: The first footnote of section {n}.
+:n{n}b: The second footnote with **strong** text.
+```
+
+```{{reference}}
+:r{n}: A Book, {n}, Anonymous.
+```
+
+```{{table}}
+| Feature | Status | Note |
+|:--------|:------:|------|
+| feature {n} | yes | *see* spec |
+| option {n} | no | n/a |
+| mode {n} | yes | n/a |
+```
+
+'''
+DIRECTIVES = 5  # per chunk
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--sections', '-n', type=int, nargs='+', default=[500, 2000])
+    argparser.add_argument('--repeat', '-r', type=int, default=3)
+    args = argparser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print('{:>10} {:>10} {:>10} {:>15}'.format('sections', 'directives', 'seconds', 'us/directive'))
+    for nsections in args.sections:
+        data = ''.join([CHUNK.format(n=n) for n in range(nsections)])
+        # best of repeat runs
+        t = float('inf')
+        for i in range(args.repeat):
+            reader = MdReader()
+            reader.path = 'directives.md'
+            t0 = time.perf_counter()
+            reader.parser.parse(data)
+            t = min(t, time.perf_counter() - t0)
+        ndirectives = nsections * DIRECTIVES
+        print('{:>10} {:>10} {:>10.3f} {:>15.1f}'.format(
+            nsections, ndirectives, t, t / ndirectives * 1e6))
+
+
+if __name__ == '__main__':
+    main()
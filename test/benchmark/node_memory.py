@@ -0,0 +1,101 @@
+import sys
+import os
+import argparse
+import gc
+import tracemalloc
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.node import nd
+
+
+def generate(nparagraphs: int) -> nd.DocumentNode:
+    doc = nd.DocumentNode()
+    section = None
+    for i in range(nparagraphs):
+        if i % 100 == 0:
+            section = nd.SectionNode()
+            section.level = 1
+            section.title = 'Section'
+            doc.add(section)
+        paragraph = nd.ParagraphNode()
+        section.add(paragraph)
+        paragraph.add(nd.TextNode('Paragraph text with '))
+        deco = nd.DecorationRoleNode()
+        deco.role = 'STRONG'
+        deco.add(nd.TextNode('strong'))
+        paragraph.add(deco)
+        paragraph.add(nd.TextNode(' text, a link '))
+        paragraph.add(nd.LinkNode(value='Section'))
+        paragraph.add(nd.TextNode(' and a footnote'))
+        paragraph.add(nd.FootnoteNode('fn'))
+    return doc
+
+
+def slotnames(cls) -> list:
+    names = list()
+    for c in reversed(cls.__mro__):
+        for name in c.__dict__.get('__slots__', ()):
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def layout_copy(node: nd.ASTNode, mirrors: dict, parent=None):
+    # Copies the node shells only; attribute values are shared with the
+    # original tree so that both layouts are measured on equal terms.
+    # mirrors maps a node class to the class used for the copy.
+    cls = node.__class__
+    if cls not in mirrors:
+        mirrors[cls] = (mirrors.get(None, cls), slotnames(cls))
+    copycls, names = mirrors[cls]
+    if copycls is None:
+        copycls = type(cls.__name__, (), {})  # __dict__ based node
+        mirrors[cls] = (copycls, names)
+    copy = copycls.__new__(copycls)
+    for name in names:
+        if name == 'parent':
+            copy.parent = parent
+        elif name == 'children':
+            copy.children = [layout_copy(c, mirrors, copy) for c in node.children]
+        elif hasattr(node, name):
+            setattr(copy, name, getattr(node, name))
+    return copy
+
+
+def measure(func, *args):
+    gc.collect()
+    tracemalloc.start()
+    obj = func(*args)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--paragraphs', '-n', type=int, default=100000)
+    args = argparser.parse_args()
+
+    doc, total_size = measure(generate, args.paragraphs)
+    nnodes = sum(1 for _, gofoward in doc.walk_depth() if gofoward)
+    slots_copy, slots_size = measure(layout_copy, doc, dict())
+    dict_copy, dict_size = measure(layout_copy, doc, {None: None})
+
+    print('paragraphs       : {}'.format(args.paragraphs))
+    print('nodes            : {}'.format(nnodes))
+    print('whole document   : {:8.1f} MiB, {:6.1f} bytes/node'.format(
+        total_size / 2**20, total_size / nnodes))
+    print('node shells')
+    print('  __slots__      : {:8.1f} MiB, {:6.1f} bytes/node'.format(
+        slots_size / 2**20, slots_size / nnodes))
+    print('  __dict__       : {:8.1f} MiB, {:6.1f} bytes/node'.format(
+        dict_size / 2**20, dict_size / nnodes))
+    print('saving           : {:6.1f} bytes/node ({:.0%})'.format(
+        (dict_size - slots_size) / nnodes, 1 - slots_size / dict_size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.reader.tglyph import TglyphReader
+from thothglyph.node import logging
+
+# Parses generated tglyph documents of growing size and prints the time per
+# line, which stays flat when parsing is linear in the document size.
+
+CHUNK = '''\
+▮ Section {n}
+
+Paragraph text with ⧫strong⧫ words, a ¤kbd⸨Ctrl⸩ key
+and a link ⸨#Section_{n}⸩ spread over two lines.
+
+• item one
+• item two
+  ꓾ nested ordered item
+  ꓾ another one
+• item three with ⸌code⸌
+
+| a | b | c |
+| 1 | 2 | 3 |
+
+⸌⸌⸌c
+int main(void) {{
+    return 0;
+}}
+⸌⸌⸌
+
+'''
+
+# comment, config and control-flow lines, handled by the preprocessor
+COMMENTED_CHUNK = '''\
+⑇⑇ comment line {n}
+Paragraph text {n} ⑇⑇ end-of-line comment
+⑇⑇⑇
+version = '{n}'
+⑇⑇⑇
+⑇if {n} % 2 == 0
+Conditional text.
+⑇else
+Other text.
+⑇end
+
+'''
+
+CHUNKS = {
+    'mixed': CHUNK,
+    'commented': COMMENTED_CHUNK,
+}
+
+
+def generate(nlines: int, chunk: str = CHUNK) -> str:
+    chunklines = chunk.count('\n')
+    chunks = [chunk.format(n=i) for i in range(nlines // chunklines + 1)]
+    lines = ''.join(chunks).split('\n')[:nlines]
+    return '\n'.join(lines) + '\n'
+
+
+def measure(nlines: int, tmpdir: str, chunk: str = CHUNK) -> float:
+    path = os.path.join(tmpdir, 'doc{}.tglyph'.format(nlines))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(generate(nlines, chunk))
+    reader = TglyphReader()
+    reader.parse_only = True  # parse only, no post-processing passes
+    t = time.perf_counter()
+    reader.read(path)
+    return time.perf_counter() - t
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument(
+        '--lines', '-n', type=int, nargs='+',
+        default=[1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000])
+    argparser.add_argument('--source', '-s', choices=CHUNKS.keys(), default='mixed')
+    args = argparser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print('{:>8} {:>10} {:>10}'.format('lines', 'seconds', 'us/line'))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for nlines in args.lines:
+            t = measure(nlines, tmpdir, CHUNKS[args.source])
+            print('{:>8} {:>10.3f} {:>10.1f}'.format(nlines, t, t / nlines * 1e6))
+
+
+if __name__ == '__main__':
+    main()
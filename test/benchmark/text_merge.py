@@ -0,0 +1,95 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.reader.reader import TextMergePass
+from thothglyph.reader.tglyph import TglyphReader
+from thothglyph.reader.md import MdReader
+from thothglyph.writer import WriterClass
+from thothglyph.node import nd
+from thothglyph.node import logging
+from parse_scaling import generate
+
+# Reads a generated document with and without reader.TextMergePass and
+# compares the number of nodes and the time to read it and write html.
+
+MD_CHUNK = '''\
+# Section {n}
+
+Paragraph {n} with **strong** text, `code`, a [link](https://example.com/{n})
+and a second line (with brackets) [in] the text.
+
+- list item {n} with *emphasis* and plain text
+- list item with ~~strike~~ [^fn{n}]
+
+[^fn{n}]: footnote {n} text.
+
+'''
+
+
+def generate_md(nlines: int) -> str:
+    chunks = list()
+    n = 0
+    while sum([c.count('\n') for c in chunks]) < nlines:
+        chunks.append(MD_CHUNK.format(n=n))
+        n += 1
+    return ''.join(chunks)
+
+
+def count(doc: nd.ASTNode):
+    nodes = texts = 0
+    for n, gofoward in doc.walk_depth():
+        if gofoward:
+            nodes += 1
+            texts += n.__class__ is nd.TextNode
+    return nodes, texts
+
+
+def measure(readercls: type, path: str, outdir: str, repeat: int):
+    # best of repeat runs
+    tread = twrite = float('inf')
+    for i in range(repeat):
+        t = time.perf_counter()
+        doc = readercls().read(path)
+        tread = min(tread, time.perf_counter() - t)
+        writer = WriterClass('html')(config={})
+        t = time.perf_counter()
+        writer.write(os.path.join(outdir, 'out.html'), doc)
+        twrite = min(twrite, time.perf_counter() - t)
+    return count(doc) + (tread, twrite)
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--lines', '-n', type=int, default=20000)
+    argparser.add_argument('--repeat', '-r', type=int, default=3)
+    args = argparser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    sources = {
+        'tglyph': (TglyphReader, generate(args.lines)),
+        'md': (MdReader, generate_md(args.lines)),
+    }
+    print('{:>8} {:>8} {:>10} {:>10} {:>10} {:>10}'.format(
+        'format', 'merge', 'nodes', 'texts', 'read [s]', 'write [s]'))
+    for ext, (readercls, data) in sources.items():
+        nomerge = type(readercls.__name__, (readercls,), {
+            'passes': [p for p in readercls.passes if p is not TextMergePass],
+        })
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'doc.' + ext)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(data)
+            for merge, cls in (('no', nomerge), ('yes', readercls)):
+                nodes, texts, tread, twrite = measure(cls, path, tmpdir, args.repeat)
+                print('{:>8} {:>8} {:>10} {:>10} {:>10.3f} {:>10.3f}'.format(
+                    ext, merge, nodes, texts, tread, twrite))
+
+
+if __name__ == '__main__':
+    main()
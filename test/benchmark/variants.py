@@ -0,0 +1,82 @@
+import sys
+import os
+import argparse
+import tempfile
+import time
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.app import variants as variants_mod
+from thothglyph.reader import doccache
+from thothglyph.reader.tglyph import TglyphReader
+from thothglyph.node import logging
+from parse_scaling import generate
+
+# Reads a document for a matrix of variants, once with a reader per variant
+# (as separate thothglyph runs do) and once with app.variants.read(). The
+# document includes a generated chapter which reads no varying attr; the
+# main document has a condition on the product only.
+
+MAIN = '''\
+⑇⑇⑇
+attrs = {{'product': 'p0', 'region': 'r0'}}
+⑇⑇⑇
+
+▮ Variant
+
+Manual of ⁅product⁆.
+
+⑇if product == 'p1'
+Text for p1.
+⑇end
+
+¤include⸨chapter.tglyph⸩
+
+{body}'''
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('--lines', '-n', type=int, default=5000)
+    argparser.add_argument('--products', '-p', type=int, default=5)
+    argparser.add_argument('--regions', '-r', type=int, default=6)
+    args = argparser.parse_args()
+    logging.getLogger().setLevel(logging.ERROR)
+
+    attrsets = [
+        {'product': 'p{}'.format(p), 'region': 'r{}'.format(r)}
+        for p in range(args.products) for r in range(args.regions)
+    ]
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            with open('main.tglyph', 'w', encoding='utf-8') as f:
+                f.write(MAIN.format(body=generate(args.lines)))
+            with open('chapter.tglyph', 'w', encoding='utf-8') as f:
+                f.write(generate(args.lines))
+
+            t = time.perf_counter()
+            for attrs in attrsets:
+                doccache.documentcache.entries.clear()
+                TglyphReader(config={'attrs': attrs}).read('main.tglyph')
+            separate = time.perf_counter() - t
+
+            doccache.documentcache.entries.clear()
+            variants = [variants_mod.Variant(str(i), attrs) for i, attrs in enumerate(attrsets)]
+            t = time.perf_counter()
+            variants_mod.read('tglyph', 'main.tglyph', {}, variants)
+            shared = time.perf_counter() - t
+            ndocs = len(set([id(v.doc) for v in variants]))
+        finally:
+            os.chdir(cwd)
+
+    print('{:>8} {:>8} {:>8} {:>12} {:>12}'.format(
+        'lines', 'variants', 'docs', 'separate [s]', 'shared [s]'))
+    print('{:>8} {:>8} {:>8} {:>12.3f} {:>12.3f}'.format(
+        args.lines * 2, len(variants), ndocs, separate, shared))
+
+
+if __name__ == '__main__':
+    main()
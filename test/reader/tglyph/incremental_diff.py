@@ -0,0 +1,129 @@
+import sys
+import os
+import argparse
+import glob
+import random
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.node import logging
+from thothglyph.reader.incremental import IncrementalParser, TextEdit
+
+# Applies random line edits with IncrementalParser.update() and compares the
+# document with the one a full IncrementalParser.parse() of the same lines gives.
+
+INSERTS = ['x', ' ', 'ab', '']
+# the values post-processing passes set, which the writers render
+POSTPROCESSED = ('auto_id', '_sectindex', 'src_id', '_fignum', 'fn_num', 'ref_num',
+                 '_description')
+
+
+def dump(node):
+    lines = list()
+    for n, gofoward in node.walk_depth():
+        if not gofoward:
+            lines.append('end')
+            continue
+        values = [str(n)]
+        for key in POSTPROCESSED:
+            if hasattr(n, key):
+                values.append('{}={!r}'.format(key, getattr(n, key)))
+        lines.append(' '.join(values))
+    return lines
+
+
+def full_parse(path, lines):
+    parser = IncrementalParser(path)
+    try:
+        return dump(parser.parse('\n'.join(lines)))
+    except Exception as e:
+        return 'error: {}'.format(type(e).__name__)
+
+
+def random_edit(rng, lines, pool):
+    # replaces up to 3 lines with lines of the document, or types in a line
+    b = rng.randrange(len(lines) + 1)
+    if b < len(lines) and rng.random() < 0.5:
+        line = lines[b]
+        pos = rng.randrange(len(line) + 1)
+        return TextEdit(b, b + 1, [line[:pos] + rng.choice(INSERTS) + line[pos:]])
+    e = min(len(lines), b + rng.choice([0, 0, 1, 1, 1, 2, 3]))
+    new = [rng.choice(pool) for i in range(rng.choice([0, 1, 1, 1, 2]))]
+    return TextEdit(b, e, new)
+
+
+def compare(path, data, nedits, rng):
+    # returns the number of edits whose result differs from a full parse
+    lines = data.split('\n')
+    pool = [line for line in lines if '⑇' not in line] or ['']
+    parser = IncrementalParser(path)
+    parser.parse(data)
+    ndiffs = 0
+    for k in range(nedits):
+        edit = random_edit(rng, lines, pool)
+        lines[edit.begin:edit.end] = edit.lines
+        try:
+            doc, changed = parser.update(edit)
+            new = dump(doc)
+        except Exception as e:
+            new = 'error: {}'.format(type(e).__name__)
+        expected = full_parse(path, lines)
+        if new == expected:
+            continue
+        ndiffs += 1
+        print('DIFFERENT: {} (edit {}: {})'.format(path, k + 1, edit))
+        if isinstance(new, list) and isinstance(expected, list):
+            for a, b in zip(new + ['(none)'], expected + ['(none)']):
+                if a != b:
+                    print('  update: {}\n  parse:  {}'.format(a[:100], b[:100]))
+                    break
+        else:
+            print('  update: {}\n  parse:  {}'.format(str(new)[:80], str(expected)[:80]))
+        # start again from the current lines
+        parser = IncrementalParser(path)
+        try:
+            parser.parse('\n'.join(lines))
+        except Exception:
+            pass
+    return ndiffs
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('paths', nargs='*', help='tglyph files (default: test corpus)')
+    argparser.add_argument('--edits', '-n', type=int, default=100, help='edits per file')
+    argparser.add_argument('--seed', '-s', type=int, default=0)
+    args = argparser.parse_args()
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    paths = args.paths or sorted(glob.glob(os.path.join(rootdir, 'test', '**', '*.tglyph'),
+                                           recursive=True))
+    rng = random.Random(args.seed)
+    cwd = os.getcwd()
+    nfiles = 0
+    ndiffs = 0
+    for path in paths:
+        path = os.path.abspath(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = f.read()
+        # includes are relative to the document
+        os.chdir(os.path.dirname(path))
+        try:
+            IncrementalParser(path).parse(data)
+        except Exception:  # e.g. error test cases
+            os.chdir(cwd)
+            continue
+        try:
+            ndiffs += compare(os.path.basename(path), data, args.edits, rng)
+        finally:
+            os.chdir(cwd)
+        nfiles += 1
+
+    print('files: {}, edits: {}, different: {}'.format(nfiles, nfiles * args.edits, ndiffs))
+    print('OK' if ndiffs == 0 else 'DIFFERENT')
+    return 0 if ndiffs == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
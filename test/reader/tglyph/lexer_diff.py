@@ -0,0 +1,154 @@
+import sys
+import os
+import argparse
+import glob
+import re
+import time
+if True:
+    selfdir = os.path.dirname(__file__)
+    rootdir = os.path.join(selfdir, '..', '..', '..')
+    sys.path.insert(0, rootdir)
+from thothglyph.error import ThothglyphError
+from thothglyph.reader.tglyph import Lexer, TglyphReader
+
+# Compares Lexer.lex_pattern() with the lexer it replaced over the test corpus.
+
+
+class NoProgress(Exception):
+    pass
+
+
+def legacy_lex_pattern(patterns, data, begin=0):
+    # The former Lexer.lex_pattern(), which restarts from the first pattern
+    # after every match. It never terminates on text no pattern can consume,
+    # so give up after a number of rounds.
+    tokens = list()
+    if isinstance(data, str):
+        lines_ite = enumerate(data.split(Lexer.newline_token))
+    else:
+        lines_ite = data
+    for lineno, line in lines_ite:
+        rests = [(0, line)]
+        linetokens = list()
+        rounds = 0
+        while rests:
+            rounds += 1
+            if rounds > 10000:
+                raise NoProgress(lineno, line)
+            for key, pattern in patterns.items():
+                newrests = list()
+                matched = False
+                for rest in rests:
+                    bpos, text = rest
+                    m = pattern.search(text)
+                    if m:
+                        matched = True
+                        lno = lineno + begin
+                        pos = bpos + m.start()
+                        linetokens.append(Lexer.Token(-1, lno, pos, key, m.group(0)))
+                        subtexts = text[:m.start()], text[m.end():]
+                        if len(subtexts[0]) > 0:
+                            newrests.append((bpos, subtexts[0]))
+                        if len(subtexts[1]) > 0:
+                            newrests.append((bpos + m.end(), subtexts[1]))
+                    else:
+                        newrests.append((bpos, text))
+                rests = newrests
+                if matched:
+                    break
+        linetokens.sort(key=lambda t: t.pos)
+        for i, token in enumerate(linetokens):
+            token.no = len(tokens) + i
+        tokens.extend(linetokens)
+    return tokens
+
+
+def compiled(tokens):
+    return {k: re.compile(v) for k, v in tokens.items()}
+
+
+def astuples(tokens):
+    return [(t.no, t.line, t.pos, t.key, t.value) for t in tokens]
+
+
+def compare(name, lexfunc, patterns, data, timings):
+    t = time.perf_counter()
+    try:
+        legacy = astuples(legacy_lex_pattern(patterns, data))
+    except NoProgress:
+        legacy = 'error'
+    timings[0] += time.perf_counter() - t
+    t = time.perf_counter()
+    try:
+        new = astuples(lexfunc(data))
+    except ThothglyphError:
+        new = 'error'
+    timings[1] += time.perf_counter() - t
+    if legacy != new:
+        print('DIFFERENT: {}'.format(name))
+        if isinstance(legacy, list) and isinstance(new, list):
+            for a, b in zip(legacy, new):
+                if a != b:
+                    print('  legacy: {}\n  new:    {}'.format(a, b))
+                    break
+        else:
+            print('  legacy: {}\n  new:    {}'.format(str(legacy)[:80], str(new)[:80]))
+        return False
+    return True
+
+
+def main():
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('paths', nargs='*', help='tglyph files (default: test corpus)')
+    args = argparser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join(rootdir, 'test', '**', '*.tglyph'),
+                                           recursive=True))
+    lexer = Lexer()
+    deco_tokens = {'DECO_END': Lexer.inline_tokens['DECO_END']}
+    deco_tokens = deco_tokens | Lexer.inline_color_deco_tokens | Lexer.inline_deco_tokens
+    tables = {
+        'preproc': (lexer.lex_preproc, compiled(Lexer.preproc_tokens)),
+        'inline': (lexer.lex_inline, compiled(Lexer.inline_tokens)),
+        'deco': (lexer.lex_inline_deco, compiled(deco_tokens)),
+    }
+    timings = [0.0, 0.0]
+    ok = True
+    ncases = 0
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = f.read()
+        relpath = os.path.relpath(path, rootdir)
+        for name, (lexfunc, patterns) in tables.items():
+            if name == 'preproc':
+                ok &= compare(f'{relpath} ({name})', lexfunc, patterns, data, timings)
+                ncases += 1
+                continue
+            for lineno, line in enumerate(data.split('\n')):
+                ncases += 1
+                ok &= compare(f'{relpath}:{lineno + 1} ({name})',
+                              lambda d: lexfunc(d, begin=0), patterns, line, timings)
+        # block tokens over the preprocessed lines, as the parser lexes them
+        reader = TglyphReader()
+        reader.path = path
+        cwd = os.getcwd()
+        os.chdir(os.path.dirname(path))
+        try:
+            pplines = reader.parser.preprocess(data)
+        except Exception:  # e.g. error test cases
+            pplines = [(i, line) for i, line in enumerate(data.split('\n'))]
+        finally:
+            os.chdir(cwd)
+        ncases += 1
+        ok &= compare(f'{relpath} (block)', lexer.lex_block,
+                      compiled(Lexer.block_tokens), pplines, timings)
+
+    print('files: {}, cases: {}'.format(len(paths), ncases))
+    print('legacy lexer: {:8.1f} ms'.format(timings[0] * 1000))
+    print('lexer       : {:8.1f} ms'.format(timings[1] * 1000))
+    print('OK' if ok else 'DIFFERENT')
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
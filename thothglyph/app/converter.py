@@ -5,6 +5,7 @@ from thothglyph.error import ThothglyphError
 from thothglyph.reader import ReaderClass
 from thothglyph.writer import WriterClass
 from thothglyph.node.nd import nodeprint
+from thothglyph.app import variants as variants_mod
 from thothglyph import __version__
 
 from thothglyph.node import logging
@@ -16,6 +17,10 @@ logger.setLevel(logging.INFO)
 
 
 def main():
+    if sys.argv[1:2] == ['lsp']:
+        from thothglyph.app import lsp
+        return lsp.main(sys.argv[2:])
+
     argparser = argparse.ArgumentParser(
         prog=NAMESPACE,
     )
@@ -38,6 +43,15 @@ def main():
     argparser.add_argument(
         '--from', '-f', metavar='TYPE', default=None,
         help='input file type')
+    argparser.add_argument(
+        '--cache-dir', metavar='DIR', default=None,
+        help='directory to cache parsed include files in')
+    argparser.add_argument(
+        '--variants', metavar='FILE', default=None,
+        help='YAML file of attr sets to write the document for, one output each')
+    argparser.add_argument(
+        '--jobs', '-j', metavar='N', type=int, default=None,
+        help='number of variants to write in parallel (default: number of CPUs)')
     argparser.add_argument(
         'input',
         help='input file')
@@ -71,14 +85,24 @@ def main():
     else:
         output_absfpath = os.path.abspath(args.output)
 
+    variants_fpath = os.path.abspath(args.variants) if args.variants else None
+
     config = dict()
     if args.template:
         config['templatedir'] = os.path.abspath(args.template)
     if args.theme:
         config['theme'] = args.theme
+    if args.cache_dir:
+        config['cachedir'] = os.path.abspath(args.cache_dir)
 
     os.chdir(input_dirname)
     try:
+        if variants_fpath:
+            variants = variants_mod.load_matrix(variants_fpath)
+            variants_mod.read(input_type, input_fname, config, variants)
+            variants_mod.write(
+                output_type, config, input_absfpath, output_absfpath, variants, args.jobs)
+            return
         reader = ReaderClass(input_type)(config=config)
         node = reader.read(input_fname)
         nodeprint(node)
@@ -0,0 +1,410 @@
+from __future__ import annotations
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+import sys
+import os
+import re
+import json
+import argparse
+import contextlib
+import pathlib
+import urllib.parse
+import urllib.request
+from thothglyph.error import ThothglyphError
+from thothglyph.node import nd
+from thothglyph.reader.incremental import IncrementalParser, TextEdit
+from thothglyph.reader.tglyph import grammar
+from thothglyph import __version__
+
+from thothglyph.node import logging
+
+NAMESPACE = 'thothglyph'
+
+logger = logging.getLogger()
+
+# The language server of tglyph documents, speaking LSP (JSON-RPC with
+# Content-Length headers) over stdin and stdout. Open documents are kept
+# parsed in memory and updated incrementally by IncrementalParser.
+
+SEVERITY_ERROR = 1
+SYMBOL_KIND_STRING = 15  # as used for markdown headings
+TEXT_DOCUMENT_SYNC_INCREMENTAL = 2
+LANGUAGE_IDS = ('tglyph', NAMESPACE)
+METHOD_NOT_FOUND = -32601
+INTERNAL_ERROR = -32603
+
+ERROR_LOCATION = re.compile(r'^(.+?):(\d+): (.*)$', re.DOTALL)
+
+
+def uri_to_path(uri: str) -> str:
+    parsed = urllib.parse.urlparse(uri)
+    return urllib.request.url2pathname(urllib.parse.unquote(parsed.path))
+
+
+def path_to_uri(path: str) -> str:
+    return pathlib.Path(os.path.abspath(path)).as_uri()
+
+
+def is_tglyph(uri: str, language_id: Optional[str]) -> bool:
+    # Only tglyph sources are parsed; other documents opened in the editor
+    # (e.g. markdown) are left alone instead of getting tglyph diagnostics.
+    if language_id in LANGUAGE_IDS:
+        return True
+    return os.path.splitext(uri_to_path(uri))[1] == '.tglyph'
+
+
+@contextlib.contextmanager
+def workdir(path: str) -> Iterator[None]:
+    # include paths are relative to the working directory, as in the converter
+    cwd = os.getcwd()
+    os.chdir(os.path.dirname(os.path.abspath(path)))
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+class Document():
+    def __init__(self, uri: str, text: str):
+        self.uri: str = uri
+        self.path: str = os.path.abspath(uri_to_path(uri))
+        self.parser: IncrementalParser = IncrementalParser(self.path)
+        self.error: Optional[Exception] = None
+        with workdir(self.path):
+            self._run(lambda: self.parser.parse(text))
+
+    @property
+    def lines(self) -> List[str]:
+        return self.parser.lines
+
+    @property
+    def rootnode(self) -> Optional[nd.DocumentNode]:
+        return self.parser.rootnode
+
+    def change(self, span: Optional[Tuple[int, int, int, int]], text: str) -> None:
+        # replaces the text between (line, index) span[:2] and span[2:],
+        # or the whole text if span is None
+        with workdir(self.path):
+            if span is None:
+                self._run(lambda: self.parser.parse(text))
+                return
+            sline, scol, eline, ecol = span
+            edit = TextEdit.from_range(self.lines, (sline, scol), (eline, ecol), text)
+            self._run(lambda: self.parser.update(edit))
+
+    def _run(self, func: Callable[[], Any]) -> None:
+        try:
+            func()
+            self.error = None
+        except Exception as e:
+            # the error of an intermediate edit is replaced by the next one
+            self.error = e
+
+
+class LanguageServer():
+    def __init__(self, rfile: BinaryIO, wfile: BinaryIO):
+        self.rfile: BinaryIO = rfile
+        self.wfile: BinaryIO = wfile
+        self.documents: Dict[str, Document] = dict()
+        self.encoding: str = 'utf-16'  # of positions, see _index()
+        self.shutdown: bool = False
+        self.requests: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+            'initialize': self.initialize,
+            'shutdown': self.on_shutdown,
+            'textDocument/documentSymbol': self.document_symbol,
+            'textDocument/definition': self.definition,
+        }
+        self.notifications: Dict[str, Callable[[Dict[str, Any]], None]] = {
+            'initialized': lambda params: None,
+            'textDocument/didOpen': self.did_open,
+            'textDocument/didChange': self.did_change,
+            'textDocument/didClose': self.did_close,
+        }
+
+    def serve(self) -> int:
+        while True:
+            message = self.read_message()
+            if message is None:
+                return 1
+            method = message.get('method')
+            params = message.get('params') or dict()
+            if method == 'exit':
+                return 0 if self.shutdown else 1
+            if 'id' not in message:
+                if method in self.notifications:
+                    try:
+                        self.notifications[method](params)
+                    except Exception as e:
+                        logger.exception(e)
+                continue
+            if method not in self.requests:
+                msg = 'Unknown method: {}'.format(method)
+                self.send_error(message['id'], METHOD_NOT_FOUND, msg)
+                continue
+            try:
+                result = self.requests[method](params)
+            except Exception as e:
+                logger.exception(e)
+                self.send_error(message['id'], INTERNAL_ERROR, str(e))
+                continue
+            self.send({'jsonrpc': '2.0', 'id': message['id'], 'result': result})
+
+    def read_message(self) -> Optional[Dict[str, Any]]:
+        length = -1
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return None
+            line = line.strip()
+            if not line:
+                break
+            name, _, value = line.decode('ascii').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        if length < 0:
+            return None
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def send(self, message: Dict[str, Any]) -> None:
+        body = json.dumps(message, ensure_ascii=False).encode('utf-8')
+        self.wfile.write('Content-Length: {}\r\n\r\n'.format(len(body)).encode('ascii'))
+        self.wfile.write(body)
+        self.wfile.flush()
+
+    def send_error(self, id: Any, code: int, message: str) -> None:
+        error = {'code': code, 'message': message}
+        self.send({'jsonrpc': '2.0', 'id': id, 'error': error})
+
+    def notify(self, method: str, params: Dict[str, Any]) -> None:
+        self.send({'jsonrpc': '2.0', 'method': method, 'params': params})
+
+    # requests
+
+    def initialize(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        general = (params.get('capabilities') or dict()).get('general') or dict()
+        if 'utf-32' in (general.get('positionEncodings') or list()):
+            self.encoding = 'utf-32'
+        return {
+            'capabilities': {
+                'positionEncoding': self.encoding,
+                'textDocumentSync': {
+                    'openClose': True,
+                    'change': TEXT_DOCUMENT_SYNC_INCREMENTAL,
+                },
+                'documentSymbolProvider': True,
+                'definitionProvider': True,
+            },
+            'serverInfo': {'name': NAMESPACE, 'version': __version__},
+        }
+
+    def on_shutdown(self, params: Dict[str, Any]) -> None:
+        self.shutdown = True
+        return None
+
+    def document_symbol(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        doc = self.documents.get(params['textDocument']['uri'])
+        if doc is None or doc.rootnode is None:
+            return list()
+        symbols: List[Dict[str, Any]] = list()
+        opened: List[Dict[str, Any]] = [{'children': symbols}]
+        unclosed: List[Dict[str, Any]] = list()  # left sections, ending at the next one
+        walker = doc.rootnode.walk_depth()
+        for n, gofoward in walker:
+            if not isinstance(n, nd.SectionNode):
+                continue
+            if n.srcpath != doc.path or n.srctoken is None:
+                if gofoward:
+                    walker.skip()  # an included document
+                continue
+            if gofoward:
+                line = n.srctoken.line
+                for symbol in unclosed:
+                    symbol['range']['end'] = {'line': line, 'character': 0}
+                unclosed.clear()
+                symbol = {
+                    'name': n.title.strip() or n.id or '(untitled)',
+                    'kind': SYMBOL_KIND_STRING,
+                    'range': self._line_range(doc, line),
+                    'selectionRange': self._line_range(doc, line),
+                    'children': list(),
+                }
+                if n.id:
+                    symbol['detail'] = n.id
+                opened[-1]['children'].append(symbol)
+                opened.append(symbol)
+            else:
+                unclosed.append(opened.pop())
+        for symbol in unclosed:
+            symbol['range']['end'] = {'line': len(doc.lines), 'character': 0}
+        return symbols
+
+    def definition(self, params: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        doc = self.documents.get(params['textDocument']['uri'])
+        if doc is None or doc.rootnode is None:
+            return None
+        line = params['position']['line']
+        if line >= len(doc.lines):
+            return None
+        text = doc.lines[line]
+        index = self._index(text, params['position']['character'])
+        targets: List[nd.ASTNode] = list()
+        for key, group in (('LINK', 2), ('EMOJI_LINK', 3), ('FOOTNOTE', 1), ('REFERENCE', 1)):
+            for m in grammar.inline_tokens[key].finditer(text):
+                if m.start() <= index < m.end():
+                    targets = self._targets(doc, line, key, m.group(group))
+                    break
+            if targets:
+                break
+        locations: List[Dict[str, Any]] = list()
+        for target in targets:
+            token = getattr(target, 'srctoken', None)
+            if token is None:
+                continue
+            srcpath = getattr(target, 'srcpath', None) or self._srcpath(target, doc)
+            location = {'line': token.line, 'character': 0}
+            locations.append({
+                'uri': path_to_uri(srcpath),
+                'range': {'start': location, 'end': location},
+            })
+        return locations or None
+
+    def _targets(self, doc: Document, line: int, key: str, value: str) -> List[nd.ASTNode]:
+        root = doc.rootnode
+        reader = doc.parser.reader
+        assert root is not None and reader is not None
+        if key in ('LINK', 'EMOJI_LINK'):
+            value = reader.parser.replace_text_attrs(value)
+            for link in root.nodes_of(nd.LinkNode):
+                if link.value == value and link.srcpath == doc.path:
+                    with workdir(doc.path):
+                        sect = link.target_section
+                    return [sect] if sect is not None else list()
+            return list()
+        if key == 'FOOTNOTE':
+            # footnotes are numbered per top-level child, see FootnoteNumPass
+            for top in doc.parser.nodes_at(line):
+                for n, gofoward in top.walk_depth():
+                    if gofoward and isinstance(n, nd.FootnoteNode) and n.value == value:
+                        if n._description is not None:
+                            return [n._description]
+            listcls: type = nd.FootnoteListBlockNode
+        else:
+            listcls = nd.ReferenceListBlockNode
+        items: List[nd.ASTNode] = [
+            n for n in root.nodes_of(nd.ListItemNode)
+            if isinstance(n.parent, listcls) and n.title == value
+        ]
+        return items
+
+    def _srcpath(self, node: nd.ASTNode, doc: Document) -> str:
+        # the document a list item was read from
+        n: Optional[nd.ASTNode] = node
+        while n is not None:
+            if isinstance(n, nd.SectionNode):
+                return n.srcpath
+            n = n.parent
+        return doc.path
+
+    # notifications
+
+    def did_open(self, params: Dict[str, Any]) -> None:
+        item = params['textDocument']
+        if not is_tglyph(item['uri'], item.get('languageId')):
+            return
+        doc = Document(item['uri'], item['text'])
+        self.documents[item['uri']] = doc
+        self.publish_diagnostics(doc)
+
+    def did_change(self, params: Dict[str, Any]) -> None:
+        doc = self.documents.get(params['textDocument']['uri'])
+        if doc is None:
+            return
+        for change in params['contentChanges']:
+            # positions refer to the text after the previous change
+            span: Optional[Tuple[int, int, int, int]] = None
+            if 'range' in change:
+                start, end = change['range']['start'], change['range']['end']
+                span = (start['line'], self._line_index(doc, start['line'], start['character']),
+                        end['line'], self._line_index(doc, end['line'], end['character']))
+            doc.change(span, change['text'])
+        self.publish_diagnostics(doc)
+
+    def did_close(self, params: Dict[str, Any]) -> None:
+        uri = params['textDocument']['uri']
+        self.documents.pop(uri, None)
+        self.notify('textDocument/publishDiagnostics', {'uri': uri, 'diagnostics': []})
+
+    def publish_diagnostics(self, doc: Document) -> None:
+        diagnostics: List[Dict[str, Any]] = list()
+        if doc.error is not None:
+            diagnostics.append(self._diagnostic(doc, doc.error))
+        self.notify('textDocument/publishDiagnostics', {
+            'uri': doc.uri,
+            'diagnostics': diagnostics,
+        })
+
+    def _diagnostic(self, doc: Document, error: Exception) -> Dict[str, Any]:
+        # ThothglyphError messages begin with 'path:line: ' of the source;
+        # errors of included documents are shown on the first line
+        message = str(error) if isinstance(error, ThothglyphError) else repr(error)
+        line = 0
+        m = ERROR_LOCATION.match(message)
+        if m:
+            with workdir(doc.path):
+                errpath = os.path.abspath(m.group(1))
+            if errpath == doc.path:
+                line = min(int(m.group(2)) - 1, max(len(doc.lines) - 1, 0))
+                message = m.group(3)
+        return {
+            'range': self._line_range(doc, line),
+            'severity': SEVERITY_ERROR,
+            'source': NAMESPACE,
+            'message': message,
+        }
+
+    # positions
+
+    def _line_range(self, doc: Document, line: int) -> Dict[str, Any]:
+        text = doc.lines[line] if 0 <= line < len(doc.lines) else ''
+        return {
+            'start': {'line': line, 'character': 0},
+            'end': {'line': line, 'character': self._character(text, len(text))},
+        }
+
+    def _line_index(self, doc: Document, line: int, character: int) -> int:
+        text = doc.lines[line] if line < len(doc.lines) else ''
+        return self._index(text, character)
+
+    def _index(self, text: str, character: int) -> int:
+        # string index of a position character (UTF-16 code units by default)
+        if self.encoding == 'utf-32':
+            return min(character, len(text))
+        units = 0
+        for i, c in enumerate(text):
+            if units >= character:
+                return i
+            units += 2 if ord(c) > 0xFFFF else 1
+        return len(text)
+
+    def _character(self, text: str, index: int) -> int:
+        if self.encoding == 'utf-32':
+            return index
+        return index + len([c for c in text[:index] if ord(c) > 0xFFFF])
+
+
+def main(argv: Optional[List[str]] = None):
+    argparser = argparse.ArgumentParser(
+        prog='{} lsp'.format(NAMESPACE),
+        description='language server of tglyph documents',
+    )
+    argparser.add_argument(
+        '--stdio', action='store_true',
+        help='communicate over stdin and stdout (default)')
+    argparser.parse_args(argv)
+    # stdout carries the protocol; logs go to stderr
+    logger.setLevel(logging.WARNING)
+    server = LanguageServer(sys.stdin.buffer, sys.stdout.buffer)
+    return server.serve()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Set, Tuple
+import os
+import re
+import copy
+import itertools
+import multiprocessing
+import yaml
+from thothglyph.error import ThothglyphError
+from thothglyph.node import nd
+from thothglyph.node.nd import nodeprint
+from thothglyph.reader import ReaderClass
+from thothglyph.reader.tglyph import grammar
+from thothglyph.writer import WriterClass
+
+from thothglyph.node import logging
+
+logger = logging.getLogger(__file__)
+
+# Variant builds: one source document written for several attr sets, e.g.
+# per product and region. The attrs of a variant are fixed for the build,
+# config blocks do not override them (see nd.ConfigNode.fix_attrs()).
+
+_MISSING = '<missing>'
+
+
+class Variant():
+    def __init__(self, name: str, attrs: Dict[str, Any]):
+        self.name: str = name
+        self.attrs: Dict[str, Any] = attrs
+        self.doc: Optional[nd.DocumentNode] = None
+        self.users: int = 0  # variants written from doc, this one included
+
+
+def load_matrix(path: str) -> List[Variant]:
+    # A YAML (or JSON) file with a list of attr sets,
+    #   - {product: a, region: eu}
+    #   - {product: b, region: us}
+    # or with values per attr, of which every combination is built,
+    #   product: [a, b]
+    #   region: [eu, us]
+    # Variants are named by their values, e.g. a-eu.
+    with open(path, 'r', encoding='utf-8') as f:
+        matrix = yaml.safe_load(f)
+    if isinstance(matrix, dict):
+        names = list(matrix.keys())
+        values = [v if isinstance(v, list) else [v] for v in matrix.values()]
+        attrsets = [dict(zip(names, combination)) for combination in itertools.product(*values)]
+    elif isinstance(matrix, list) and matrix and all([isinstance(a, dict) for a in matrix]):
+        attrsets = matrix
+    else:
+        msg = 'Variants must be a list of attr sets or a mapping of attrs to values.'
+        raise ThothglyphError(f'{path}: {msg}')
+    variants: List[Variant] = list()
+    names_seen: Set[str] = set()
+    for attrs in attrsets:
+        name = re.sub(r'[^\w.\-]+', '_', '-'.join([str(v) for v in attrs.values()]))
+        if name in names_seen:
+            raise ThothglyphError(f'{path}: duplicated variant "{name}".')
+        names_seen.add(name)
+        variants.append(Variant(name, attrs))
+    return variants
+
+
+def read(input_type: str, path: str, config: Dict[str, Any], variants: List[Variant]) -> None:
+    # Reads the document for every variant. Lines are lexed once for all of
+    # them, included documents which read none of the varying attrs are
+    # shared through the document cache, and a variant whose values of the
+    # attrs an earlier document read are the same shares that document.
+    varying: Set[str] = set()
+    for variant in variants:
+        varying |= set(variant.attrs)
+    docs: List[Tuple[Dict[str, Any], nd.DocumentNode, List[Variant]]] = list()
+    with grammar.shared_lines():
+        for variant in variants:
+            for values, doc, users in docs:
+                if all([variant.attrs.get(k, _MISSING) == v for k, v in values.items()]):
+                    logger.info('variant {}: same document as {}'.format(
+                        variant.name, users[0].name))
+                    break
+            else:
+                logger.info('variant {}: read document'.format(variant.name))
+                reader = ReaderClass(input_type)(config=dict(config, attrs=variant.attrs))
+                doc = reader.read(path)
+                nodeprint(doc)
+                names = reader.attrnames & varying
+                values = dict([(k, variant.attrs.get(k, _MISSING)) for k in names])
+                users = list()
+                docs.append((values, doc, users))
+            variant.doc = doc
+            users.append(variant)
+    for values, doc, users in docs:
+        for variant in users:
+            variant.users = len(users)
+
+
+def output_path(output_type: str, config: Dict[str, Any], inpath: str, outpath: Optional[str],
+                variant: Variant) -> str:
+    writer = WriterClass(output_type)(config=config)
+    odir, ofbname, ofext = writer.make_output_fpath(inpath, outpath, variant.doc)
+    return os.path.join(odir, '{}-{}.{}'.format(ofbname, variant.name, ofext))
+
+
+def _write(output_type: str, config: Dict[str, Any], fpath: str, variant: Variant,
+           copied: bool) -> None:
+    # writers change the document they write, e.g. table widths
+    doc = copy.deepcopy(variant.doc) if copied else variant.doc
+    writer = WriterClass(output_type)(config=config)
+    writer.write(fpath, doc)
+
+
+_job: Optional[Tuple[str, Dict[str, Any], List[str], List[Variant]]] = None  # for the workers
+
+
+def _write_job(index: int) -> None:
+    assert _job is not None
+    output_type, config, fpaths, variants = _job
+    variant = variants[index]
+    _write(output_type, config, fpaths[index], variant, variant.users > 1)
+
+
+def write(output_type: str, config: Dict[str, Any], inpath: str, outpath: Optional[str],
+          variants: List[Variant], jobs: Optional[int] = None) -> List[str]:
+    # Writes every variant, in forked worker processes where possible. Each
+    # worker has its own copy of the documents read before the fork.
+    global _job
+    fpaths = [output_path(output_type, config, inpath, outpath, v) for v in variants]
+    jobs = min(jobs or os.cpu_count() or 1, len(variants))
+    if jobs > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        _job = (output_type, config, fpaths, variants)
+        try:
+            with multiprocessing.get_context('fork').Pool(jobs) as pool:
+                pool.map(_write_job, range(len(variants)), chunksize=1)
+        finally:
+            _job = None
+    else:
+        remaining = dict([(id(v.doc), v.users) for v in variants])
+        for fpath, variant in zip(fpaths, variants):
+            remaining[id(variant.doc)] -= 1
+            # the last variant of a shared document writes the original
+            _write(output_type, config, fpath, variant, remaining[id(variant.doc)] > 0)
+    return fpaths
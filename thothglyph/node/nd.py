@@ -1,5 +1,10 @@
 from __future__ import annotations
-from typing import Any, Callable, Dict, Generator, Iterator, List, Optional, Tuple
+from typing import Any, Callable, Dict, FrozenSet, Generator, Iterator, List, Optional, Set, Tuple
+from typing import Type, TypeVar
+from types import CodeType
+import copy
+import dis
+import hashlib
 import os
 import pathlib
 import re
@@ -10,14 +15,51 @@ from thothglyph.node import logging
 
 logger = logging.getLogger(__file__)
 
+T = TypeVar('T', bound='ASTNode')
+
+
+class TreeWalker():
+    # Explicit-stack pre/post-order walk: yields (node, True) on entering a
+    # node and (node, False) on leaving it. skip() right after entering a
+    # node prunes its children (the node is still left).
+
+    def __init__(self, node: ASTNode):
+        self._stack: List[Tuple[ASTNode, bool]] = [(node, True)]
+        self._entered: Optional[ASTNode] = None
+        self._skip: bool = False
+
+    def __iter__(self) -> TreeWalker:
+        return self
+
+    def __next__(self) -> Tuple[ASTNode, bool]:
+        stack = self._stack
+        entered = self._entered
+        if entered is not None:
+            if not self._skip:
+                stack.extend([(c, True) for c in reversed(entered.children)])
+            self._entered = None
+            self._skip = False
+        if not stack:
+            raise StopIteration
+        node, gofoward = stack.pop()
+        if gofoward:
+            stack.append((node, False))
+            self._entered = node
+        return node, gofoward
+
+    def skip(self) -> None:
+        self._skip = True
+
 
 class ASTNode():
+    __slots__ = ('parent', 'children', 'id', '_index')
     attrkey: Tuple[str, ...] = tuple()
 
     def __init__(self):
         self.parent: Optional[ASTNode] = None
         self.children: List[ASTNode] = list()
         self.id: str = str()
+        self._index: int = -1  # cached position in parent.children
 
     def __str__(self):
         cls: str = self.__class__.__name__
@@ -42,32 +84,39 @@ class ASTNode():
 
     def add(self, node):
         node.parent = self
+        node._index = len(self.children)
         self.children.append(node)
+        self._modified()
 
     def remove(self, node):
         node.parent = None
+        node._index = -1
         self.children.remove(node)
+        self._modified()
+        # the following siblings are re-indexed lazily by _sibling_index()
+
+    def splice(self, begin: int, end: int, nodes: List[ASTNode]) -> None:
+        # replaces children[begin:end] with nodes
+        for node in self.children[begin:end]:
+            node.parent = None
+            node._index = -1
+        for node in nodes:
+            node.parent = self
+        self.children[begin:end] = nodes
+        self._modified()
+        # the moved children are re-indexed lazily by _sibling_index()
+
+    def _modified(self) -> None:
+        # drops the cached nodes of the document this node is in (walking up
+        # to it, O(depth)), see DocumentNode.nodes_of()
+        node: ASTNode = self
+        while node.parent is not None:
+            node = node.parent
+        if isinstance(node, DocumentNode):
+            node._modcount += 1
 
-    def walk_depth(self) -> Generator[Tuple[ASTNode, bool], None, None]:
-        def _walk(node: ASTNode, visited: List[ASTNode]):
-            visited += [node]
-            yield node, True  # go foward
-            for child in node.children:
-                if child not in visited:
-                    for _ in _walk(child, visited): yield _  # noqa
-            yield node, False  # go back
-
-        yield self, True  # go foward
-        if len(self.children) > 0:
-            rest: List[ASTNode] = self.children[:]
-            visited: List[ASTNode] = []
-            while len(rest) > 0:
-                first = rest[0]
-                for _ in _walk(first, visited): yield _  # noqa
-                for n in visited:
-                    if n in rest:
-                        rest.remove(n)
-        yield self, False  # go back
+    def walk_depth(self) -> TreeWalker:
+        return TreeWalker(self)
 
     def lastnode(self, cond: Optional[Callable[[ASTNode], bool]] = None) -> Optional[ASTNode]:
         def default_cond(n: ASTNode):
@@ -98,16 +147,83 @@ class ASTNode():
             return node
         return None
 
+    def _sibling_index(self) -> int:
+        # The cached index is verified against parent.children, so it stays
+        # correct even if the children list is edited without add/remove.
+        assert self.parent is not None
+        siblings = self.parent.children
+        i = self._index
+        if 0 <= i < len(siblings) and siblings[i] is self:
+            return i
+        for j, sibling in enumerate(siblings):
+            sibling._index = j
+        i = self._index
+        if 0 <= i < len(siblings) and siblings[i] is self:
+            return i
+        return siblings.index(self)
+
     def treeindex(self) -> List[int]:
-        if self.parent is None:
-            return [0]
-        return self.parent.treeindex() + [self.parent.children.index(self)]
+        index: List[int] = list()
+        node: ASTNode = self
+        while node.parent is not None:
+            index.append(node._sibling_index())
+            node = node.parent
+        index.append(0)
+        index.reverse()
+        return index
 
     def treeid(self) -> str:
         return '-'.join([str(i) for i in self.treeindex()])
 
 
+class PathCache():
+    # Memoizes the filesystem lookups behind src_relpath and link targets.
+    # One cache is shared by a document and all of its included documents.
+
+    def __init__(self):
+        self._abspaths: Dict[str, str] = dict()
+        self._resolved: Dict[str, pathlib.Path] = dict()
+        self._relpaths: Dict[Tuple[str, str], str] = dict()
+        self.hits: int = 0
+        self.misses: int = 0  # number of abspath()/resolve() calls made
+
+    def abspath(self, path: str) -> str:
+        abspath = self._abspaths.get(path)
+        if abspath is None:
+            self.misses += 1
+            abspath = os.path.abspath(path)
+            self._abspaths[path] = abspath
+        else:
+            self.hits += 1
+        return abspath
+
+    def resolve(self, path: str) -> pathlib.Path:
+        resolved = self._resolved.get(path)
+        if resolved is None:
+            self.misses += 1
+            resolved = pathlib.Path(path).resolve()
+            self._resolved[path] = resolved
+        else:
+            self.hits += 1
+        return resolved
+
+    def relpath(self, path: str, rootpath: str) -> str:
+        key = (path, rootpath)
+        relpath = self._relpaths.get(key)
+        if relpath is None:
+            root_dir = os.path.dirname(self.abspath(rootpath))
+            relpath = str(self.resolve(path).relative_to(root_dir))
+            self._relpaths[key] = relpath
+        else:
+            self.hits += 1
+        return relpath
+
+
 class DocumentNode(ASTNode):
+    __slots__ = (
+        'level', 'srcpath', 'config', 'sectiontable', 'pathcache',
+        '_modcount', '_registry', '_registry_modcount',
+    )
     attrkey = ('config', )
 
     def __init__(self):
@@ -115,62 +231,198 @@ class DocumentNode(ASTNode):
         self.level: int = 0
         self.srcpath: str = str()
         self.config: ConfigNode = ConfigNode()
+        self.sectiontable: Optional[SectionTable] = None  # set by reader.LinkTargetPass
+        self.pathcache: PathCache = PathCache()
+        self._modcount: int = 0  # incremented by add/remove/splice in this document
+        self._registry: Dict[type, List[Any]] = dict()  # of ASTNode
+        self._registry_modcount: int = -1
+
+    def nodes_of(self, cls: Type[T]) -> List[T]:
+        # Returns the nodes of cls (and its subclasses) in document order.
+        # This is a cache, not an index kept up to date: the nodes of all
+        # classes are collected by one walk on the first call after the
+        # document is modified, and reused by the calls until the next change.
+        if self._registry_modcount != self._modcount:
+            registry: Dict[type, List[Any]] = dict()
+            mros: Dict[type, Tuple[type, ...]] = dict()
+            for n, gofoward in self.walk_depth():
+                if not gofoward:
+                    continue
+                ncls = n.__class__
+                if ncls not in mros:
+                    mros[ncls] = tuple(c for c in ncls.__mro__ if issubclass(c, ASTNode))
+                for c in mros[ncls]:
+                    registry.setdefault(c, list()).append(n)
+            self._registry = registry
+            self._registry_modcount = self._modcount
+        return list(self._registry.get(cls, ()))
+
+
+class ConfigCache():
+    # Config sources compiled once per content hash and shared by all
+    # documents of the process. The parameters of YAML configs, and of Python
+    # configs which look up no outside names (no cmd(), import, self, ...),
+    # depend on the text only and are kept as well; others run per document.
+    pure_builtins: FrozenSet[str] = frozenset([
+        'abs', 'all', 'any', 'bool', 'dict', 'enumerate', 'filter', 'float', 'frozenset',
+        'int', 'len', 'list', 'map', 'max', 'min', 'range', 'reversed', 'round', 'set',
+        'sorted', 'str', 'sum', 'tuple', 'zip',
+    ])
+
+    def __init__(self):
+        self._codes: Dict[str, CodeType] = dict()
+        self._pure: Dict[str, bool] = dict()
+        self._params: Dict[Tuple[str, str], Dict[str, Any]] = dict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def params(self, text: str, lang: str, node: ConfigNode) -> Dict[str, Any]:
+        key = (lang, hashlib.sha256(text.encode('utf-8')).hexdigest())
+        params = self._params.get(key)
+        if params is not None:
+            self.hits += 1
+            # the documents may change the values, e.g. attrs dicts
+            return copy.deepcopy(params)
+        self.misses += 1
+        if lang == 'yaml':
+            params = yaml.safe_load(text)
+            if params:
+                self._params[key] = copy.deepcopy(params)
+            return params
+        code = self._codes.get(key[1])
+        if code is None:
+            code = compile(text, '<string>', 'exec')
+            self._codes[key[1]] = code
+        params = {'self': node, 'text': text}
+        exec(code, globals(), params)
+        for param in list(params.keys()):
+            if isinstance((params[param]), type):
+                params.pop(param)
+            elif isinstance((params[param]), types.ModuleType):
+                params.pop(param)
+        for name in ('self', 'text'):
+            if name in params:
+                params.pop(name)
+        if self.is_pure(text, lang):
+            self._params[key] = copy.deepcopy(params)
+        return params
+
+    def is_pure(self, text: str, lang: str) -> bool:
+        # whether the parameters of a config depend on its text only
+        if lang == 'yaml':
+            return True
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        pure = self._pure.get(digest)
+        if pure is None:
+            code = self._codes.get(digest)
+            if code is None:
+                code = compile(text, '<string>', 'exec')
+                self._codes[digest] = code
+            pure = self._is_pure(code)
+            self._pure[digest] = pure
+        return pure
+
+    def _is_pure(self, code: CodeType) -> bool:
+        # whether code loads only names it set before, or pure builtins
+        stored: Set[str] = set()
+        for instr in dis.get_instructions(code):
+            if instr.opname in ('STORE_NAME', 'STORE_GLOBAL'):
+                stored.add(instr.argval)
+            elif instr.opname in ('LOAD_NAME', 'LOAD_GLOBAL', 'LOAD_CLASSDEREF',
+                                  'DELETE_NAME', 'IMPORT_NAME'):
+                if instr.argval not in stored and instr.argval not in self.pure_builtins:
+                    return False
+        for const in code.co_consts:
+            if isinstance(const, CodeType) and not self._is_pure(const):
+                return False
+        return True
+
+
+configcache = ConfigCache()
 
 
 class ConfigNode(ASTNode):
-    def __init__(self):
+    # No __slots__: config parameters are set as arbitrary attributes.
+    # The config of an included document is a copy-on-write view of its
+    # includer's config: parameters it does not set are read from base, and
+    # both share the attrs dicts.
+
+    def __init__(self, base: Optional[ConfigNode] = None):
         super().__init__()
+        if base is not None:
+            self._base: Optional[ConfigNode] = base
+            self.attrs: Dict[str, str] = base.attrs
+            self.fixed_attrs: Dict[str, Any] = base.fixed_attrs
+            return
+        self._base = None
         self.title: str = 'Document Title'
         self.version: str = str()
         self.author: str = str()
-        self.attrs: Dict[str, str] = dict()
+        self.attrs = dict()
+        # attrs given by the build (e.g. a variant), config blocks keep them
+        self.fixed_attrs = dict()
+
+    def __getattr__(self, name: str) -> Any:
+        # called for parameters not set on this config
+        base = self.__dict__.get('_base')
+        if base is None or name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(base, name)
 
     @property
     def docdata_params(self):
-        params = dict(self.__dict__.items())
-        ignores = ('parent', 'children', 'id', 'attrs')
-        for i in ignores:
-            params.pop(i)
+        base = self.__dict__.get('_base')
+        params = base.docdata_params if base is not None else dict()
+        params.update(self.__dict__.items())
+        for key in ('attrs', 'fixed_attrs', '_base'):
+            params.pop(key, None)
         return params
 
-    def parse(self, text: str, lang=None) -> None:
+    def fix_attrs(self, attrs: Dict[str, Any]) -> None:
+        self.fixed_attrs.update(attrs)
+        self.attrs.update(attrs)
+
+    def _update_attrs(self, attrs: Dict[str, Any]) -> None:
+        self.attrs.update(attrs)
+        self.attrs.update(self.fixed_attrs)
+
+    def parse(self, text: str, lang=None) -> bool:
+        # returns whether the parameters depend on the text only, see
+        # ConfigCache.is_pure()
         if lang == 'python' or lang is None:
             self._parse_python(text)
+            return configcache.is_pure(text, 'python')
         elif lang == 'yaml':
             self._parse_yaml(text)
+            return True
         else:
             raise ValueError(f'unknown config lang "{lang}"')
 
     def _parse_yaml(self, text: str) -> None:
-        params = yaml.safe_load(text)
+        params = configcache.params(text, 'yaml', self)
         if not params:
             return
         for key, value in params.items():
             if key == 'attrs':
-                self.attrs.update(value)
+                self._update_attrs(value)
             else:
                 setattr(self, key, value)
 
     def _parse_python(self, text: str) -> None:
-        exec(text)
-        params: Dict[str, Any] = locals()
-        for param in list(params.keys()):
-            if isinstance((params[param]), type):
-                params.pop(param)
-            elif isinstance((params[param]), types.ModuleType):
-                params.pop(param)
-        for key in ('self', 'text'):
-            if key in params:
-                params.pop(key)
+        params = configcache.params(text, 'python', self)
         for key in params:
             value: Any = params[key]
             if key == 'attrs':
-                self.attrs.update(value)
+                self._update_attrs(value)
             else:
                 setattr(self, key, value)
 
 
 class SectionNode(ASTNode):
+    __slots__ = (
+        'level', 'title', 'auto_id', 'srcpath', 'srcdoc', 'src_id', 'opts', '_sectindex',
+        'srctoken',
+    )
     attrkey = ('level', 'title', 'id', 'auto_id', 'opts')
 
     def __init__(self):
@@ -180,9 +432,12 @@ class SectionNode(ASTNode):
         self.id: str = str()
         self.auto_id: str = str()
         self.srcpath: str = str()
+        self.srcdoc: int = 0  # Reader.docindex of the (included) document read
         self.src_id: str = str()
         self.opts: Dict[str, Any] = dict()
         self._sectindex: List[int] = list()
+        # the lexer token of the title; its line follows incremental edits
+        self.srctoken: Any = None
 
     @property
     def rootpath(self):
@@ -190,10 +445,8 @@ class SectionNode(ASTNode):
 
     @property
     def src_relpath(self):
-        root_dir = os.path.dirname(os.path.abspath(self.rootpath))
-        src_abspath = pathlib.Path(self.srcpath).resolve()
-        src_relpath = src_abspath.relative_to(root_dir)
-        return str(src_relpath)
+        root: DocumentNode = self.root
+        return root.pathcache.relpath(self.srcpath, root.srcpath)
 
     def sectindex(self) -> List[int]:
         return self._sectindex
@@ -205,22 +458,48 @@ class SectionNode(ASTNode):
         return sectnum
 
 
+class SectionTable():
+    # Cross-reference table for link targets. Every map keeps sections in
+    # document order, so a lookup returns the same section as a tree walk.
+
+    def __init__(self, rootnode: ASTNode):
+        self.by_id: Dict[Tuple[str, str], SectionNode] = dict()
+        self.by_name: Dict[str, List[Tuple[str, SectionNode]]] = dict()
+        self.by_path: Dict[str, SectionNode] = dict()
+        for n in rootnode.root.nodes_of(SectionNode):
+            relpath = n.src_relpath
+            sec_id = n.id or n.auto_id
+            self.by_id.setdefault((relpath, sec_id), n)
+            self.by_name.setdefault(sec_id, list()).append((relpath, n))
+            self.by_path.setdefault(relpath, n)
+
+
 class BlockNode(ASTNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class TocBlockNode(BlockNode):
+    __slots__ = ('opts', 'value')  # set by readers
+
     def __init__(self):
         super().__init__()
 
     def walk_sections(self) -> Generator[Tuple[ASTNode, bool], None, None]:
-        for n, gofoward in self.root.walk_depth():
-            if isinstance(n, SectionNode):
-                yield n, gofoward
+        opened: List[ASTNode] = list()
+        for n in self.root.nodes_of(SectionNode):
+            while opened and not _is_ancestor(opened[-1], n):
+                yield opened.pop(), False
+            yield n, True
+            opened.append(n)
+        while opened:
+            yield opened.pop(), False
 
 
 class ListBlockNode(BlockNode):
+    __slots__ = ('level', 'indent')
     attrkey = ('level', 'indent')
 
     def __init__(self):
@@ -230,16 +509,22 @@ class ListBlockNode(BlockNode):
 
 
 class BulletListBlockNode(ListBlockNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class OrderedListBlockNode(ListBlockNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class DescriptionListBlockNode(ListBlockNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
@@ -254,33 +539,50 @@ class DescriptionListBlockNode(ListBlockNode):
 
 
 class CheckListBlockNode(ListBlockNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class ListItemNode(ASTNode):
+    __slots__ = (
+        'options', 'title', 'titlebreak', 'level', 'indent', 'marker',
+        # attached by reader.FootnoteNumPass
+        'fn_num', 'footnotes', '_description', 'ref_num',
+        'srctoken',
+    )
+
     def __init__(self):
         super().__init__()
         self.options: Dict[str, Any] = dict()
         self.title: Any = None
         self.titlebreak: bool = False
+        self.srctoken: Any = None  # the lexer token of the list symbol
 
 
 class FootnoteListBlockNode(BlockNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class ReferenceListBlockNode(BlockNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class FigureBlockNode(BlockNode):
+    __slots__ = ('caption', 'align', 'opts', '_fignum')  # opts: set by readers
+
     def __init__(self):
         super().__init__()
         self.caption: str = str()
         self.align: str = 'l'
+        self._fignum: Optional[Tuple[int, int]] = None  # set by reader.FigNumPass
 
     def _fignum_format(self, gindex: int, lindex: List[int]) -> str:
         def default_figure_fignum_format(gindex: int, lindex: List[int]) -> str:
@@ -302,50 +604,25 @@ class FigureBlockNode(BlockNode):
 
     @property
     def fignum(self) -> str:
-        gindex: int = 1
-        if isinstance(self.children[0], TableBlockNode):
-            for n, gofoward in self.root.walk_depth():
-                if not gofoward:
-                    continue
-                if isinstance(n, FigureBlockNode) and isinstance(n.children[0], TableBlockNode):
-                    if n == self:
-                        break
-                    gindex += 1
-        else:
-            for n, gofoward in self.root.walk_depth():
-                if not gofoward:
-                    continue
-                if isinstance(n, FigureBlockNode):
-                    if n == self:
-                        break
-                    gindex += 1
+        if self._fignum is None:
+            msg: str = 'The figure number is not assigned'
+            logger.error(msg)
+            raise Exception(msg)
         section: Optional[SectionNode] = self._parent_section()
         if section is None:
-            msg: str = 'The figure is not into any sections'
+            msg = 'The figure is not into any sections'
             logger.error(msg)
             raise Exception(msg)
-        lindex: int = 1
-        if isinstance(self.children[0], TableBlockNode):
-            for n, gofoward in self.root.walk_depth():
-                if not gofoward:
-                    continue
-                if isinstance(n, FigureBlockNode) and isinstance(n.children[0], TableBlockNode):
-                    if n == self:
-                        break
-                    lindex += 1
-        else:
-            for n, gofoward in self.root.walk_depth():
-                if not gofoward:
-                    continue
-                if isinstance(n, FigureBlockNode):
-                    if n == self:
-                        break
-                    lindex += 1
+        gindex, lindex = self._fignum
         lindexs: List[int] = section.sectindex() + [lindex]
         return self._fignum_format(gindex, lindexs)
 
 
 class TableBlockNode(BlockNode):
+    __slots__ = (
+        'type', 'row', 'col', 'headers', 'caption',
+        'align', 'aligns', 'width', 'widths', 'fontsize', '_fignum',
+    )
     attrkey = ('row', 'col', 'headers', 'fontsize')
 
     def __init__(self):
@@ -360,6 +637,7 @@ class TableBlockNode(BlockNode):
         self.width: int = 0
         self.widths: List[int] = list()  # column widths
         self.fontsize: str = ''
+        self._fignum: Optional[Tuple[int, int]] = None  # set by reader.FigNumPass
 
     def cell(self, row: int, col: int) -> ASTNode:
         return self.children[row].children[col]
@@ -380,30 +658,23 @@ class TableBlockNode(BlockNode):
 
     @property
     def fignum(self) -> str:
-        gindex: int = 1
-        for n, gofoward in self.root.walk_depth():
-            if gofoward:
-                if isinstance(n, TableBlockNode) and n.caption is not None:
-                    if n == self:
-                        break
-                    gindex += 1
+        if self._fignum is None:
+            msg: str = 'The figure number is not assigned'
+            logger.error(msg)
+            raise Exception(msg)
         section: Optional[SectionNode] = self._parent_section()
         if section is None:
-            msg: str = 'The figure is not into any sections'
+            msg = 'The figure is not into any sections'
             logger.error(msg)
             raise Exception(msg)
-        lindex: int = 1
-        for n, gofoward in section.walk_depth():
-            if gofoward:
-                if isinstance(n, TableBlockNode) and n.caption is not None:
-                    if n == self:
-                        break
-                    lindex += 1
+        gindex, lindex = self._fignum
         lindexs: List[int] = section.sectindex() + [lindex]
         return self._fignum_format(gindex, lindexs)
 
 
 class TableRowNode(ASTNode):
+    __slots__ = ('tp', 'idx')
+
     def __init__(self):
         super().__init__()
         self.tp: str = 'data'  # 'header', 'data'
@@ -411,7 +682,11 @@ class TableRowNode(ASTNode):
 
 
 class TableCellNode(ASTNode):
+    __slots__ = ('idx', 'align', 'width', 'mergeto', 'size')
+
     class Size():
+        __slots__ = ('x', 'y')
+
         def __init__(self, x: int, y: int):
             self.x: int = x
             self.y: int = y
@@ -426,16 +701,21 @@ class TableCellNode(ASTNode):
 
 
 class LiteralBlockNode(BlockNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class QuoteBlockNode(BlockNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class CodeBlockNode(BlockNode):
+    __slots__ = ('lang',)
     attrkey = ('lang',)
 
     def __init__(self):
@@ -444,6 +724,7 @@ class CodeBlockNode(BlockNode):
 
 
 class CustomBlockNode(BlockNode):
+    __slots__ = ('ext', 'text')
     attrkey = ('ext',)
 
     def __init__(self):
@@ -453,21 +734,29 @@ class CustomBlockNode(BlockNode):
 
 
 class HorizonBlockNode(BlockNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class ParagraphNode(BlockNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class TitleNode(ParagraphNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class InlineNode(ASTNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
@@ -482,6 +771,7 @@ class InlineNode(ASTNode):
 
 
 class TextNode(InlineNode):
+    __slots__ = ('text',)
     attrkey = ('text',)
 
     def __init__(self, text: Optional[str] = None):
@@ -490,11 +780,14 @@ class TextNode(InlineNode):
 
 
 class LinebreakNode(InlineNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class RoleNode(InlineNode):
+    __slots__ = ('role', 'args', 'opts', 'value')
     attrkey = ('role', 'args', 'opts', 'value')
 
     def __init__(self, role=None, args=None, opts=None, value=None):
@@ -506,36 +799,49 @@ class RoleNode(InlineNode):
 
 
 class DecorationRoleNode(RoleNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class ImageRoleNode(RoleNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class IncludeRoleNode(RoleNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class KbdRoleNode(RoleNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class BtnRoleNode(RoleNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class MenuRoleNode(RoleNode):
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
 
 class LinkNode(InlineNode):
+    __slots__ = ('opts', 'value', 'srcpath')
     attrkey = ('opts', 'value')
 
     def __init__(self, opts=None, value=None):
@@ -549,32 +855,32 @@ class LinkNode(InlineNode):
         return self.root.srcpath
 
     def _relpath(self, tgtpath):
-        rootdir = os.path.dirname(os.path.abspath(self.rootpath))
-        selfdir = os.path.dirname(os.path.abspath(self.srcpath))
+        root: DocumentNode = self.root
+        selfdir = os.path.dirname(root.pathcache.abspath(self.srcpath))
         tgtpath_from_selfdir = os.path.join(selfdir, tgtpath)
-        tgt_abspath = pathlib.Path(tgtpath_from_selfdir).resolve()
-        tgtpath_from_root = tgt_abspath.relative_to(rootdir)
-        return str(tgtpath_from_root)
+        return root.pathcache.relpath(tgtpath_from_selfdir, root.srcpath)
 
     @property
-    def target_section(self) -> str:
-        root: ASTNode = self.root
+    def target_section(self) -> Optional[SectionNode]:
+        root: DocumentNode = self.root
+        if root.sectiontable is None:
+            root.sectiontable = SectionTable(root)
+        table: SectionTable = root.sectiontable
         url, _, anchor = self.value.partition('#')
+        if not url and not anchor:
+            # no target, e.g. a slug of a section without auto_id
+            return None
         if url and not anchor:
             tgtpath = self._relpath(self.srcpath)
             tgtid = url
             # find id in local
-            for sec, gofoward in root.walk_depth():
-                if gofoward and isinstance(sec, SectionNode):
-                    sec_id = sec.id or sec.auto_id
-                    if sec.src_relpath == tgtpath and sec_id == tgtid:
-                        return sec
+            sec = table.by_id.get((tgtpath, tgtid))
+            if sec:
+                return sec
             # find id in global
-            for sec, gofoward in root.walk_depth():
-                if gofoward and isinstance(sec, SectionNode):
-                    sec_id = sec.id or sec.auto_id
-                    if sec.src_relpath != tgtpath and sec_id == tgtid:
-                        return sec
+            for sec_relpath, sec in table.by_name.get(tgtid, ()):
+                if sec_relpath != tgtpath:
+                    return sec
             tgtpath = self._relpath(url)
             tgtid = ''
         if anchor:
@@ -585,21 +891,15 @@ class LinkNode(InlineNode):
                 tgtpath = self._relpath(self.srcpath)
         if tgtid:
             # find id in local
-            for sec, gofoward in root.walk_depth():
-                if gofoward and isinstance(sec, SectionNode):
-                    sec_id = sec.id or sec.auto_id
-                    if sec.src_relpath == tgtpath and sec_id == tgtid:
-                        return sec
+            sec = table.by_id.get((tgtpath, tgtid))
+            if sec:
+                return sec
         # find first section in local
-        for sec, gofoward in root.walk_depth():
-            if gofoward and isinstance(sec, SectionNode):
-                sec_id = sec.id or sec.auto_id
-                if sec.src_relpath == tgtpath:
-                    return sec
-        return None
+        return table.by_path.get(tgtpath)
 
 
 class FootnoteNode(InlineNode):
+    __slots__ = ('value', '_description', 'fn_num')  # fn_num: see Reader
     attrkey = ('value',)
 
     def __init__(self, value: Optional[str] = None):
@@ -618,6 +918,7 @@ class FootnoteNode(InlineNode):
 
 
 class ReferenceNode(InlineNode):
+    __slots__ = ('value', 'ref_num')  # ref_num: see Reader
     attrkey = ('value',)
 
     def __init__(self, value=None):
@@ -647,6 +948,15 @@ def parse_funcargs(argstr) -> List[Any]:
     return params['args']
 
 
+def _is_ancestor(node: ASTNode, descendant: ASTNode) -> bool:
+    p = descendant.parent
+    while p is not None:
+        if p is node:
+            return True
+        p = p.parent
+    return False
+
+
 def nodeprint(node) -> None:
     depth: int = 0
     for n, gofoward in node.walk_depth():
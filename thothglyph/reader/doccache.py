@@ -0,0 +1,256 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Set
+from collections import OrderedDict
+from thothglyph.node import nd
+from thothglyph.node import logging
+from thothglyph import __version__
+import copy
+import hashlib
+import os
+import pickle
+import types
+
+logger = logging.getLogger(__file__)
+
+_MISSING = '<missing>'
+
+
+def filedigest(path: str) -> Optional[str]:
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class CacheEntry():
+    # One parse result of an included document.
+    # attrs:   values of the attrs the document (and its includes) refer to,
+    #          as seen by the includer when it was parsed
+    # config:  fingerprint of the includer's other config parameters
+    # deps:    digests of every file the parse read, includes of includes too
+    # update:  attrs set by config blocks in the document; the includer shares
+    #          its attrs dict with the included reader, so these are replayed
+    #          on a hit
+    def __init__(self):
+        self.attrs: Dict[str, Any] = dict()
+        self.config: str = str()
+        self.deps: Dict[str, Optional[str]] = dict()
+        self.update: Dict[str, Any] = dict()
+        self.doc: Optional[nd.DocumentNode] = None
+
+    def match(self, attrs: Dict[str, Any], config: str) -> bool:
+        if self.config != config:
+            return False
+        for name, value in self.attrs.items():
+            if attrs.get(name, _MISSING) != value:
+                return False
+        for path, digest in self.deps.items():
+            if filedigest(path) != digest:
+                return False
+        return True
+
+
+class DocumentCache():
+    # Parsed include documents, in process and optionally on disk.
+    # Entries are keyed by reader type, file path, file content and the
+    # working directory (include paths are relative to it); several entries
+    # per key are kept for different attrs/config values. The least recently
+    # used keys are dropped beyond maxsize, e.g. in a long running lsp server.
+    def __init__(self, maxsize: int = 256, maxentries: int = 8):
+        self.entries: OrderedDict[str, List[CacheEntry]] = OrderedDict()
+        self.maxsize: int = maxsize
+        self.maxentries: int = maxentries
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def key(self, readercls: type, abspath: str, digest: str) -> str:
+        text = '\0'.join([
+            __version__, readercls.__module__, readercls.__name__,
+            abspath, digest, os.getcwd(),
+        ])
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def lookup(
+        self, key: str, attrs: Dict[str, Any], config: str, directory: Optional[str]
+    ) -> Optional[CacheEntry]:
+        if key not in self.entries and directory:
+            self._put(key, self._load(key, directory))
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        for entry in self.entries.get(key, ()):
+            if entry.match(attrs, config):
+                self.hits += 1
+                return entry
+        self.misses += 1
+        return None
+
+    def store(self, key: str, entry: CacheEntry, directory: Optional[str]) -> None:
+        entries = self.entries.get(key, list())
+        entries.append(entry)
+        del entries[:-self.maxentries]
+        self._put(key, entries)
+        if directory:
+            self._save(key, entries, directory)
+
+    def _put(self, key: str, entries: List[CacheEntry]) -> None:
+        self.entries[key] = entries
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def _path(self, key: str, directory: str) -> str:
+        return os.path.join(directory, key + '.pickle')
+
+    def _load(self, key: str, directory: str) -> List[CacheEntry]:
+        path = self._path(key, directory)
+        if not os.path.exists(path):
+            return list()
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            logger.debug('document cache: ignore {}: {}'.format(path, e))
+            return list()
+
+    def _save(self, key: str, entries: List[CacheEntry], directory: str) -> None:
+        path = self._path(key, directory)
+        tmppath = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(tmppath, 'wb') as f:
+                pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmppath, path)
+        except Exception as e:
+            # e.g. attrs values that cannot be pickled; keep the entry in process
+            logger.debug('document cache: cannot write {}: {}'.format(path, e))
+            if os.path.exists(tmppath):
+                os.remove(tmppath)
+
+
+documentcache = DocumentCache()
+
+
+def _config_fingerprint(config: nd.ConfigNode) -> Optional[str]:
+    # The same in every build for the same config values, or None if a value
+    # has no such form; an include of such a config is not cached.
+    return _stable_repr(config.docdata_params)
+
+
+def _stable_repr(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, (str, int, float, bool, bytes)):
+        return repr(value)
+    if isinstance(value, (list, tuple, set, frozenset)):
+        reprs = [_stable_repr(v) for v in value]
+        items = [r for r in reprs if r is not None]
+        if len(items) != len(reprs):
+            return None
+        if isinstance(value, (set, frozenset)):
+            items.sort()
+        return '{}({})'.format(type(value).__name__, ', '.join(items))
+    if isinstance(value, dict):
+        pairs = [(_stable_repr(k), _stable_repr(v)) for k, v in value.items()]
+        if any([k is None or v is None for k, v in pairs]):
+            return None
+        return '{{{}}}'.format(', '.join(sorted(['{}: {}'.format(k, v) for k, v in pairs])))
+    if isinstance(value, types.FunctionType) and value.__closure__ is None:
+        # e.g. a fignum format hook defined in a config block, by its code
+        code = _code_repr(value.__code__)
+        defaults = _stable_repr(value.__defaults__)
+        if code is None or defaults is None:
+            return None
+        digest = hashlib.sha256(code.encode('utf-8')).hexdigest()
+        return 'function({}, {})'.format(digest, defaults)
+    return None
+
+
+def _code_repr(code: types.CodeType) -> Optional[str]:
+    consts: List[Optional[str]] = list()
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            consts.append(_code_repr(const))
+        else:
+            consts.append(_stable_repr(const))
+    if None in consts:
+        return None
+    return repr((code.co_code, code.co_names, code.co_varnames, consts))
+
+
+def _detach(doc: nd.DocumentNode) -> nd.DocumentNode:
+    # Copies doc without the state shared with the build that parsed it.
+    memo: Dict[int, Any] = {
+        id(doc.pathcache): nd.PathCache(),
+        id(doc.config): nd.ConfigNode(),
+        id(doc._registry): dict(),
+    }
+    newdoc = copy.deepcopy(doc, memo)
+    newdoc._registry_modcount = -1
+    return newdoc
+
+
+def _attach(doc: nd.DocumentNode, reader) -> nd.DocumentNode:
+    # Copies a cached doc into the current build.
+    root = reader.root_reader
+    memo: Dict[int, Any] = {id(doc.pathcache): root.parser.rootnode.pathcache}
+    newdoc = copy.deepcopy(doc, memo)
+    newdoc.srcpath = reader.path
+    srcdocs: Dict[int, int] = dict()
+    for section in newdoc.nodes_of(nd.SectionNode):
+        if section.srcdoc not in srcdocs:
+            srcdocs[section.srcdoc] = root.ndocs
+            root.ndocs += 1
+        section.srcdoc = srcdocs[section.srcdoc]
+    return newdoc
+
+
+def read(reader, path: str) -> nd.DocumentNode:
+    # Reads an included document with reader (whose parent is the includer),
+    # reusing a cached parse when the file, the files it reads and the attrs
+    # it refers to are unchanged.
+    includer = reader.parent
+    abspath = includer.parser.rootnode.pathcache.abspath(path)
+    digest = filedigest(abspath)
+    if digest is None:
+        return reader.read(path)
+    directory = reader.root_reader.cachedir
+    config = includer.parser.rootnode.config
+    fingerprint = _config_fingerprint(config)
+    cache = documentcache
+    key = cache.key(reader.__class__, abspath, digest)
+
+    entry = None
+    if fingerprint is not None:
+        entry = cache.lookup(key, config.attrs, fingerprint, directory)
+    if entry is not None:
+        assert entry.doc is not None
+        reader.path = path
+        doc = _attach(entry.doc, reader)
+        config.attrs.update(entry.update)
+        attrnames: Set[str] = set(entry.attrs)
+        deps = entry.deps
+        cacheable = True
+    else:
+        before = dict(config.attrs)
+        doc = reader.read(path)
+        # the attrs read by conditions and substitutions, see Parser._eval_condition()
+        attrnames = set(reader.attrnames)
+        deps = reader.deps
+        cacheable = reader.cacheable
+        if cacheable and fingerprint is not None:
+            entry = CacheEntry()
+            entry.attrs = dict([(name, before.get(name, _MISSING)) for name in attrnames])
+            entry.config = fingerprint
+            entry.deps = dict(deps)
+            entry.update = dict([
+                (k, v) for k, v in config.attrs.items()
+                if k not in before or before[k] is not v
+            ])
+            entry.doc = _detach(doc)
+            cache.store(key, entry, directory)
+
+    # the includer's own entry depends on everything this include depends on
+    includer.deps[abspath] = digest
+    includer.deps.update(deps)
+    includer.attrnames |= attrnames
+    includer.cacheable = includer.cacheable and cacheable
+    return doc
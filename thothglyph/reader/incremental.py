@@ -0,0 +1,404 @@
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from thothglyph.error import ThothglyphError
+from thothglyph.node import nd
+from thothglyph.node import logging
+from thothglyph.reader.reader import TokenStream
+from thothglyph.reader.tglyph import Lexer, TglyphReader, grammar
+
+logger = logging.getLogger(__file__)
+
+
+class TextEdit():
+    # Replaces lines [begin, end) of the source (0-based) with lines.
+    # begin == end inserts lines; an empty lines list deletes.
+    def __init__(self, begin: int, end: int, lines: List[str]):
+        self.begin: int = begin
+        self.end: int = end
+        self.lines: List[str] = lines
+
+    @classmethod
+    def from_range(
+        cls, srclines: List[str], start: Tuple[int, int], end: Tuple[int, int], text: str
+    ) -> TextEdit:
+        # The whole-line edit of replacing the text between two (line, column)
+        # positions of srclines, e.g. an editor change event.
+        (sline, scol), (eline, ecol) = start, end
+        head = srclines[sline][:scol] if sline < len(srclines) else ''
+        tail = srclines[eline][ecol:] if eline < len(srclines) else ''
+        lines = (head + text + tail).split('\n')
+        return cls(sline, min(eline + 1, len(srclines)), lines)
+
+    def __str__(self) -> str:
+        return 'TextEdit({}, {}, {} lines)'.format(self.begin, self.end, len(self.lines))
+
+
+class Unit():
+    # Top-level children of the document that were parsed from the tokens
+    # beginning at token number begin, up to the begin of the next unit:
+    # a top-level block (with list items merged into it) or a level 1 section.
+    __slots__ = ('begin', 'nodes')
+
+    def __init__(self, begin: int):
+        self.begin: int = begin
+        self.nodes: List[nd.ASTNode] = list()
+
+
+class IncrementalParser():
+    # Keeps the tokens and the AST of one tglyph document and updates them
+    # for line edits. Only the edited lines are lexed again; parsing restarts
+    # at the top-level unit containing the edit and stops at the first
+    # following unit boundary where the parser is back in the state of the
+    # previous parse. Edits of config blocks, comments, control flow or
+    # lines inside control flow are parsed from scratch.
+    lookahead: int = 2  # tokens the parser may peek beyond the end of a block
+
+    def __init__(self, path: str, config: Optional[Dict[str, Any]] = None,
+                 encoding: str = 'utf-8'):
+        self.path: str = path
+        self.config: Optional[Dict[str, Any]] = config
+        self.encoding: str = encoding
+        self.reader: Optional[TglyphReader] = None
+        self.lines: List[str] = list()
+        self.units: List[Unit] = list()
+        self.flowspans: List[Tuple[int, int]] = list()  # line spans of ⑇ constructs
+        self.valid: bool = False
+        # tokens whose parse failed; the AST keeps the previous nodes for them
+        self.dirty: Optional[Tuple[int, int]] = None
+        # statistics of the last parse or update
+        self.relexed: int = 0  # lines
+        self.reparsed: int = 0  # tokens
+
+    @property
+    def rootnode(self) -> Optional[nd.DocumentNode]:
+        return self.reader.parser.rootnode if self.reader else None
+
+    @property
+    def attrnames(self) -> Set[str]:
+        # the attrs the preprocessed lines depend on (conditions and
+        # substitutions); parse() again when one of their values changes
+        return self.reader.attrnames if self.reader else set()
+
+    @property
+    def tokens(self) -> List[Lexer.Token]:
+        return self.reader.parser.tokens if self.reader else list()
+
+    def nodes_at(self, line: int) -> List[nd.ASTNode]:
+        # the top-level children of the document parsed from a unit around line
+        tokens = self.tokens
+        lo, hi = 0, len(self.units)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tokens[max(self.units[mid].begin, 0)].line <= line:
+                lo = mid + 1
+            else:
+                hi = mid
+        return list(self.units[lo - 1].nodes) if lo > 0 else list()
+
+    def parse(self, data: Optional[str] = None) -> nd.DocumentNode:
+        if data is None:
+            with open(self.path, 'r', encoding=self.encoding) as f:
+                data = f.read()
+        self.lines = data.split(Lexer.newline_token)
+        return self._parse_all()
+
+    def update(self, edit: TextEdit) -> Tuple[nd.DocumentNode, List[nd.ASTNode]]:
+        # Returns the document and its top-level children to render again:
+        # the ones parsed again and the ones whose numbering changed.
+        oldlines = self.lines[edit.begin:edit.end]
+        self.lines[edit.begin:edit.end] = edit.lines
+        if not self.valid or self._touches_preprocess(edit, oldlines):
+            doc = self._parse_all()
+            return doc, list(doc.children)
+        changed = self._reparse(edit)
+        root = self.rootnode
+        assert root is not None
+        return root, changed
+
+    def _parse_all(self) -> nd.DocumentNode:
+        self.valid = False
+        self.dirty = None
+        self.units = list()
+        reader = TglyphReader(config=self.config)
+        reader.encoding = self.encoding
+        reader.path = self.path
+        self.reader = reader
+        parser = reader.parser
+        doc = parser.rootnode
+        assert doc is not None
+        doc.srcpath = self.path
+        data = Lexer.newline_token.join(self.lines)
+        ppdata = parser.preprocess(data)
+        self.flowspans = self._preprocess_spans(parser.tokens)
+        parser.tokens = self._lex(ppdata)
+        tokens = TokenStream(parser.tokens)
+        self.units, stopped = self._parse_units(tokens, None)
+        reader.postprocess(doc)
+        self.relexed = len(ppdata)
+        self.reparsed = len(parser.tokens)
+        self.valid = True
+        return doc
+
+    def _lex(self, pplines: List[Tuple[int, str]]) -> List[Lexer.Token]:
+        assert self.reader is not None
+        parser = self.reader.parser
+        try:
+            return parser.lexer.lex_block(pplines)
+        except ThothglyphError as e:
+            lineno, line, rests = e.args
+            lineno += 1
+            msg = 'Unknown token.'
+            msg = f'{self.path}:{lineno}: {msg}'
+            raise ThothglyphError(msg)
+
+    def _preprocess_spans(self, tokens: List[Lexer.Token]) -> List[Tuple[int, int]]:
+        # line spans of config blocks and outermost control-flow blocks
+        spans: List[Tuple[int, int]] = list()
+        configline: Optional[int] = None
+        flowlines: List[int] = list()
+        for token in tokens:
+            if token.key == 'CONFIG_LINE':
+                if configline is None:
+                    configline = token.line
+                else:
+                    spans.append((configline, token.line))
+                    configline = None
+            elif token.key == 'CONTROL_FLOW':
+                m = grammar.preproc_tokens['CONTROL_FLOW'].match(token.value)
+                keyword = m.group(1) if m else ''
+                if keyword == 'if':
+                    flowlines.append(token.line)
+                elif keyword == 'end' and flowlines:
+                    begin = flowlines.pop()
+                    if not flowlines:
+                        spans.append((begin, token.line))
+        if configline is not None:
+            spans.append((configline, len(self.lines)))
+        if flowlines:
+            spans.append((flowlines[0], len(self.lines)))
+        return spans
+
+    def _touches_preprocess(self, edit: TextEdit, oldlines: List[str]) -> bool:
+        for line in oldlines + edit.lines:
+            if '⑇' in line:
+                return True
+        b, e = edit.begin, edit.end
+        for first, last in self.flowspans:
+            if e > b and first <= e - 1 and b <= last:
+                return True
+            if e == b and first < b <= last:
+                return True
+        return False
+
+    def _parse_units(
+        self, tokens: TokenStream, stop: Optional[Callable[[Lexer.Token], bool]]
+    ) -> Tuple[List[Unit], bool]:
+        # The top-level loop of TglyphParser.p_document() and p_blocks(),
+        # recording units. Returns the units and whether stop() ended it.
+        assert self.reader is not None
+        parser = self.reader.parser
+        doc = parser.rootnode
+        assert doc is not None
+        parser.nodes = [doc]
+        units: List[Unit] = list()
+        tokens = parser.p_ignore_emptylines(tokens)
+        while tokens:
+            token = tokens.peek()
+            if token.key == 'BREAK_PARAGRAPH':
+                tokens.advance()
+            elif token.key in ('BLOCKS_TERMINATOR', 'SECTION_TERMINATOR'):
+                tokens.advance()
+                break
+            else:
+                if stop is not None and token.no >= 0 and stop(token):
+                    return units, True
+                nchildren = len(doc.children)
+                tokens = parser.p_block(tokens)
+                added = doc.children[nchildren:]
+                if not units or (token.no >= 0 and added and units[-1].nodes):
+                    units.append(Unit(token.no))
+                units[-1].nodes.extend(added)
+            tokens = parser.p_ignore_emptylines(tokens)
+        return units, False
+
+    def _token_index(self, tokens: List[Lexer.Token], line: int) -> int:
+        # index of the first token on line or after it
+        lo, hi = 0, len(tokens)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tokens[mid].line < line:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _reparse(self, edit: TextEdit) -> List[nd.ASTNode]:
+        reader = self.reader
+        assert reader is not None
+        parser = reader.parser
+        doc = parser.rootnode
+        assert doc is not None
+        b, e = edit.begin, edit.end
+        delta = len(edit.lines) - (e - b)
+        self.valid = False
+
+        # lex the edited lines and splice their tokens in
+        oldtokens = parser.tokens
+        i = self._token_index(oldtokens, b)
+        j = self._token_index(oldtokens, e)
+        newtokens = self._lex([(b + k, line) for k, line in enumerate(edit.lines)])
+        for token in oldtokens[j:]:
+            token.line += delta
+        tokens = oldtokens[:i] + newtokens + oldtokens[j:]
+        for no in range(i, len(tokens)):
+            tokens[no].no = no
+        parser.tokens = tokens
+        shift = len(newtokens) - (j - i)
+        self.flowspans = [
+            (first + delta, last + delta) if first >= e else (first, last)
+            for first, last in self.flowspans
+        ]
+        # tokens [i, j) of the previous numbering are parsed again
+        if self.dirty:
+            i, j = min(i, self.dirty[0]), max(j, self.dirty[1])
+
+        # restart at the last unit the edit cannot have affected
+        units = self.units
+        r = 0
+        while r + 1 < len(units) and units[r + 1].begin + self.lookahead <= i:
+            r += 1
+        if units and units[r].begin + self.lookahead <= i:
+            restart = units[r].begin
+        else:
+            r, restart = 0, 0
+        keptunits = units[:r]
+        nkeep = sum([len(u.nodes) for u in keptunits])
+
+        # stop at an old unit boundary after the edit, if the last top-level
+        # child is of the same type as before it (list items merge into it)
+        candidates: List[Tuple[int, int, Optional[type]]] = list()  # (new begin, unit, prev)
+        prevtype: Optional[type] = None
+        for k, unit in enumerate(units):
+            if k > r and unit.begin >= j + self.lookahead:
+                candidates.append((unit.begin + shift, k, prevtype))
+            if unit.nodes:
+                prevtype = type(unit.nodes[-1])
+        cursor = [0]
+
+        def stop(token: Lexer.Token) -> bool:
+            while cursor[0] < len(candidates) and candidates[cursor[0]][0] < token.no:
+                cursor[0] += 1
+            if cursor[0] == len(candidates) or candidates[cursor[0]][0] != token.no:
+                return False
+            lasttype = type(doc.children[-1]) if doc.children else None
+            return lasttype is candidates[cursor[0]][2]
+
+        oldnodes = doc.children[nkeep:]
+        doc.splice(nkeep, len(doc.children), [])
+        stream = TokenStream(tokens)
+        stream.seek(restart)
+        try:
+            newunits, stopped = self._parse_units(stream, stop)
+        except Exception:
+            # keep the previous nodes, and parse their tokens again next time
+            k = r + 1
+            while k < len(units) and units[k].begin < j:
+                k += 1
+            stale = Unit(restart)
+            stale.nodes = [n for unit in units[len(keptunits):k] for n in unit.nodes]
+            for unit in units[k:]:
+                unit.begin += shift
+            doc.splice(nkeep, len(doc.children), oldnodes)
+            self.units = keptunits + [stale] + units[k:]
+            self.dirty = (restart, j + shift)
+            self.valid = True
+            raise
+        parsedend = stream.mark()
+        self.dirty = None
+        self.valid = True
+        tailunits: List[Unit] = list()
+        tailnodes: List[nd.ASTNode] = list()
+        if stopped:
+            k = candidates[cursor[0]][1]
+            for unit in units[k:]:
+                unit.begin += shift
+            tailunits = units[k:]
+            tailnodes = [n for unit in tailunits for n in unit.nodes]
+            doc.splice(len(doc.children), len(doc.children), tailnodes)
+        self.units = keptunits + newunits + tailunits
+        changed = [n for unit in newunits for n in unit.nodes]
+        self.relexed = len(edit.lines)
+        self.reparsed = parsedend - restart
+        logger.debug('{}: {}: re-lexed {} lines, re-parsed {} tokens'.format(
+            self.path, edit, self.relexed, self.reparsed))
+
+        # post-process the whole document again. The numbers of the other
+        # top-level children and the tables of contents only change if the
+        # numbered nodes in the re-parsed children did.
+        oldsign = _signature(oldnodes[:len(oldnodes) - len(tailnodes)])
+        newsign = _signature(changed)
+        if oldsign == newsign:
+            reader.postprocess(doc)
+            return changed
+        changedset = set(changed)
+        keptnodes = [n for n in doc.children if n not in changedset]
+        before = [_numbering(n) for n in keptnodes]
+        reader.postprocess(doc)
+        for n, numbering in zip(keptnodes, before):
+            if _numbering(n) != numbering:
+                changed.append(n)
+        for toc in doc.nodes_of(nd.TocBlockNode):
+            top: nd.ASTNode = toc
+            while top.parent is not doc and top.parent is not None:
+                top = top.parent
+            if top not in changed:
+                changed.append(top)
+        return changed
+
+
+def _signature(nodes: List[nd.ASTNode]) -> List[Any]:
+    # what the post-processing passes read from a run of top-level children;
+    # footnotes are grouped by their top-level child
+    values: List[Any] = list()
+    for k, node in enumerate(nodes):
+        for n, gofoward in node.walk_depth():
+            if isinstance(n, nd.SectionNode):
+                if gofoward:
+                    values.append(('sect', n.title, n.id, n.opts.get('notoc'),
+                                   n.opts.get('nonum'), n.srcpath))
+                else:
+                    values.append(('endsect',))
+            elif not gofoward:
+                continue
+            elif isinstance(n, nd.FigureBlockNode):
+                tablefig = bool(n.children) and isinstance(n.children[0], nd.TableBlockNode)
+                values.append(('fig', tablefig))
+            elif isinstance(n, nd.TableBlockNode):
+                values.append(('table', n.caption is not None))
+            elif isinstance(n, nd.FootnoteNode):
+                values.append(('fn', k, n.value))
+            elif isinstance(n, nd.ReferenceNode):
+                values.append(('ref', n.value))
+            elif isinstance(n, nd.ListItemNode):
+                if isinstance(n.parent, (nd.FootnoteListBlockNode, nd.ReferenceListBlockNode)):
+                    values.append(n)  # kept footnotes refer to the item
+            elif isinstance(n, nd.TocBlockNode):
+                values.append(n)
+    return values
+
+
+def _numbering(node: nd.ASTNode) -> List[Any]:
+    # the values set by post-processing passes that writers render
+    values: List[Any] = list()
+    for n, gofoward in node.walk_depth():
+        if not gofoward:
+            continue
+        if isinstance(n, nd.SectionNode):
+            values.append((n.auto_id, tuple(n._sectindex), n.src_id))
+        elif isinstance(n, (nd.FigureBlockNode, nd.TableBlockNode)):
+            values.append(n._fignum)
+        elif isinstance(n, (nd.FootnoteNode, nd.ReferenceNode, nd.ListItemNode)):
+            values.append((getattr(n, 'fn_num', None), getattr(n, 'ref_num', None),
+                           getattr(n, '_description', None),
+                           tuple(getattr(n, 'footnotes', ()))))
+    return values
@@ -1,9 +1,11 @@
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+from types import MappingProxyType
 from thothglyph.error import ThothglyphError
-from thothglyph.reader import ReaderClass
-from thothglyph.reader.reader import Reader, Parser
+from thothglyph.reader.reader import Reader, Parser, SectAutoIdPass, TokenStream
+from thothglyph.reader.reader import AttrExpander
 from thothglyph.node import nd
 from markdown_it import MarkdownIt
+from markdown_it.rules_core import StateCore
 from markdown_it.token import Token
 from markdown_it.tree import SyntaxTreeNode
 from mdit_py_plugins.front_matter import front_matter_plugin
@@ -26,6 +28,62 @@ from thothglyph.node import logging
 logger = logging.getLogger(__file__)
 
 
+# Directives whose body is markdown. Their bodies are parsed by the block
+# parser within the parse of the document (see directive_body_rule()), and
+# appear in the syntax tree as 'directive' nodes with the parsed children.
+BODY_DIRECTIVES: Tuple[str, ...] = ('figure', 'footnote', 'reference')
+DIRECTIVE_INFO: re.Pattern = re.compile(r'{([a-zA-Z0-9_-]+)}(?: +(.+))?')
+
+
+def _nest_directive_bodies(state: StateCore, tokens: List[Token]) -> List[Token]:
+    nested: List[Token] = list()
+    for token in tokens:
+        m = DIRECTIVE_INFO.match(token.info.strip()) if token.type == 'fence' else None
+        if not m or m.group(1) not in BODY_DIRECTIVES:
+            nested.append(token)
+            continue
+        opening = Token('directive_open', 'div', 1, map=token.map, level=token.level,
+                        info=token.info, markup=token.markup, block=True)
+        opening.content = token.content
+        closing = Token('directive_close', 'div', -1, level=token.level,
+                        markup=token.markup, block=True)
+        children: List[Token] = list()
+        state.md.block.parse(token.content, state.md, state.env, children)
+        offset = token.map[0] + 1 if token.map else 0
+        for child in children:
+            child.level += token.level + 1
+            if child.map:
+                child.map = [child.map[0] + offset, child.map[1] + offset]
+        nested.append(opening)
+        nested.extend(_nest_directive_bodies(state, children))
+        nested.append(closing)
+    return nested
+
+
+def directive_body_rule(state: StateCore) -> None:
+    # runs after the block rule, so the inline rule parses the bodies too
+    state.tokens = _nest_directive_bodies(state, state.tokens)
+
+
+class TreeCache():
+    # Syntax trees of markdown parsed apart from the document (table cells,
+    # color decorations, ...), by text. Such texts repeat ('yes', 'n/a', ...)
+    # within and across documents; the trees are only read.
+    def __init__(self, parse: Callable[[str], List[Token]], maxsize: int = 10000):
+        self.parse: Callable[[str], List[Token]] = parse
+        self.maxsize: int = maxsize
+        self.trees: Dict[str, SyntaxTreeNode] = dict()
+
+    def get(self, text: str) -> SyntaxTreeNode:
+        tree = self.trees.get(text)
+        if tree is None:
+            if len(self.trees) >= self.maxsize:
+                self.trees.clear()
+            tree = SyntaxTreeNode(self.parse(text))
+            self.trees[text] = tree
+        return tree
+
+
 mdit = (
     MarkdownIt('commonmark')
     .use(front_matter_plugin)
@@ -40,6 +98,9 @@ mdit = (
     .use(myst_block_plugin)
     .enable('table')
 )
+mdit.core.ruler.after('block', 'directive_body', directive_body_rule)
+nested_trees = TreeCache(mdit.parse)
+inline_trees = TreeCache(mdit.parseInline)
 
 
 class Lexer():
@@ -67,11 +128,13 @@ class Lexer():
         'CONTROL_FLOW': r'%# *(\w+)(.*)',
         'TEXT': r'^.*(?<!%//)|(?<!%#)$',
     }
+    inline_tokens: Dict[str, str] = {
+        'ATTR': r'{{%([A-Za-z0-9_\-]+)%}}',
+    }
 
     def __init__(self):
-        self._preproc_tokens: Dict[str, re.Pattern] = {
-            k: re.compile(v) for k, v in self.preproc_tokens.items()
-        }
+        # the patterns are compiled once per process (see Grammar)
+        self._preproc_tokens: Mapping[str, re.Pattern] = grammar.preproc_tokens
 
     def lex_preproc(self, data: str) -> List["Lexer.Token"]:
         return self.lex_pattern(self._preproc_tokens, data)
@@ -122,10 +185,35 @@ class Lexer():
         return tokens
 
 
+class Grammar():
+    # Lexer patterns compiled once and shared by every Lexer and parser of
+    # the process, like the markdown-it parser mdit. Read only.
+    __slots__ = ('preproc_tokens', 'inline_tokens', 'config_include')
+    preproc_tokens: Mapping[str, re.Pattern]
+    inline_tokens: Mapping[str, re.Pattern]
+    config_include: re.Pattern
+
+    def __init__(self):
+        def compiled(tokens: Dict[str, str]) -> Mapping[str, re.Pattern]:
+            return MappingProxyType({k: re.compile(v) for k, v in tokens.items()})
+
+        object.__setattr__(self, 'preproc_tokens', compiled(Lexer.preproc_tokens))
+        object.__setattr__(self, 'inline_tokens', compiled(Lexer.inline_tokens))
+        # the argument of a config block header, e.g. --- {include} a.conf.py
+        object.__setattr__(self, 'config_include', re.compile(r'\{include\} (\S+)(?: +(\S+))?'))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Grammar is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('Grammar is read-only')
+
+
+grammar = Grammar()
+
+
 class MdParser(Parser):
-    inline_tokens: Dict[str, str] = {
-        'ATTR': r'{{%([A-Za-z0-9_\-]+)%}}',
-    }
+    inline_tokens: Dict[str, str] = Lexer.inline_tokens
     deco_keymap: Dict[str, str] = {
         'em': 'EMPHASIS',
         'strong': 'STRONG',
@@ -137,6 +225,7 @@ class MdParser(Parser):
         'COLOR4': r'🔵',
         'COLOR5': r'🟣',
     }
+    color_roles: Dict[str, str] = dict([(v, k) for k, v in inline_color_deco_tokens.items()])
     listblock_keymap: Dict[str, nd.ASTNode] = {
         'bullet_list': nd.BulletListBlockNode,
         'ordered_list': nd.OrderedListBlockNode,
@@ -148,8 +237,11 @@ class MdParser(Parser):
         self.rootnode: Optional[nd.DocumentNode] = None
         self.nodes: List[nd.ASTNode] = list()
         self.lexer: Lexer = Lexer()
+        self.attrexpander: Optional[AttrExpander] = None  # set by _init_config()
 
         self.rootnode = nd.DocumentNode()
+        if reader.parent:
+            self.rootnode.pathcache = reader.root_reader.parser.rootnode.pathcache
         self.nodes.append(self.rootnode)
 
     def parse(self, data: str) -> Optional[nd.DocumentNode]:
@@ -165,12 +257,36 @@ class MdParser(Parser):
             raise ThothglyphError(msg)
         tokens = list() + self.tokens
         tokens = self.p_document(tokens)
+        assert self.attrexpander is not None
+        if self.attrexpander.unresolved:
+            names = ', '.join(sorted(self.attrexpander.unresolved))
+            logger.warn('{}: undefined attrs: {}'.format(self.reader.path, names))
+        self._convert_link_slug()
         return self.rootnode
 
+    def _convert_link_slug(self) -> None:
+        # '#slug' links are converted per md document, also when it is included
+        # from another format. The auto_ids are set as SectAutoIdPass of the
+        # root reader sets them, per document read.
+        doc = self.rootnode
+        reader = self.reader
+        assert doc is not None and isinstance(reader, MdReader)
+        sections = doc.nodes_of(nd.SectionNode)
+        autoids = SectAutoIdPass(reader)
+        for n in sections:
+            autoids.visit_section(n)
+        autoids.finish(doc)
+        reader._convert_link_slug(sections, doc.nodes_of(nd.LinkNode))
+
     def _tokens(self, token: Lexer.Token, offset: int) -> Lexer.Token:
-        if self.tokens.index(token) + offset >= len(self.tokens):
+        # token.no is the index of a lexed token in self.tokens;
+        # terminators pushed by the parser (no == -1) are looked up
+        index = token.no
+        if not (0 <= index < len(self.tokens) and self.tokens[index] is token):
+            index = self.tokens.index(token)
+        if index + offset >= len(self.tokens):
             return None
-        return self.tokens[self.tokens.index(token) + offset]
+        return self.tokens[index + offset]
 
     def preprocess(self, data: str) -> str:
         self._init_config()
@@ -183,44 +299,45 @@ class MdParser(Parser):
             msg = f'{self.reader.path}:{lineno}: {msg}'
             raise ThothglyphError(msg)
         self.pplines = list()
-        tokens = list() + self.tokens
+        tokens = TokenStream(self.tokens)
         config_parsed = False
         while tokens:
-            if tokens[0].key in ('CONFIG_BEGIN_LINE', 'CONFIG_END_LINE'):
+            if tokens.peek().key in ('CONFIG_BEGIN_LINE', 'CONFIG_END_LINE'):
                 if config_parsed:
-                    self.pplines.append((tokens[0].line, tokens[0].value))
-                    tokens.pop(0)
+                    self.pplines.append((tokens.peek().line, tokens.peek().value))
+                    tokens.advance()
                 else:
                     tokens = self.p_configblock(tokens)
                     config_parsed = True
-            elif tokens[0].key == 'COMMENT':
-                if tokens[0].pos == 0:
-                    self._line_preprocessed(tokens[0])
-                tokens.pop(0)
+            elif tokens.peek().key == 'COMMENT':
+                if tokens.peek().pos == 0:
+                    self._line_preprocessed(tokens.peek())
+                tokens.advance()
                 if not config_parsed:
                     config_parsed = True
-            elif tokens[0].key == 'CONTROL_FLOW':
+            elif tokens.peek().key == 'CONTROL_FLOW':
                 tokens = self.p_controlflow(tokens)
                 if not config_parsed:
                     config_parsed = True
             else:
-                self.pplines.append((tokens[0].line, tokens[0].value))
-                if tokens[0].value.strip() != '' and not config_parsed:
+                self.pplines.append((tokens.peek().line, tokens.peek().value))
+                if tokens.peek().value.strip() != '' and not config_parsed:
                     config_parsed = True
-                tokens.pop(0)
+                tokens.advance()
         ppdata = '\n'.join(pp[1] for pp in self.pplines)
         return ppdata
 
     def _init_config(self) -> None:
-        config = nd.ConfigNode()
         if self.reader.parent:
-            pconfig = self.reader.parent.parser.rootnode.config
-            pattrs = dict(pconfig.__dict__)
-            for key in ('parent', 'children', 'id'):
-                pattrs.pop(key)
-            for key in pattrs:
-                setattr(config, key, pattrs[key])
+            config = nd.ConfigNode(base=self.reader.parent.parser.rootnode.config)
+        else:
+            config = nd.ConfigNode()
+            config.fix_attrs(self.reader.fixed_attrs)
         self.rootnode.config = config
+        # {{%name%}} is substituted in the texts of the parsed markdown, as
+        # attr values are text, not markdown
+        self.attrexpander = AttrExpander(
+            grammar.inline_tokens['ATTR'], '{{%', config.attrs, self.reader.attrnames)
 
     def _line_preprocessed(self, token: Lexer.Token) -> None:
         is_head = (token.pos == 0)
@@ -234,20 +351,21 @@ class MdParser(Parser):
             lineno, lineval = self.pplines[-1]
             self.pplines[-1] = (lineno, lineval.rstrip())
 
-    def p_configblock(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_configblock(self, tokens: TokenStream) -> TokenStream:
         config = self.rootnode.config
-        begintoken = tokens[0]
-        self._line_preprocessed(tokens[0])
-        tokens.pop(0)
+        begintoken = tokens.peek()
+        self._line_preprocessed(tokens.peek())
+        tokens.advance()
         lang = 'yaml'
         text = ''
         if begintoken.key in ('CONFIG_BEGIN_LINE', 'CONFIG_END_LINE'):
             path = None
-            if m := re.match(Lexer.preproc_tokens['CONFIG_BEGIN_LINE'], begintoken.value):
-                if m2 := re.match(r'\{include\} (\S+)(?: +(\S+))?', m.group(1)):
+            if m := grammar.preproc_tokens['CONFIG_BEGIN_LINE'].match(begintoken.value):
+                if m2 := grammar.config_include.match(m.group(1)):
                     path = m2.group(1)
                     if m2.group(2):
                         lang = m2.group(2)
+                    self._add_dependency(path)
                     if os.path.exists(path):
                         with open(path, 'r', encoding=self.reader.encoding) as f:
                             text = f.read().rstrip()
@@ -257,32 +375,31 @@ class MdParser(Parser):
                 else:
                     lang = m.group(1)
             if path is None:
-                subtokens = list()
+                begin = tokens.mark()
                 while tokens:
-                    if tokens[0].key == 'CONFIG_END_LINE':
+                    if tokens.peek().key == 'CONFIG_END_LINE':
                         break
-                    self._line_preprocessed(tokens[0])
-                    subtokens.append(tokens.pop(0))
+                    self._line_preprocessed(tokens.peek())
+                    tokens.advance()
                 else:
                     lineno = begintoken.line + 1
                     msg = 'Config block is not closed.'
                     msg = f'{self.reader.path}:{lineno}: {msg}'
                     raise ThothglyphError(msg)
-                self._line_preprocessed(tokens[0])
-                tokens.pop(0)
+                subtokens = tokens.slice(begin)
+                self._line_preprocessed(tokens.peek())
+                tokens.advance()
                 prev = begintoken
-                text = str()
+                parts: List[str] = list()
                 for token in subtokens:
                     if token.line != prev.line:
                         if prev.key != 'CONFIG_END_LINE':
-                            text += '\n'
-                        text += token.value[0:]
-                    else:
-                        text += token.value
+                            parts.append('\n')
+                    parts.append(token.value)
                     prev = token
-                text = self.replace_text_attrs(text)
+                text = self.replace_text_attrs(''.join(parts))
         try:
-            config.parse(text, lang=lang)
+            self._parse_config(config, text, lang=lang)
         except Exception as e:
             e_type, e_value, e_tb = sys.exc_info()
             # tb_depth = 0
@@ -303,60 +420,60 @@ class MdParser(Parser):
             raise ThothglyphError(msg)
         return tokens
 
-    def p_controlflow(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        match = re.match(Lexer.preproc_tokens['CONTROL_FLOW'], tokens[0].value)
+    def p_controlflow(self, tokens: TokenStream) -> TokenStream:
+        match = grammar.preproc_tokens['CONTROL_FLOW'].match(tokens.peek().value)
         assert match
         keyword, sentence = match.group(1), match.group(2)
         if keyword == 'if':
-            self._line_preprocessed(tokens[0])
-            tokens.pop(0)
-            cond = eval(sentence, {}, self.rootnode.config.attrs)
+            self._line_preprocessed(tokens.peek())
+            tokens.advance()
+            cond = self._eval_condition(sentence)
             tokens = self.p_if_else(tokens, [cond])
         else:
-            lineno = tokens[0].line + 1
+            lineno = tokens.peek().line + 1
             msg = 'Illegal ControlFlow token.'
             msg = f'{self.reader.path}:{lineno}: {msg}'
             raise ThothglyphError(msg)
         return tokens
 
-    def p_if_else(self, tokens: List[Lexer.Token], conds: List[bool]) -> List[Lexer.Token]:
-        firstflowtoken = self._tokens(tokens[0], -1) or tokens[0]
-        lastflowtoken = tokens[0]
-        lasttoken = tokens[0]
+    def p_if_else(self, tokens: TokenStream, conds: List[bool]) -> TokenStream:
+        firstflowtoken = self._tokens(tokens.peek(), -1) or tokens.peek()
+        lastflowtoken = tokens.peek()
+        lasttoken = tokens.peek()
         while tokens:
-            if tokens[0].key not in ('CONTROL_FLOW', 'COMMENT') and all(conds):
-                self.pplines.append((tokens[0].line, tokens[0].value))
-                lasttoken = tokens.pop(0)
-            elif tokens[0].key == 'CONTROL_FLOW':
-                match = re.match(Lexer.preproc_tokens['CONTROL_FLOW'], tokens[0].value)
+            if tokens.peek().key not in ('CONTROL_FLOW', 'COMMENT') and all(conds):
+                self.pplines.append((tokens.peek().line, tokens.peek().value))
+                lasttoken = tokens.advance()
+            elif tokens.peek().key == 'CONTROL_FLOW':
+                match = grammar.preproc_tokens['CONTROL_FLOW'].match(tokens.peek().value)
                 assert match
-                lastflowtoken = tokens[0]
+                lastflowtoken = tokens.peek()
                 keyword, sentence = match.group(1), match.group(2)
                 if keyword == 'end':
                     break
                 elif keyword == 'if':
-                    self._line_preprocessed(tokens[0])
-                    tokens.pop(0)
-                    conds += [all(conds) and eval(sentence, {}, self.rootnode.config.attrs)]
+                    self._line_preprocessed(tokens.peek())
+                    tokens.advance()
+                    conds += [all(conds) and self._eval_condition(sentence)]
                     tokens = self.p_if_else(tokens, conds)
-                    lasttoken = tokens[0]
+                    lasttoken = tokens.peek()
                     conds.pop()
                 elif keyword == 'elif':
-                    conds[-1] = not all(conds) and eval(sentence, {}, self.rootnode.config.attrs)
-                    self._line_preprocessed(tokens[0])
-                    lasttoken = tokens.pop(0)
+                    conds[-1] = not all(conds) and self._eval_condition(sentence)
+                    self._line_preprocessed(tokens.peek())
+                    lasttoken = tokens.advance()
                 elif keyword == 'else':
                     conds[-1] = not all(conds)
-                    self._line_preprocessed(tokens[0])
-                    lasttoken = tokens.pop(0)
+                    self._line_preprocessed(tokens.peek())
+                    lasttoken = tokens.advance()
                 else:
                     lineno = lastflowtoken.line + 1
                     msg = f'Unknown ControlFlow keyword: "{keyword}".'
                     msg = f'{self.reader.path}:{lineno}: {msg}'
                     raise ThothglyphError(msg)
             else:
-                self._line_preprocessed(tokens[0])
-                lasttoken = tokens.pop(0)
+                self._line_preprocessed(tokens.peek())
+                lasttoken = tokens.advance()
         else:
             lineno0 = firstflowtoken.line + 1
             # lineno1 = lastflowtoken.line + 1
@@ -364,14 +481,16 @@ class MdParser(Parser):
             msg = 'ControlFlow is not closed.'
             msg = f'{self.reader.path}:{lineno0}-{lineno1}: {msg}'
             raise ThothglyphError(msg)
-        self._line_preprocessed(tokens[0])
-        tokens.pop(0)
+        self._line_preprocessed(tokens.peek())
+        tokens.advance()
         return tokens
 
     def p_document(self, tokens: List[Token]) -> List[Token]:
-        logger.debug(mdit.get_all_rules())
         mdnodes = SyntaxTreeNode(tokens)
-        logger.debug(mdnodes.pretty(indent=2, show_text=True))
+        if logger.isEnabledFor(logging.DEBUG):
+            # pretty() takes longer than the parse
+            logger.debug(mdit.get_all_rules())
+            logger.debug(mdnodes.pretty(indent=2, show_text=True))
         self.p_blocks(mdnodes.children)
         return tokens
 
@@ -387,7 +506,7 @@ class MdParser(Parser):
                 self.p_descriptionlist(mdnode)
             elif mdnode.type == 'field_list':
                 self.p_fieldlist(mdnode)
-            elif mdnode.type == 'fence':
+            elif mdnode.type in ('fence', 'directive'):
                 self.p_fenceblock(mdnode)
             elif mdnode.type in ('hr', 'myst_block_break'):
                 self.p_horizon(mdnode)
@@ -446,7 +565,8 @@ class MdParser(Parser):
         for i in range(poplevel):
             self.nodes.pop()
         section = nd.SectionNode()
-        section.srcpath = os.path.abspath(self.reader.path)
+        section.srcpath = self._abspath(self.reader.path)
+        section.srcdoc = self.reader.docindex
         section.level = level
         nonum = bool(mdnode.attrs.get('nonum', ''))
         notoc = bool(mdnode.attrs.get('notoc', ''))
@@ -625,13 +745,10 @@ class MdParser(Parser):
     def p_footnotelist(self, mdnode: SyntaxTreeNode, tp: str, args: str) -> None:
         monolist = nd.FootnoteListBlockNode()
         self.nodes[-1].add(monolist)
-        data = mdnode.content
-        tokens = mdit.parse(data)
-        child_mdnodes = SyntaxTreeNode(tokens)
         self.nodes.append(monolist)
         item = None
         prev = SyntaxTreeNode()
-        for child in child_mdnodes.children[0].children:
+        for child in mdnode.children[0].children:
             if child.type == 'fieldlist_name' and prev.type != 'fieldlist_body':
                 item = nd.ListItemNode()
                 item.title = ''
@@ -648,13 +765,10 @@ class MdParser(Parser):
     def p_referencelist(self, mdnode: SyntaxTreeNode, tp: str, args: str) -> None:
         monolist = nd.ReferenceListBlockNode()
         self.nodes[-1].add(monolist)
-        data = mdnode.content
-        tokens = mdit.parse(data)
-        child_mdnodes = SyntaxTreeNode(tokens)
         self.nodes.append(monolist)
         item = None
         prev = SyntaxTreeNode()
-        for child in child_mdnodes.children[0].children:
+        for child in mdnode.children[0].children:
             if child.type == 'fieldlist_name' and prev.type != 'fieldlist_body':
                 item = nd.ListItemNode()
                 item.title = ''
@@ -673,11 +787,8 @@ class MdParser(Parser):
         fig.opts = ['']
         fig.caption = args or ''
         self.nodes[-1].add(fig)
-        data = mdnode.content
-        tokens = mdit.parse(data)
-        child_mdnodes = SyntaxTreeNode(tokens)
         self.nodes.append(fig)
-        self.p_blocks(child_mdnodes.children)
+        self.p_blocks(mdnode.children)
         self.nodes.pop()
 
     def p_literalinclude(self, mdnode: SyntaxTreeNode, tp: str, args: str) -> None:
@@ -688,6 +799,7 @@ class MdParser(Parser):
         self.nodes[-1].add(code)
         text = nd.TextNode()
         path = args
+        self._add_dependency(path)
         if os.path.exists(path):
             with open(path, 'r', encoding=self.reader.encoding) as f:
                 text.text = f.read().rstrip()
@@ -699,15 +811,10 @@ class MdParser(Parser):
     def p_include(self, mdnode: SyntaxTreeNode, tp: str, args: str) -> None:
         path = args
         if self._check_recursive_include(path):
-            _, ext = os.path.splitext(path)
-            reader: Reader = ReaderClass(ext[1:])(parent=self.reader)
-            subdoc = reader.read(path)
+            subdoc = self._read_include(path)
             lastsection = self._lastsection
-            for node, gofoward in subdoc.walk_depth():
-                if not gofoward:
-                    continue
-                if isinstance(node, nd.SectionNode):
-                    node.level += lastsection.level
+            for section in subdoc.nodes_of(nd.SectionNode):
+                section.level += lastsection.level
             p = self.nodes[-1]
             for node in subdoc.children:
                 p.add(node)
@@ -735,7 +842,7 @@ class MdParser(Parser):
             header_splitter = len(mdnode.children[0].children)
         if header_splitter < 0:
             header_splitter = 0
-        trows = mdnode.children[0].children
+        trows = list(mdnode.children[0].children)
         if len(mdnode.children) > 1:
             trows += mdnode.children[1].children
         table.type = 'normal'
@@ -868,8 +975,7 @@ class MdParser(Parser):
                 text = self.replace_text_attrs(celltext)
                 text = self._tablecell_merge(table, cell, r, c, text)
                 try:
-                    text_tokens = mdit.parse(text)
-                    text_mdnodes = SyntaxTreeNode(text_tokens)
+                    text_mdnodes = nested_trees.get(text)
                     if len(text_mdnodes.children) > 0:
                         self.nodes.append(cell)
                         self.p_inlinemarkup(text_mdnodes.children[0].children[0])
@@ -884,8 +990,7 @@ class MdParser(Parser):
         table_headers = opts.get('header-rows', '0')
         opts = self._parse_table_optargs(opts)
         # title = args or ''
-        tokens = mdit.parse(data)
-        child_mdnodes = SyntaxTreeNode(tokens)
+        child_mdnodes = nested_trees.get(data)
         table = nd.TableBlockNode()
         self.nodes[-1].add(table)
         aligns = list()
@@ -949,8 +1054,7 @@ class MdParser(Parser):
         elif mdnode.type in self.deco_keymap.keys():
             self.p_deco(mdnode)
         elif mdnode.type == 'code_inline':
-            colors = self.inline_color_deco_tokens.values()
-            if len(mdnode.content) > 0 and mdnode.content[0] in colors:
+            if mdnode.content[:1] in self.color_roles:
                 self.p_color_deco(mdnode)
             else:
                 self.p_codeinline(mdnode)
@@ -964,8 +1068,7 @@ class MdParser(Parser):
             if mdnode.type in self.deco_keymap.keys():
                 self.p_deco(mdnode)
             elif mdnode.type == 'code_inline':
-                colors = self.inline_color_deco_tokens.values()
-                if len(mdnode.content) > 0 and mdnode.content[0] in colors:
+                if mdnode.content[:1] in self.color_roles:
                     self.p_color_deco(mdnode)
                 else:
                     self.p_codeinline(mdnode)
@@ -981,16 +1084,14 @@ class MdParser(Parser):
         self.nodes.pop()
 
     def p_color_deco(self, mdnode: SyntaxTreeNode) -> None:
-        color_keys = list(self.inline_color_deco_tokens.keys())
-        color_values = list(self.inline_color_deco_tokens.values())
         deco = nd.DecorationRoleNode()
-        deco.role = color_keys[color_values.index(mdnode.content[0])]
+        deco.role = self.color_roles[mdnode.content[0]]
         self.nodes[-1].add(deco)
-        tokens = mdit.parse(mdnode.content[1:])
-        child_mdnodes = SyntaxTreeNode(tokens)
-        if len(child_mdnodes.children) > 0:
+        # the text is inline markup, stripped as a paragraph would be
+        text = mdnode.content[1:].strip()
+        if text:
             self.nodes.append(deco)
-            self.p_decotext(child_mdnodes.children[0].children[0].children)
+            self.p_decotext(inline_trees.get(text).children[0].children)
             self.nodes.pop()
 
     def p_codeinline(self, mdnode: SyntaxTreeNode) -> None:
@@ -1015,7 +1116,7 @@ class MdParser(Parser):
         link.value = mdnode.attrs['href']
         if '://' not in link.value:
             link.value = urllib.parse.unquote(link.value)
-        link.srcpath = os.path.abspath(self.reader.path)
+        link.srcpath = self._abspath(self.reader.path)
         self.nodes[-1].add(link)
 
     def p_role(self, mdnode: SyntaxTreeNode) -> None:
@@ -1071,20 +1172,8 @@ class MdParser(Parser):
         self.nodes[-1].add(link)
 
     def replace_text_attrs(self, text: str) -> str:
-        def attrvalue(m):
-            attr = m.group(1)
-            assert isinstance(self.rootnode, nd.DocumentNode)
-            if hasattr(self.rootnode.config, 'attrs'):
-                attrs = self.rootnode.config.attrs
-                return str(attrs.get(attr, m.group(0)))
-            else:
-                return m.group(0)
-
-        newtext = re.sub(
-            self.inline_tokens['ATTR'], attrvalue, text,
-            flags=re.MULTILINE | re.DOTALL
-        )
-        return newtext
+        assert self.attrexpander is not None
+        return self.attrexpander.expand(text)
 
     def p_text(self, mdnode: SyntaxTreeNode) -> None:
         text = nd.TextNode()
@@ -1121,23 +1210,18 @@ class MdReader(Reader):
         super().__init__(parent=parent, **kwargs)
         self.parser: MdParser = MdParser(self)
 
-    def read(self, path: str, encoding: Optional[str] = None) -> nd.ASTNode:
-        node = super().read(path, encoding)
-        self._convert_link_slug(node)
-        return node
-
     def _slugify(self, text):
         slug = re.sub(r'[^\w\- ]', '', text)
         slug = re.sub(r' ', '-', slug)
         slug = slug.lower()
         return slug
 
-    def _convert_link_slug(self, node: nd.ASTNode) -> None:
+    def _convert_link_slug(
+        self, sections: List[nd.SectionNode], links: List[nd.LinkNode]
+    ) -> None:
         slug_sections = list()
-        for n, gofoward in node.walk_depth():
-            if not gofoward:
-                continue
-            if isinstance(n, nd.SectionNode) and not n.id:
+        for n in sections:
+            if not n.id:
                 slug = self._slugify(n.title)
                 slug_sections.append([n, slug])
         slug_sections.sort(key=lambda x: x[1])
@@ -1153,11 +1237,8 @@ class MdReader(Reader):
                     slug_sections[i + 1][1] = new_slug
                 prev_slug = slug
         slug_table = dict([(x[1], x[0]) for x in slug_sections])
-        for n, gofoward in node.walk_depth():
-            if not gofoward:
+        for link in links:
+            if '://' in link.value:
                 continue
-            if isinstance(n, nd.LinkNode):
-                if '://' in n.value:
-                    continue
-                if n.value[1:] in slug_table:
-                    n.value = slug_table[n.value[1:]].auto_id
+            if link.value[1:] in slug_table:
+                link.value = slug_table[link.value[1:]].auto_id
@@ -1,59 +1,152 @@
 from __future__ import annotations
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
+from typing import Type, Union
+from types import CodeType
 from thothglyph.node import nd
 from thothglyph.node import logging
+from thothglyph.reader import ReaderClass
+from thothglyph.reader import doccache
+import itertools
 import os
+import re
+import time
 
 logger = logging.getLogger(__file__)
 
+Hook = Callable[[nd.ASTNode], None]
 
-class Reader():
-    target: str = 'unknown'
-    ext: str = 'unknown'
 
-    def __init__(self, parent: Optional[Reader] = None, config=None):
-        if isinstance(config, dict):
-            self.cmdargs_config = config
-        self.encoding: str = 'utf-8'
-        self.parent: Optional[Reader] = parent
-        self.parser: Parser = Parser(self)
-        self.path: str = str()
+class Pass():
+    # A post-processing pass driven by Pipeline.
+    # hooks() maps node classes to (visit, leave) callbacks which are called
+    # during the single shared traversal; finish() runs afterwards, in pass
+    # order, for work that needs the whole document.
+    # A pass may run again on a document it already processed (see
+    # incremental.IncrementalParser), so values it sets only on some nodes
+    # are cleared when visiting.
+    name: str = 'unknown'
 
-    @property
-    def root_reader(self):
-        reader = self
-        while reader.parent:
-            reader = reader.parent
-        return reader
+    def __init__(self, reader: Reader):
+        self.reader: Reader = reader
 
-    def read(self, path: str, encoding: Optional[str] = None) -> nd.ASTNode:
-        if encoding:
-            self.encoding = encoding
-        if self.parent is None:
-            logger.info('{}: read documents'.format(self.__class__.__name__))
-        self.path = path
-        with open(path, 'r', encoding=self.encoding) as f:
-            data = f.read()
-        node = self.parser.parse(data)
-        self.set_sect_auto_id(node)
-        self.set_sect_src_id(node)
-        self.set_sectnums(node)
-        self.set_footnote_nums(node)
-        self.merge_tablecell_text(node)
-        return node
+    def hooks(self) -> Dict[type, Tuple[Optional[Hook], Optional[Hook]]]:
+        return dict()
+
+    def finish(self, rootnode: nd.DocumentNode) -> None:
+        pass
+
+
+class Pipeline():
+    def __init__(self, passes: List[Pass]):
+        self.passes: List[Pass] = passes
+        self.timings: Dict[str, float] = dict([(p.name, 0.0) for p in passes])
+        self.walktime: float = 0.0
 
-    def set_sect_auto_id(self, rootnode: nd.ASTNode) -> None:
-        auto_id_sections = list()
+    def _dispatch_table(self) -> Dict[type, Tuple[List[Tuple[str, Hook]], ...]]:
+        # node class -> (visit hooks, leave hooks), subclasses resolved lazily in run()
+        table: Dict[type, Tuple[List[Tuple[str, Hook]], ...]] = dict()
+        for p in self.passes:
+            for cls, (visit, leave) in p.hooks().items():
+                table.setdefault(cls, (list(), list()))
+                if leave:
+                    table[cls][0].append((p.name, leave))
+                if visit:
+                    table[cls][1].append((p.name, visit))
+        return table
+
+    def run(self, rootnode: nd.DocumentNode) -> None:
+        table = self._dispatch_table()
+        hooktable: Dict[type, Tuple[List[Tuple[str, Hook]], ...]] = dict()
+        timings = self.timings
+        clock = time.perf_counter
+        t0 = clock()
         for n, gofoward in rootnode.walk_depth():
-            if not gofoward:
-                continue
-            if isinstance(n, nd.SectionNode):
-                n_abspath = os.path.abspath(n.srcpath)
-                root_abspath = os.path.abspath(rootnode.srcpath)
-                if not n.id and n_abspath == root_abspath:
-                    # auto_id = "#" + n.title.replace(' ', '_')
-                    auto_id = n.title.replace(' ', '_')
-                    auto_id_sections.append([n, auto_id])
+            ncls = n.__class__
+            if ncls not in hooktable:
+                # keep the pass order within each direction
+                merged: Tuple[List[Tuple[str, Hook]], ...] = (list(), list())
+                for c in reversed(ncls.__mro__):
+                    if c in table:
+                        merged[0].extend(table[c][0])
+                        merged[1].extend(table[c][1])
+                order = [p.name for p in self.passes]
+                for hooks in merged:
+                    hooks.sort(key=lambda h: order.index(h[0]))
+                hooktable[ncls] = merged
+            for name, hook in hooktable[ncls][gofoward]:
+                t = clock()
+                hook(n)
+                timings[name] += clock() - t
+        self.walktime = clock() - t0 - sum(timings.values())
+        for p in self.passes:
+            t = clock()
+            p.finish(rootnode)
+            timings[p.name] += clock() - t
+
+    def report(self) -> str:
+        lines = ['{:<16} {:8.2f} ms'.format('(traversal)', self.walktime * 1000)]
+        for name, t in self.timings.items():
+            lines.append('{:<16} {:8.2f} ms'.format(name, t * 1000))
+        return '\n  '.join(lines)
+
+
+class TextMergePass(Pass):
+    name = 'text_merge'
+
+    # Inline parsing emits a TextNode per lexer fragment; runs of adjacent
+    # TextNodes are merged into the first node of the run, joined once.
+    def hooks(self):
+        return {nd.ASTNode: (self.visit_node, None)}
+
+    def visit_node(self, n: nd.ASTNode) -> None:
+        # runs before the walk enters the children of n
+        children = n.children
+        if len(children) < 2:
+            return
+        result: List[nd.ASTNode] = list()
+        head: Optional[nd.TextNode] = None  # the TextNode the run is merged into
+        texts: List[str] = list()  # texts of the run
+        for child in children:
+            if type(child) is not nd.TextNode:
+                if head is not None and len(texts) > 1:
+                    head.text = ''.join(texts)
+                head = None
+                result.append(child)
+            elif head is None:
+                head, texts = child, [child.text]
+                result.append(child)
+            else:
+                texts.append(child.text)
+        if len(result) == len(children):
+            return
+        if head is not None and len(texts) > 1:
+            head.text = ''.join(texts)
+        n.splice(0, len(children), result)
+
+
+class SectAutoIdPass(Pass):
+    name = 'sect_auto_id'
+
+    def __init__(self, reader: Reader):
+        super().__init__(reader)
+        # auto ids are unique per document read (SectionNode.srcdoc)
+        self.auto_id_sections: Dict[int, List[List]] = dict()
+
+    def hooks(self):
+        return {nd.SectionNode: (self.visit_section, None)}
+
+    def visit_section(self, n: nd.SectionNode) -> None:
+        n.auto_id = str()
+        if not n.id:
+            # auto_id = "#" + n.title.replace(' ', '_')
+            auto_id = n.title.replace(' ', '_')
+            self.auto_id_sections.setdefault(n.srcdoc, list()).append([n, auto_id])
+
+    def finish(self, rootnode: nd.DocumentNode) -> None:
+        for auto_id_sections in self.auto_id_sections.values():
+            self._set_auto_ids(auto_id_sections)
+
+    def _set_auto_ids(self, auto_id_sections: List[List]) -> None:
         auto_id_sections.sort(key=lambda x: x[1])
         if len(auto_id_sections) > 1:
             prev_auto_id = auto_id_sections[0][1]
@@ -68,70 +161,142 @@ class Reader():
                     n.auto_id = new_auto_id
                 prev_auto_id = auto_id
 
-    def set_sect_src_id(self, rootnode: nd.ASTNode) -> None:
-        src_relpaths = list()
-        for n, gofoward in rootnode.walk_depth():
-            if not gofoward:
-                continue
-            if isinstance(n, nd.SectionNode):
-                if n.src_relpath not in src_relpaths:
-                    src_relpaths.append(n.src_relpath)
-        for n, gofoward in rootnode.walk_depth():
-            if not gofoward:
-                continue
-            if isinstance(n, nd.SectionNode):
-                src_id = src_relpaths.index(n.src_relpath)
-                n.src_id = src_id
 
-    def set_sectnums(self, rootnode: nd.ASTNode) -> None:
-        nums: List[int] = [0 for i in range(10)]
-        level: int = 0
-        for n, gofoward in rootnode.walk_depth():
-            if gofoward:
-                if isinstance(n, nd.SectionNode):
-                    if not n.opts.get('notoc') and not n.opts.get('nonum'):
-                        nums[level] += 1
-                        n._sectindex = [i - 1 for i in nums[:level + 1]]
-                    level += 1
+class SectSrcIdPass(Pass):
+    name = 'sect_src_id'
+
+    def __init__(self, reader: Reader):
+        super().__init__(reader)
+        self.src_ids: Dict[str, int] = dict()
+
+    def hooks(self):
+        return {nd.SectionNode: (self.visit_section, None)}
+
+    def visit_section(self, n: nd.SectionNode) -> None:
+        relpath = n.src_relpath
+        if relpath not in self.src_ids:
+            self.src_ids[relpath] = len(self.src_ids)
+        n.src_id = self.src_ids[relpath]
+
+
+class SectNumPass(Pass):
+    name = 'sectnums'
+
+    def __init__(self, reader: Reader):
+        super().__init__(reader)
+        # numbered sections count up from 0, 'nonum' sections down from -1
+        self.nums: List[int] = [0 for i in range(10)]
+        self.nonums: List[int] = [0 for i in range(10)]
+        self.level: int = 0
+
+    def hooks(self):
+        return {nd.SectionNode: (self.visit_section, self.leave_section)}
+
+    def visit_section(self, n: nd.SectionNode) -> None:
+        level = self.level
+        if not n.opts.get('notoc'):
+            if not n.opts.get('nonum'):
+                self.nums[level] += 1
+                n._sectindex = [i - 1 for i in self.nums[:level + 1]]
             else:
-                if isinstance(n, nd.SectionNode):
-                    if not n.opts.get('notoc') and not n.opts.get('nonum'):
-                        nums[level] = 0
-                    level -= 1
-        nums = [0 for i in range(10)]
-        level = 0
-        for n, gofoward in rootnode.walk_depth():
-            if gofoward:
-                if isinstance(n, nd.SectionNode):
-                    if not n.opts.get('notoc') and n.opts.get('nonum'):
-                        nums[level] += 1
-                        n._sectindex = [-i - 1 for i in nums[:level + 1]]
-                    level += 1
+                self.nonums[level] += 1
+                n._sectindex = [-i - 1 for i in self.nonums[:level + 1]]
+        self.level += 1
+
+    def leave_section(self, n: nd.SectionNode) -> None:
+        if not n.opts.get('notoc'):
+            if not n.opts.get('nonum'):
+                self.nums[self.level] = 0
             else:
-                if isinstance(n, nd.SectionNode):
-                    if not n.opts.get('notoc') and n.opts.get('nonum'):
-                        nums[level] = 0
-                    level -= 1
+                self.nonums[self.level] = 0
+        self.level -= 1
+
+
+class FigNumPass(Pass):
+    name = 'fignums'
+
+    def __init__(self, reader: Reader):
+        super().__init__(reader)
+        # counts[0]: figures, counts[1]: table figures, counts[2]: captioned tables
+        self.gcounts: List[int] = [0, 0, 0]
+        self.lcounts: List[List[int]] = [[0, 0, 0]]  # per open section
+
+    def hooks(self):
+        return {
+            nd.SectionNode: (self.visit_section, self.leave_section),
+            nd.FigureBlockNode: (self.visit_figure, None),
+            nd.TableBlockNode: (self.visit_table, None),
+        }
+
+    def visit_section(self, n: nd.SectionNode) -> None:
+        self.lcounts.append([0, 0, 0])
+
+    def leave_section(self, n: nd.SectionNode) -> None:
+        self.lcounts.pop()
+
+    def visit_figure(self, n: nd.FigureBlockNode) -> None:
+        kinds = [0]
+        if n.children and isinstance(n.children[0], nd.TableBlockNode):
+            kinds.append(1)
+        self._count(n, kinds)
+
+    def visit_table(self, n: nd.TableBlockNode) -> None:
+        if n.caption is not None:
+            self._count(n, [2])
+
+    def _count(self, n: Union[nd.FigureBlockNode, nd.TableBlockNode], kinds: List[int]) -> None:
+        for k in kinds:
+            self.gcounts[k] += 1
+            for counts in self.lcounts:
+                counts[k] += 1
+        k = kinds[-1]
+        n._fignum = (self.gcounts[k], self.lcounts[-1][k])
+
+
+class FootnoteNumPass(Pass):
+    name = 'footnote_nums'
+
+    def __init__(self, reader: Reader):
+        super().__init__(reader)
+        self.fn_nodes: List[nd.FootnoteNode] = list()
+        self.fn_items: List[nd.ListItemNode] = list()
+        self.ref_nodes: List[nd.ReferenceNode] = list()
+        self.ref_items: List[nd.ListItemNode] = list()
+
+    def hooks(self):
+        return {
+            nd.FootnoteNode: (self.visit_footnote, None),
+            nd.ReferenceNode: (self.ref_nodes.append, None),
+            nd.ListItemNode: (self.visit_listitem, None),
+        }
+
+    def visit_footnote(self, n: nd.FootnoteNode) -> None:
+        n._description = None
+        self.fn_nodes.append(n)
+
+    def visit_listitem(self, n: nd.ListItemNode) -> None:
+        if hasattr(n, '_description'):
+            del n._description
+        if isinstance(n.parent, nd.FootnoteListBlockNode):
+            self.fn_items.append(n)
+        elif isinstance(n.parent, nd.ReferenceListBlockNode):
+            self.ref_items.append(n)
 
-    def set_footnote_nums(self, rootnode: nd.ASTNode) -> None:
+    def finish(self, rootnode: nd.DocumentNode) -> None:
         footnotes: Dict[str, Dict[str, List[nd.ASTNode]]] = dict()  # footnotes[sect][id]
         references: Dict[str, List[nd.ASTNode]] = dict()
         LI = nd.ListItemNode
-        FNLB = nd.FootnoteListBlockNode
-        RFLB = nd.ReferenceListBlockNode
         # Footnote
-        for n, gofoward in rootnode.walk_depth():
-            if gofoward and isinstance(n, nd.FootnoteNode):
-                sect = str(n.treeindex()[:2])
-                footnotes.setdefault(sect, dict())
-                footnotes[sect].setdefault(n.value, list())
-                footnotes[sect][n.value].append(n)
-        for n, gofoward in rootnode.walk_depth():
-            if gofoward and isinstance(n, LI) and isinstance(n.parent, FNLB):
-                sect = str(n.treeindex()[:2])
-                footnotes.setdefault(sect, dict())
-                footnotes[sect].setdefault(n.title, list())
-                footnotes[sect][n.title].insert(0, n)
+        for fn in self.fn_nodes:
+            sect = str(fn.treeindex()[:2])
+            footnotes.setdefault(sect, dict())
+            footnotes[sect].setdefault(fn.value, list())
+            footnotes[sect][fn.value].append(fn)
+        for item in self.fn_items:
+            sect = str(item.treeindex()[:2])
+            footnotes.setdefault(sect, dict())
+            footnotes[sect].setdefault(item.title, list())
+            footnotes[sect][item.title].insert(0, item)
         fngi: int = 0
         for si, sect in enumerate(footnotes):
             for i, key in enumerate(footnotes[sect]):
@@ -143,25 +308,30 @@ class Reader():
                     for n in footnotes[sect][key][1:]:
                         n._description = footnotes[sect][key][0]
         # Reference
-        for n, gofoward in rootnode.walk_depth():
-            if gofoward and isinstance(n, LI) and isinstance(n.parent, RFLB):
-                references.setdefault(n.title, list())
-                references[n.title].append(n)
-        for n, gofoward in rootnode.walk_depth():
-            if gofoward and isinstance(n, nd.ReferenceNode):
-                references.setdefault(n.value, list())
-                references[n.value].append(n)
+        for item in self.ref_items:
+            references.setdefault(item.title, list())
+            references[item.title].append(item)
+        for ref in self.ref_nodes:
+            references.setdefault(ref.value, list())
+            references[ref.value].append(ref)
         for i, key in enumerate(references):
             for n in references[key]:
                 n.ref_num = i + 1
 
-    def merge_tablecell_text(self, rootnode: nd.ASTNode) -> None:
-        tables = []
-        for n, gofoward in rootnode.walk_depth():
-            if not gofoward and isinstance(n, nd.TableBlockNode):
-                tables.append(n)
+
+class TableCellMergePass(Pass):
+    name = 'tablecell_merge'
+
+    def __init__(self, reader: Reader):
+        super().__init__(reader)
+        self.tables: List[nd.TableBlockNode] = list()
+
+    def hooks(self):
+        return {nd.TableBlockNode: (self.tables.append, None)}
+
+    def finish(self, rootnode: nd.DocumentNode) -> None:
         mergelist = {}
-        for table in tables:
+        for table in self.tables:
             for cell in table.cells():
                 if cell.mergeto:
                     mergelist.setdefault(cell.mergeto, {'obj': cell.mergeto, 'from': list()})
@@ -185,15 +355,279 @@ class Reader():
                 cell.add(paragraph)
 
 
+class LinkTargetPass(Pass):
+    name = 'link_targets'
+
+    def __init__(self, reader: Reader):
+        super().__init__(reader)
+        self.links: List[nd.LinkNode] = list()
+
+    def hooks(self):
+        return {nd.LinkNode: (self.links.append, None)}
+
+    def finish(self, rootnode: nd.DocumentNode) -> None:
+        rootnode.sectiontable = nd.SectionTable(rootnode)
+        if self.reader.parent is not None:
+            return
+        unresolved: List[str] = list()
+        for n in self.links:
+            if '://' not in n.value:
+                try:
+                    sect = n.target_section
+                except ValueError:
+                    # the target path is not under the root document's directory
+                    sect = None
+                if sect is None:
+                    unresolved.append('{}: {}'.format(n.srcpath, n.value))
+        if unresolved:
+            msg = 'Link targets not found:\n  ' + '\n  '.join(unresolved)
+            logger.warn(msg)
+
+
+class Reader():
+    target: str = 'unknown'
+    ext: str = 'unknown'
+    # post-processing passes run by postprocess(), in order
+    passes: List[Type[Pass]] = [
+        TextMergePass, SectAutoIdPass, SectSrcIdPass, SectNumPass, FigNumPass,
+        FootnoteNumPass, TableCellMergePass, LinkTargetPass,
+    ]
+
+    def __init__(self, parent: Optional[Reader] = None, config=None):
+        if isinstance(config, dict):
+            self.cmdargs_config = config
+        self.encoding: str = 'utf-8'
+        self.parent: Optional[Reader] = parent
+        self.parser: Parser = Parser(self)
+        self.path: str = str()
+        # Included documents are only parsed; the root reader post-processes
+        # the whole document once after they are spliced in.
+        self.parse_only: bool = parent is not None
+        # Numbers every document read in this build, the same file included
+        # twice gets two numbers.
+        self.docindex: int = 0
+        self.ndocs: int = 1
+        if parent:
+            root = self.root_reader
+            self.docindex = root.ndocs
+            root.ndocs += 1
+        # Parsed-document cache, see doccache.read(). deps, attrnames and
+        # cacheable describe what the parse of this document depended on.
+        self.cachedir: Optional[str] = None
+        # attrs set by the build, which config blocks do not override
+        self.fixed_attrs: Dict[str, Any] = dict()
+        if isinstance(config, dict):
+            self.cachedir = config.get('cachedir')
+            self.fixed_attrs = dict(config.get('attrs') or dict())
+        self.deps: Dict[str, Optional[str]] = dict()
+        self.attrnames: Set[str] = set()
+        self.cacheable: bool = True
+
+    @property
+    def root_reader(self):
+        reader = self
+        while reader.parent:
+            reader = reader.parent
+        return reader
+
+    def read(self, path: str, encoding: Optional[str] = None) -> nd.ASTNode:
+        if encoding:
+            self.encoding = encoding
+        if self.parent is None:
+            logger.info('{}: read documents'.format(self.__class__.__name__))
+        self.path = path
+        with open(path, 'r', encoding=self.encoding) as f:
+            data = f.read()
+        node = self.parser.parse(data)
+        assert isinstance(node, nd.DocumentNode)
+        if not self.parse_only:
+            self.postprocess(node)
+        if self.parent is None:
+            pathcache = node.pathcache
+            logger.debug('path cache: {} lookups, {} reused'.format(
+                pathcache.misses, pathcache.hits))
+            documentcache = doccache.documentcache
+            logger.debug('document cache: {} hits, {} misses'.format(
+                documentcache.hits, documentcache.misses))
+        return node
+
+    def postprocess(self, rootnode: nd.DocumentNode) -> None:
+        pipeline = Pipeline([cls(self) for cls in self.passes])
+        pipeline.run(rootnode)
+        logger.debug('{}: post-processing {}\n  {}'.format(
+            self.__class__.__name__, self.path, pipeline.report()))
+
+
+class TokenStream():
+    # A cursor over a list of lexer tokens for the recursive-descent parsers.
+    # Consuming from the front is O(1); a consumed slot may be reused by push().
+    def __init__(self, tokens: Optional[Iterable] = None):
+        self._tokens: List = list(tokens) if tokens is not None else list()
+        self._pos: int = 0
+
+    def __bool__(self) -> bool:
+        return self._pos < len(self._tokens)
+
+    def __len__(self) -> int:
+        return len(self._tokens) - self._pos
+
+    def __iter__(self) -> Iterator:
+        # the remaining tokens, without consuming them
+        return itertools.islice(self._tokens, self._pos, None)
+
+    def peek(self, offset: int = 0):
+        return self._tokens[self._pos + offset]
+
+    def advance(self):
+        token = self._tokens[self._pos]
+        self._pos += 1
+        return token
+
+    def push(self, token) -> None:
+        # puts token in front of the remaining tokens
+        if self._pos > 0:
+            self._pos -= 1
+            self._tokens[self._pos] = token
+        else:
+            self._tokens.insert(0, token)
+
+    def append(self, token) -> None:
+        self._tokens.append(token)
+
+    def mark(self) -> int:
+        return self._pos
+
+    def seek(self, pos: int) -> None:
+        # moves the cursor to a mark
+        self._pos = pos
+
+    def slice(self, begin: int, end: Optional[int] = None) -> TokenStream:
+        # the tokens between two marks (end defaults to the current position)
+        end = self._pos if end is None else end
+        return TokenStream(self._tokens[begin:end])
+
+
+class AttrExpander():
+    # Substitutes the attr references of a syntax (e.g. ⁅name⁆, whose group 1
+    # is the name) with str() of the values of an attrs dict. The dict is read
+    # when a text is expanded, so attrs set later (e.g. by the config block of
+    # an included document) apply to the texts after them.
+    # A backslash directly before a reference keeps it literally (\⁅name⁆),
+    # two backslashes are one backslash before the value (C:\dir\\⁅name⁆);
+    # other backslashes are left as they are.
+    # Names without a value are left in place and collected in unresolved;
+    # every name looked up is added to names (e.g. the reader's attrnames).
+    def __init__(self, pattern: re.Pattern, opener: str, attrs: Dict[str, Any],
+                 names: Optional[Set[str]] = None):
+        self.opener: str = opener
+        # split() yields: text, escape, reference, name, text, ...
+        self.splitter: re.Pattern = re.compile(r'(\\\\|\\)?(' + pattern.pattern + ')')
+        self.attrs: Dict[str, Any] = attrs
+        self.unresolved: Set[str] = set()
+        self.names: Set[str] = names if names is not None else set()
+
+    def expand(self, text: str) -> str:
+        if self.opener not in text:
+            return text
+        parts = self.splitter.split(text)
+        attrs = self.attrs
+        for i in range(1, len(parts), 4):
+            escape, reference, name = parts[i:i + 3]
+            if escape == '\\':
+                parts[i] = ''
+                parts[i + 2] = ''
+                continue
+            parts[i] = escape[:1] if escape else ''
+            self.names.add(name)
+            if name in attrs:
+                parts[i + 1] = str(attrs[name])
+            else:
+                self.unresolved.add(name)
+            parts[i + 2] = ''
+        return ''.join(parts)
+
+
+class ExprCache():
+    # Compiled preprocessor expressions (⑇if/⑇elif conditions), shared by all
+    # parsers of the process and keyed by the expression string. names are
+    # the names an expression looks up, i.e. the attrs a condition reads.
+    def __init__(self):
+        self.exprs: Dict[str, Tuple[CodeType, FrozenSet[str]]] = dict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def compile(self, expr: str) -> Tuple[CodeType, FrozenSet[str]]:
+        # raises SyntaxError for an invalid expression
+        expr = expr.strip()
+        compiled = self.exprs.get(expr)
+        if compiled is not None:
+            self.hits += 1
+            return compiled
+        self.misses += 1
+        code = compile(expr, '<expr>', 'eval')
+        names: Set[str] = set()
+        codes = [code]
+        while codes:
+            c = codes.pop()
+            names.update(c.co_names)
+            codes.extend([k for k in c.co_consts if isinstance(k, CodeType)])
+        compiled = (code, frozenset(names))
+        self.exprs[expr] = compiled
+        return compiled
+
+
+exprcache = ExprCache()
+
+
+def expr_names(expr: str) -> Set[str]:
+    # Names an expression looks up, e.g. the attrs read by a control-flow condition.
+    try:
+        return set(exprcache.compile(expr)[1])
+    except SyntaxError:
+        return set()
+
+
 class Parser():
+    rootnode: Optional[nd.DocumentNode]
+
     def __init__(self, reader: Reader):
         self.reader = reader
 
     def parse(self, data: str) -> nd.ASTNode:
         return nd.ASTNode()
 
+    def _read_include(self, path: str) -> nd.DocumentNode:
+        _, ext = os.path.splitext(path)
+        reader: Reader = ReaderClass(ext[1:])(parent=self.reader)
+        return doccache.read(reader, path)
+
+    def _add_dependency(self, path: str) -> None:
+        # Records a file read by the parser, for the parsed-document cache.
+        abspath = os.path.abspath(path)
+        self.reader.deps[abspath] = doccache.filedigest(abspath)
+
+    def _abspath(self, path: str) -> str:
+        # memoized in the path cache shared with the included documents
+        assert self.rootnode is not None
+        return self.rootnode.pathcache.abspath(path)
+
+    def _parse_config(self, config: nd.ConfigNode, text: str, lang: Optional[str] = None) -> None:
+        # A config which runs outside code (cmd(), ...) may give other values
+        # in another build, so the parse of the document is not cached.
+        if not config.parse(text, lang=lang):
+            self.reader.cacheable = False
+
+    def _eval_condition(self, expr: str) -> Any:
+        # Evaluates a control-flow condition with the attrs of the document
+        # and records the names it reads; the preprocessed lines depend on them.
+        assert self.rootnode is not None
+        code, names = exprcache.compile(expr)
+        self.reader.attrnames |= names
+        return eval(code, {}, self.rootnode.config.attrs)
+
     def _check_recursive_include(self, path: str) -> bool:
         if not os.path.exists(path):
+            self._add_dependency(path)
             return False
         pathlist: List[str] = list()
         parser: Parser = self
@@ -202,6 +636,8 @@ class Parser():
             parser = parser.reader.parent.parser
         pathlist.insert(0, parser.reader.path)
         if path in pathlist:
+            # the result depends on the include chain, do not cache it
+            self.reader.cacheable = False
             # msg = 'Detect recursive include'
             # raise ThothglyphError("{}: {}, {}".format(msg, path, pathlist))
             return False
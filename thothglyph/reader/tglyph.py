@@ -1,13 +1,20 @@
 from __future__ import annotations
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Mapping, Optional, Set, Tuple
 from thothglyph.error import ThothglyphError
-from thothglyph.reader import ReaderClass
-from thothglyph.reader.reader import Reader, Parser
+from thothglyph.reader.reader import Reader, Parser, TokenStream, AttrExpander
 from thothglyph.node import nd
+from types import MappingProxyType
+import contextlib
 import re
 import os
 import sys
 import traceback
+try:
+    from re import _parser as sre_parse  # type: ignore
+    from re import _constants as sre_constants  # type: ignore
+except ImportError:  # Python < 3.11
+    import sre_parse  # type: ignore
+    import sre_constants  # type: ignore
 
 from thothglyph.node import logging
 
@@ -111,22 +118,70 @@ class Lexer():
         'LINEBREAK': r'↲',
     } | inline_color_deco_tokens | inline_deco_tokens
 
+    class TokenTable():
+        # A token dict compiled for Lexer.lex_pattern().
+        # Every match of most patterns contains one of a few characters
+        # (see _required_literals()). One findall() of those characters tells
+        # which patterns can match a fragment at all; only those are searched.
+        # Patterns anchored with '^' are also dispatched on the first
+        # non-space character of the fragment (see _first_chars()), so that
+        # e.g. TABLE_LINE is not tried on a paragraph line containing '|'.
+        def __init__(self, tokens: Dict[str, str]):
+            self.keys: Tuple[str, ...] = tuple(tokens.keys())
+            self.patterns: Tuple[re.Pattern, ...] = tuple(re.compile(v) for v in tokens.values())
+            self.anymask: int = 0  # patterns that may match without a known character
+            self.charmasks: Dict[str, int] = dict()
+            for i, pattern in enumerate(tokens.values()):
+                literals = _required_literals(pattern)
+                if not literals:
+                    self.anymask |= 1 << i
+                for c in literals:
+                    self.charmasks[c] = self.charmasks.get(c, 0) | 1 << i
+            chars = ''.join(sorted(self.charmasks))
+            self.charpattern: re.Pattern = re.compile('[{}]'.format(re.escape(chars)))
+            # first non-space character -> patterns that may match
+            anchored: Dict[int, Set[str]] = dict()
+            for i, pattern in enumerate(tokens.values()):
+                firsts = _first_chars(pattern)
+                if firsts is not None:
+                    anchored[i] = firsts
+            allmask = (1 << len(self.keys)) - 1
+            self.othermask: int = allmask  # for a character no anchored pattern starts with
+            for i in anchored:
+                self.othermask &= ~(1 << i)
+            self.firstmasks: Dict[str, int] = dict()
+            for i, firsts in anchored.items():
+                for c in firsts:
+                    self.firstmasks[c] = self.firstmasks.get(c, self.othermask) | 1 << i
+            # line -> (pos, key, value) of its tokens, while lines are shared
+            # (see Grammar.shared_lines())
+            self.memo: Optional[Dict[str, Tuple[Tuple[int, str, str], ...]]] = None
+
+        def match(self, text: str) -> Tuple[str, Optional[re.Match]]:
+            # The first pattern (in priority order) found anywhere in text,
+            # with its leftmost match, or ('', None).
+            mask = self.anymask
+            chars = self.charpattern.findall(text)
+            if chars:
+                charmasks = self.charmasks
+                for c in set(chars):
+                    mask |= charmasks[c]
+            mask &= self.firstmasks.get(text.lstrip(' ')[:1], self.othermask)
+            while mask:
+                bit = mask & -mask
+                i = bit.bit_length() - 1
+                m = self.patterns[i].search(text)
+                if m:
+                    return self.keys[i], m
+                mask ^= bit
+            return '', None
+
     def __init__(self):
-        self._preproc_tokens: Dict[str, re.Pattern] = {
-            k: re.compile(v) for k, v in self.preproc_tokens.items()
-        }
-        self._block_tokens: Dict[str, re.Pattern] = {
-            k: re.compile(v) for k, v in self.block_tokens.items()
-        }
-        self._inline_color_deco_tokens: Dict[str, re.Pattern] = {
-            k: re.compile(v) for k, v in self.inline_color_deco_tokens.items()
-        }
-        self._inline_deco_tokens: Dict[str, re.Pattern] = {
-            k: re.compile(v) for k, v in self.inline_deco_tokens.items()
-        }
-        self._inline_tokens: Dict[str, re.Pattern] = {
-            k: re.compile(v) for k, v in self.inline_tokens.items()
-        }
+        # the tables are compiled once per process (see Grammar)
+        self._preproc_tokens: Lexer.TokenTable = grammar.preproc_table
+        self._block_tokens: Lexer.TokenTable = grammar.block_table
+        self._inline_tokens: Lexer.TokenTable = grammar.inline_table
+        self._inline_deco_tokens: Lexer.TokenTable = grammar.inline_deco_table
 
     def lex_preproc(self, data: str) -> List[Lexer.Token]:
         return self.lex_pattern(self._preproc_tokens, data)
@@ -135,64 +190,197 @@ class Lexer():
         return self.lex_pattern(self._block_tokens, data)
 
     def lex_inline_deco(self, data: str, begin=1) -> List[Lexer.Token]:
-        deco_tokens = {'DECO_END': self._inline_tokens['DECO_END']}
-        deco_tokens = deco_tokens | self._inline_color_deco_tokens | self._inline_deco_tokens
-        return self.lex_pattern(deco_tokens, data, begin=begin)
+        return self.lex_pattern(self._inline_deco_tokens, data, begin=begin)
 
     def lex_inline(self, data: str, begin=1) -> List[Lexer.Token]:
         return self.lex_pattern(self._inline_tokens, data, begin=begin)
 
-    def lex_pattern(self, patterns, data: str | List[Tuple[int, str]], begin=0
+    def lex_pattern(self, table: Lexer.TokenTable, data: str | List[Tuple[int, str]], begin=0
                     ) -> List[Lexer.Token]:
+        # Tokens are found by priority, not left to right: the first pattern
+        # of the table that matches anywhere in a line splits it at its
+        # leftmost match, and the text before and after is lexed the same
+        # way as separate fragments ('^' and '$' match at fragment edges).
         tokens: List[Lexer.Token] = list()
         if isinstance(data, str):
             lines = data.split(self.newline_token)
             lines_ite = enumerate(lines)
         else:
             lines_ite = data
+        debug = logger.isEnabledFor(logging.DEBUG)
+        Token = Lexer.Token
+        memo = table.memo
         for lineno, line in lines_ite:
-            rest = line
+            lno = lineno + begin
+            if memo is not None and line in memo:
+                for pos, key, value in memo[line]:
+                    tokens.append(Token(len(tokens), lno, pos, key, value))
+                continue
+            key, m = table.match(line)
+            if m is not None and m.start() == 0 and m.end() == len(line):
+                # the whole line is one token, as most paragraph lines are
+                token = Token(len(tokens), lno, 0, key, line)
+                if debug:
+                    logger.debug(token)
+                tokens.append(token)
+                if memo is not None:
+                    memo[line] = ((0, key, line),)
+                continue
             rests: List[Tuple[int, str]] = [(0, line)]
             linetokens: List[Lexer.Token] = list()
             while rests:
-                for key, pattern in patterns.items():
-                    newrests: List[Tuple[int, str]] = list()
-                    matched = False
-                    for rest in rests:
-                        bpos, text = rest
-                        m = pattern.search(text)
-                        if m:
-                            matched = True
-                            no = -1
-                            lno = lineno + begin
-                            pos = bpos + m.start()
-                            linetokens.append(
-                                Lexer.Token(no, lno, pos, key, m.group(0))
-                            )
-                            logger.debug(linetokens[-1])
-                            subtexts = text[:m.start()], text[m.end():]
-                            if len(subtexts[0]) > 0:
-                                newrests.append((bpos, subtexts[0]))
-                            if len(subtexts[1]) > 0:
-                                newrests.append((bpos + m.end(), subtexts[1]))
-                        else:
-                            newrests.append((bpos, text))
-                    rests = newrests
-                    if matched:
-                        break
+                bpos, text = rests.pop()
+                if linetokens:
+                    key, m = table.match(text)
+                if m is None or (m.end() == 0 and text):
+                    # nothing matches, or a match that consumes nothing
+                    raise ThothglyphError(lineno, line, [(bpos, text)])
+                linetokens.append(Token(-1, lno, bpos + m.start(), key, m.group(0)))
+                if debug:
+                    logger.debug(linetokens[-1])
+                if m.end() < len(text):
+                    rests.append((bpos + m.end(), text[m.end():]))
+                if m.start() > 0:
+                    rests.append((bpos, text[:m.start()]))
             linetokens.sort(key=lambda t: t.pos)
             for i, token in enumerate(linetokens):
                 token.no = len(tokens) + i
-            if all([
-                len(rests) > 0,
-                len(rests) == len(newrests),
-                all([rests[i] == newrests[i] for i in range(len(rests))])
-            ]):
-                raise ThothglyphError(lineno, line, rests)
             tokens.extend(linetokens)
+            if memo is not None:
+                memo[line] = tuple([(t.pos, t.key, t.value) for t in linetokens])
         return tokens
 
 
+def _union(sets: List[Optional[Set[str]]]) -> Optional[Set[str]]:
+    # the union of sets, or None if one of them is unknown or empty
+    known = [s for s in sets if s]
+    if len(known) != len(sets):
+        return None
+    return set().union(*known)
+
+
+def _required_literals(pattern: str) -> Tuple[str, ...]:
+    # Characters of which every match of pattern contains at least one,
+    # or () if unknown. Spaces are ignored as they are in most lines.
+    def required(subpattern) -> Optional[Set[str]]:
+        for op, av in subpattern:
+            chars: Optional[Set[str]] = None
+            if op is sre_constants.LITERAL:
+                chars = {chr(av)} if chr(av) != ' ' else None
+            elif op is sre_constants.SUBPATTERN:
+                chars = required(av[-1])
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] > 0:
+                chars = required(av[2])
+            elif op is sre_constants.BRANCH:
+                chars = _union([required(branch) for branch in av[1]])
+            if chars:
+                return chars
+        return None
+
+    return tuple(sorted(required(sre_parse.parse(pattern)) or ()))
+
+
+def _first_chars(pattern: str) -> Optional[Set[str]]:
+    # The characters a match of a '^' anchored pattern can start with,
+    # leading spaces skipped ('' for a match of spaces only),
+    # or None if pattern is not anchored or not understood.
+    def firsts(items) -> Optional[Set[str]]:
+        if not items:
+            return {''}
+        op, av = items[0]
+        if op is sre_constants.LITERAL:
+            return {chr(av)} if chr(av) != ' ' else None
+        elif op is sre_constants.AT and av is sre_constants.AT_END:
+            return {''}
+        elif op is sre_constants.SUBPATTERN:
+            chars = firsts(list(av[-1]))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] > 0:
+            chars = firsts(list(av[2]))
+        elif op is sre_constants.BRANCH:
+            chars = _union([firsts(list(branch)) for branch in av[1]])
+        else:
+            return None
+        if chars is None or '' in chars:
+            return None  # a group that may match nothing
+        return chars
+
+    items = list(sre_parse.parse(pattern))
+    if not items or items[0] != (sre_constants.AT, sre_constants.AT_BEGINNING):
+        return None
+    items = items[1:]
+    space = [(sre_constants.LITERAL, ord(' '))]
+    if items and items[0][0] is sre_constants.MAX_REPEAT:
+        minimum, maximum, item = items[0][1]
+        if minimum == 0 and list(item) == space:
+            items = items[1:]
+    return firsts(items)
+
+
+class Grammar():
+    # Lexer token tables compiled once and shared by every Lexer and parser
+    # of the process, root and included documents alike. Parse methods match
+    # token values with the compiled patterns, e.g.
+    # grammar.block_tokens['CODE_LINE'].match(value).
+    __slots__ = (
+        'preproc_table', 'block_table', 'inline_table', 'inline_deco_table',
+        'preproc_tokens', 'block_tokens', 'inline_tokens',
+        'roleline', 'ast_section_title',
+    )
+    preproc_table: Lexer.TokenTable
+    block_table: Lexer.TokenTable
+    inline_table: Lexer.TokenTable
+    inline_deco_table: Lexer.TokenTable
+    preproc_tokens: Mapping[str, re.Pattern]
+    block_tokens: Mapping[str, re.Pattern]
+    inline_tokens: Mapping[str, re.Pattern]
+    roleline: re.Pattern
+    ast_section_title: re.Pattern
+
+    def __init__(self):
+        deco_tokens = {'DECO_END': Lexer.inline_tokens['DECO_END']}
+        deco_tokens = deco_tokens | Lexer.inline_color_deco_tokens | Lexer.inline_deco_tokens
+        tables = {
+            'preproc': Lexer.TokenTable(Lexer.preproc_tokens),
+            'block': Lexer.TokenTable(Lexer.block_tokens),
+            'inline': Lexer.TokenTable(Lexer.inline_tokens),
+            'inline_deco': Lexer.TokenTable(deco_tokens),
+        }
+        for name, table in tables.items():
+            object.__setattr__(self, name + '_table', table)
+        for name in ('preproc', 'block', 'inline'):
+            table = tables[name]
+            patterns = MappingProxyType(dict(zip(table.keys, table.patterns)))
+            object.__setattr__(self, name + '_tokens', patterns)
+        # a line made of a role, e.g. ¤include⸨file⸩ in a code block
+        object.__setattr__(self, 'roleline', re.compile(r'( *)' + Lexer.inline_tokens['ROLE']))
+        # the title line of an underlined (Setext-like) section
+        object.__setattr__(self, 'ast_section_title',
+                           re.compile(r'(^)(?:([*+]?) +)?([^⟦]+) *(?:⟦([^⟧]*)⟧)?'))
+
+    @contextlib.contextmanager
+    def shared_lines(self) -> Iterator[None]:
+        # Within the block the tables remember the tokens of every line they
+        # lexed, so sources read several times in a build (e.g. for each of
+        # its variants, see app.variants) lex each distinct line once.
+        tables = (self.preproc_table, self.block_table, self.inline_table, self.inline_deco_table)
+        for table in tables:
+            table.memo = dict()
+        try:
+            yield
+        finally:
+            for table in tables:
+                table.memo = None
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Grammar is read-only')
+
+    def __delattr__(self, name):
+        raise AttributeError('Grammar is read-only')
+
+
+grammar = Grammar()
+
+
 class TglyphParser(Parser):
     def __init__(self, reader: Reader):
         super().__init__(reader)
@@ -200,8 +388,11 @@ class TglyphParser(Parser):
         self.rootnode: Optional[nd.DocumentNode] = None
         self.nodes: List[nd.ASTNode] = list()
         self.lexer: Lexer = Lexer()
+        self.attrexpander: Optional[AttrExpander] = None  # set by _init_config()
 
         self.rootnode = nd.DocumentNode()
+        if reader.parent:
+            self.rootnode.pathcache = reader.root_reader.parser.rootnode.pathcache
         self.nodes.append(self.rootnode)
 
     def parse(self, data: str) -> Optional[nd.DocumentNode]:
@@ -215,14 +406,23 @@ class TglyphParser(Parser):
             msg = 'Unknown token.'
             msg = f'{self.reader.path}:{lineno}: {msg}'
             raise ThothglyphError(msg)
-        tokens = list() + self.tokens
+        tokens = TokenStream(self.tokens)
         tokens = self.p_document(tokens)
+        assert self.attrexpander is not None
+        if self.attrexpander.unresolved:
+            names = ', '.join(sorted(self.attrexpander.unresolved))
+            logger.warn('{}: undefined attrs: {}'.format(self.reader.path, names))
         return self.rootnode
 
     def _tokens(self, token: Lexer.Token, offset: int) -> Lexer.Token:
-        if self.tokens.index(token) + offset >= len(self.tokens):
+        # token.no is the index of a lexed token in self.tokens;
+        # terminators pushed by the parser (no == -1) are looked up
+        index = token.no
+        if not (0 <= index < len(self.tokens) and self.tokens[index] is token):
+            index = self.tokens.index(token)
+        if index + offset >= len(self.tokens):
             return None
-        return self.tokens[self.tokens.index(token) + offset]
+        return self.tokens[index + offset]
 
     def preprocess(self, data: str) -> List[Tuple[int, str]]:
         self._init_config()
@@ -235,32 +435,31 @@ class TglyphParser(Parser):
             msg = f'{self.reader.path}:{lineno}: {msg}'
             raise ThothglyphError(msg)
         self.pplines = list()
-        tokens = list() + self.tokens
+        tokens = TokenStream(self.tokens)
         while tokens:
-            if tokens[0].key == 'CONFIG_LINE':
+            if tokens.peek().key == 'CONFIG_LINE':
                 tokens = self.p_configblock(tokens)
-            elif tokens[0].key == 'COMMENT':
-                if tokens[0].pos == 0:
-                    self._line_preprocessed(tokens[0])
-                tokens.pop(0)
-            elif tokens[0].key == 'CONTROL_FLOW':
+            elif tokens.peek().key == 'COMMENT':
+                if tokens.peek().pos == 0:
+                    self._line_preprocessed(tokens.peek())
+                tokens.advance()
+            elif tokens.peek().key == 'CONTROL_FLOW':
                 tokens = self.p_controlflow(tokens)
             else:
-                self.pplines.append((tokens[0].line, tokens[0].value))
-                tokens.pop(0)
+                self.pplines.append((tokens.peek().line, tokens.peek().value))
+                tokens.advance()
         ppdata = self.pplines
         return ppdata
 
     def _init_config(self) -> None:
-        config = nd.ConfigNode()
         if self.reader.parent:
-            pconfig = self.reader.parent.parser.rootnode.config
-            pattrs = dict(pconfig.__dict__)
-            for key in ('parent', 'children', 'id'):
-                pattrs.pop(key)
-            for key in pattrs:
-                setattr(config, key, pattrs[key])
+            config = nd.ConfigNode(base=self.reader.parent.parser.rootnode.config)
+        else:
+            config = nd.ConfigNode()
+            config.fix_attrs(self.reader.fixed_attrs)
         self.rootnode.config = config
+        self.attrexpander = AttrExpander(
+            grammar.inline_tokens['ATTR'], '⁅', config.attrs, self.reader.attrnames)
 
     def _line_preprocessed(self, token: Lexer.Token) -> None:
         is_head = (token.pos == 0)
@@ -274,49 +473,48 @@ class TglyphParser(Parser):
             lineno, lineval = self.pplines[-1]
             self.pplines[-1] = (lineno, lineval.rstrip())
 
-    def p_configblock(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_configblock(self, tokens: TokenStream) -> TokenStream:
         config = self.rootnode.config
-        begintoken = tokens[0]
-        self._line_preprocessed(tokens[0])
-        tokens.pop(0)
-        subtokens = list()
+        begintoken = tokens.peek()
+        self._line_preprocessed(tokens.peek())
+        tokens.advance()
+        begin = tokens.mark()
         while tokens:
-            if tokens[0].key == 'CONFIG_LINE':
+            if tokens.peek().key == 'CONFIG_LINE':
                 break
-            self._line_preprocessed(tokens[0])
-            subtokens.append(tokens.pop(0))
+            self._line_preprocessed(tokens.peek())
+            tokens.advance()
         else:
             lineno = begintoken.line + 1
             msg = 'Config block is not closed.'
             msg = f'{self.reader.path}:{lineno}: {msg}'
             raise ThothglyphError(msg)
-        self._line_preprocessed(tokens[0])
-        tokens.pop(0)
-        m = re.match(Lexer.inline_tokens['ROLE'], subtokens[0].value) if subtokens else None
+        self._line_preprocessed(tokens.peek())
+        subtokens = tokens.slice(begin)
+        tokens.advance()
+        m = grammar.inline_tokens['ROLE'].match(subtokens.peek().value) if subtokens else None
         if m and m.group(1) == 'include':
             role = nd.RoleNode()
             role.role = m.group(1)
             role.opts = m.group(2).split(',') if m.group(2) is not None else ['']
             role.value = self.replace_text_attrs(m.group(3))
-            text = nd.TextNode()
-            self.nodes.append(text)
+            textnode = nd.TextNode()
+            self.nodes.append(textnode)
             self.p_plaininclude(subtokens, role)
             self.nodes.pop()
-            config.parse(text.text)
+            self._parse_config(config, textnode.text)
         else:
             prev = begintoken
-            text = str()
+            parts: List[str] = list()
             for token in subtokens:
                 if token.line != prev.line:
                     if prev.key != 'CONFIG_LINE':
-                        text += '\n'
-                    text += token.value[0:]
-                else:
-                    text += token.value
+                        parts.append('\n')
+                parts.append(token.value)
                 prev = token
-            text = self.replace_text_attrs(text)
+            text = self.replace_text_attrs(''.join(parts))
             try:
-                config.parse(text)
+                self._parse_config(config, text)
             except Exception as e:
                 e_type, e_value, e_tb = sys.exc_info()
                 # tb_depth = 0
@@ -337,60 +535,60 @@ class TglyphParser(Parser):
                 raise ThothglyphError(msg)
         return tokens
 
-    def p_controlflow(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        match = re.match(Lexer.preproc_tokens['CONTROL_FLOW'], tokens[0].value)
+    def p_controlflow(self, tokens: TokenStream) -> TokenStream:
+        match = grammar.preproc_tokens['CONTROL_FLOW'].match(tokens.peek().value)
         assert match
         keyword, sentence = match.group(1), match.group(2)
         if keyword == 'if':
-            self._line_preprocessed(tokens[0])
-            tokens.pop(0)
-            cond = eval(sentence, {}, self.rootnode.config.attrs)
+            self._line_preprocessed(tokens.peek())
+            tokens.advance()
+            cond = self._eval_condition(sentence)
             tokens = self.p_if_else(tokens, [cond])
         else:
-            lineno = tokens[0].line + 1
+            lineno = tokens.peek().line + 1
             msg = 'Illegal ControlFlow token.'
             msg = f'{self.reader.path}:{lineno}: {msg}'
             raise ThothglyphError(msg)
         return tokens
 
-    def p_if_else(self, tokens: List[Lexer.Token], conds: List[bool]) -> List[Lexer.Token]:
-        firstflowtoken = self._tokens(tokens[0], -1) or tokens[0]
-        lastflowtoken = tokens[0]
-        lasttoken = tokens[0]
+    def p_if_else(self, tokens: TokenStream, conds: List[bool]) -> TokenStream:
+        firstflowtoken = self._tokens(tokens.peek(), -1) or tokens.peek()
+        lastflowtoken = tokens.peek()
+        lasttoken = tokens.peek()
         while tokens:
-            if tokens[0].key == 'TEXT' and all(conds):
-                self.pplines.append((tokens[0].line, tokens[0].value))
-                lasttoken = tokens.pop(0)
-            elif tokens[0].key == 'CONTROL_FLOW':
-                match = re.match(Lexer.preproc_tokens['CONTROL_FLOW'], tokens[0].value)
+            if tokens.peek().key == 'TEXT' and all(conds):
+                self.pplines.append((tokens.peek().line, tokens.peek().value))
+                lasttoken = tokens.advance()
+            elif tokens.peek().key == 'CONTROL_FLOW':
+                match = grammar.preproc_tokens['CONTROL_FLOW'].match(tokens.peek().value)
                 assert match
-                lastflowtoken = tokens[0]
+                lastflowtoken = tokens.peek()
                 keyword, sentence = match.group(1), match.group(2)
                 if keyword == 'end':
                     break
                 elif keyword == 'if':
-                    self._line_preprocessed(tokens[0])
-                    tokens.pop(0)
-                    conds += [all(conds) and eval(sentence, {}, self.rootnode.config.attrs)]
+                    self._line_preprocessed(tokens.peek())
+                    tokens.advance()
+                    conds += [all(conds) and self._eval_condition(sentence)]
                     tokens = self.p_if_else(tokens, conds)
-                    lasttoken = tokens[0]
+                    lasttoken = tokens.peek()
                     conds.pop()
                 elif keyword == 'elif':
-                    conds[-1] = not all(conds) and eval(sentence, {}, self.rootnode.config.attrs)
-                    self._line_preprocessed(tokens[0])
-                    lasttoken = tokens.pop(0)
+                    conds[-1] = not all(conds) and self._eval_condition(sentence)
+                    self._line_preprocessed(tokens.peek())
+                    lasttoken = tokens.advance()
                 elif keyword == 'else':
                     conds[-1] = not all(conds)
-                    self._line_preprocessed(tokens[0])
-                    lasttoken = tokens.pop(0)
+                    self._line_preprocessed(tokens.peek())
+                    lasttoken = tokens.advance()
                 else:
                     lineno = lastflowtoken.line + 1
                     msg = f'Unknown ControlFlow keyword: "{keyword}".'
                     msg = f'{self.reader.path}:{lineno}: {msg}'
                     raise ThothglyphError(msg)
             else:
-                self._line_preprocessed(tokens[0])
-                lasttoken = tokens.pop(0)
+                self._line_preprocessed(tokens.peek())
+                lasttoken = tokens.advance()
         else:
             lineno0 = firstflowtoken.line + 1
             # lineno1 = lastflowtoken.line + 1
@@ -398,11 +596,11 @@ class TglyphParser(Parser):
             msg = 'ControlFlow is not closed.'
             msg = f'{self.reader.path}:{lineno0}-{lineno1}: {msg}'
             raise ThothglyphError(msg)
-        self._line_preprocessed(tokens[0])
-        tokens.pop(0)
+        self._line_preprocessed(tokens.peek())
+        tokens.advance()
         return tokens
 
-    def p_document(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_document(self, tokens: TokenStream) -> TokenStream:
         tokens = self.p_ignore_emptylines(tokens)
         tokens = self.p_blocks(tokens)
         tokens = self.p_ignore_emptylines(tokens)
@@ -422,140 +620,141 @@ class TglyphParser(Parser):
             raise ThothglyphError(msg)
         return self.nodes[idx]
 
-    def p_blocks(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_blocks(self, tokens: TokenStream) -> TokenStream:
         while tokens:
-            if tokens[0].key == 'BREAK_PARAGRAPH':
-                tokens.pop(0)
-            elif tokens[0].key == 'BLOCKS_TERMINATOR':
-                tokens.pop(0)
+            if tokens.peek().key == 'BREAK_PARAGRAPH':
+                tokens.advance()
+            elif tokens.peek().key == 'BLOCKS_TERMINATOR':
+                tokens.advance()
                 break
-            elif tokens[0].key == 'SECTION_TERMINATOR':
-                tokens.pop(0)
+            elif tokens.peek().key == 'SECTION_TERMINATOR':
+                tokens.advance()
                 break
             else:
                 tokens = self.p_block(tokens)
             tokens = self.p_ignore_emptylines(tokens)
         return tokens
 
-    def p_block(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        if tokens[0].key == 'SECTION_TITLE_LINE':
+    def p_block(self, tokens: TokenStream) -> TokenStream:
+        if tokens.peek().key == 'SECTION_TITLE_LINE':
             tokens = self.p_section(tokens)
-        elif tokens[0].key == 'SCOPE_BEGIN_SYMBOL':
+        elif tokens.peek().key == 'SCOPE_BEGIN_SYMBOL':
             tokens = self.p_scoped_blocks(tokens)
-        elif tokens[0].key == 'TOC_LINE':
+        elif tokens.peek().key == 'TOC_LINE':
             tokens = self.p_tocblock(tokens)
-        elif tokens[0].key == 'FIGURE_LINE':
+        elif tokens.peek().key == 'FIGURE_LINE':
             tokens = self.p_figureblock(tokens)
-        elif tokens[0].key == 'TABLE_LINE':
+        elif tokens.peek().key == 'TABLE_LINE':
             tokens = self.p_basictableblock(tokens)
-        elif tokens[0].key == 'LISTTABLE_BEGIN_LINE':
+        elif tokens.peek().key == 'LISTTABLE_BEGIN_LINE':
             tokens = self.p_listtableblock(tokens, mode=0)
-        elif tokens[0].key == 'LISTTABLE_obsoleted_BEGIN_LINE':
+        elif tokens.peek().key == 'LISTTABLE_obsoleted_BEGIN_LINE':
             tokens = self.p_listtableblock(tokens, mode=1)
-        elif tokens[0].key == 'FOOTNOTE_LIST_SYMBOL':
+        elif tokens.peek().key == 'FOOTNOTE_LIST_SYMBOL':
             tokens = self.p_monolistitem(tokens)
-        elif tokens[0].key == 'REFERENCE_LIST_SYMBOL':
+        elif tokens.peek().key == 'REFERENCE_LIST_SYMBOL':
             tokens = self.p_monolistitem(tokens)
-        elif tokens[0].key == 'LIST_TERMINATOR_SYMBOL':
+        elif tokens.peek().key == 'LIST_TERMINATOR_SYMBOL':
             tokens = self.p_listitem(tokens)
-        elif tokens[0].key == 'BULLET_LIST_SYMBOL':
+        elif tokens.peek().key == 'BULLET_LIST_SYMBOL':
             tokens = self.p_listitem(tokens)
-        elif tokens[0].key == 'ORDERED_LIST_SYMBOL':
+        elif tokens.peek().key == 'ORDERED_LIST_SYMBOL':
             tokens = self.p_listitem(tokens)
-        elif tokens[0].key == 'DESC_LIST_SYMBOL':
+        elif tokens.peek().key == 'DESC_LIST_SYMBOL':
             tokens = self.p_listitem(tokens)
-        elif tokens[0].key == 'CHECK_LIST_SYMBOL':
+        elif tokens.peek().key == 'CHECK_LIST_SYMBOL':
             tokens = self.p_listitem(tokens)
-        elif tokens[0].key == 'QUOTE_SYMBOL':
+        elif tokens.peek().key == 'QUOTE_SYMBOL':
             tokens = self.p_quoteblock(tokens)
-        elif tokens[0].key == 'CODE_LINE':
+        elif tokens.peek().key == 'CODE_LINE':
             tokens = self.p_codeblock(tokens)
-        elif tokens[0].key == 'CUSTOM_BEGIN_LINE':
+        elif tokens.peek().key == 'CUSTOM_BEGIN_LINE':
             tokens = self.p_customblock(tokens)
-        elif tokens[0].key == 'STR_LINE':
-            if len(tokens) >= 2 and tokens[1].key == 'HR_LINE':
+        elif tokens.peek().key == 'STR_LINE':
+            if len(tokens) >= 2 and tokens.peek(1).key == 'HR_LINE':
                 tokens = self.p_section(tokens)
             else:
                 tokens = self.p_paragraph(tokens)
-        elif tokens[0].key == 'HR_LINE':
+        elif tokens.peek().key == 'HR_LINE':
             tokens = self.p_horizon(tokens)
         else:
-            tokens.pop(0)
+            tokens.advance()
         return tokens
 
-    def p_error(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        if tokens[0].key == 'CONFIG_LINE':
-            lineno = tokens[0].line + 1
+    def p_error(self, tokens: TokenStream) -> TokenStream:
+        if tokens.peek().key == 'CONFIG_LINE':
+            lineno = tokens.peek().line + 1
             msg = ''
             msg = f'{self.reader.path}:{lineno}: {msg}'
             raise ThothglyphError(msg)
         return tokens
 
-    def p_section(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_section(self, tokens: TokenStream) -> TokenStream:
         # terminate
         accepted = (nd.DocumentNode, nd.SectionNode)
         if not isinstance(self.nodes[-1], accepted):
-            tokens.insert(0, Lexer.Token(-1, -1, -1, 'BLOCKS_TERMINATOR', ''))
+            tokens.push(Lexer.Token(-1, -1, -1, 'BLOCKS_TERMINATOR', ''))
             return tokens
-        if tokens[0].key == 'SECTION_TITLE_LINE':
-            m = re.match(Lexer.block_tokens['SECTION_TITLE_LINE'], tokens[0].value)
+        if tokens.peek().key == 'SECTION_TITLE_LINE':
+            m = grammar.block_tokens['SECTION_TITLE_LINE'].match(tokens.peek().value)
             assert m
             level = len(m.group(1))
         else:
-            if tokens[1].value[-1] == '=':
+            if tokens.peek(1).value[-1] == '=':
                 level = 1
             else:
                 level = 2
         if self._lastsection.level >= level:
-            tokens.insert(0, Lexer.Token(-1, -1, -1, 'SECTION_TERMINATOR', ''))
+            tokens.push(Lexer.Token(-1, -1, -1, 'SECTION_TERMINATOR', ''))
             return tokens
 
         if level > self._lastsection.level + 1:
-            token = tokens[0]
+            token = tokens.peek()
             msg = 'Section level {} appears suddenly.'.format(level)
             msg += ' Section level must not be skipped.'
             lineno = token.line + 1
             msg = f'{self.reader.path}:{lineno}: {msg}'
             raise ThothglyphError(msg)
         # body
-        if tokens[0].key == 'SECTION_TITLE_LINE':
+        if tokens.peek().key == 'SECTION_TITLE_LINE':
             assert m
             section = nd.SectionNode()
             section.level = len(m.group(1))
         else:
-            ast_section_title_token = r'(^)(?:([*+]?) +)?([^⟦]+) *(?:⟦([^⟧]*)⟧)?'
-            m = re.match(ast_section_title_token, tokens[0].value)
+            m = grammar.ast_section_title.match(tokens.peek().value)
             assert m
             section = nd.SectionNode()
-            if tokens[1].value[-1] == '=':
+            if tokens.peek(1).value[-1] == '=':
                 section.level = 1
             else:
                 section.level = 2
-        section.srcpath = os.path.abspath(self.reader.path)
+        section.srcpath = self._abspath(self.reader.path)
+        section.srcdoc = self.reader.docindex
         section.level = level
         section.opts['nonum'] = (m.group(2) in ('*', '+'))
         section.opts['notoc'] = (m.group(2) == '*')
         section.title = self.replace_text_attrs(m.group(3))
         section.id = m.group(4) or ''
-        if tokens[0].key == 'SECTION_TITLE_LINE':
-            tokens.pop(0)
+        section.srctoken = tokens.peek()
+        if tokens.peek().key == 'SECTION_TITLE_LINE':
+            tokens.advance()
         else:
-            tokens.pop(0)
-            tokens.pop(0)
+            tokens.advance()
+            tokens.advance()
         self.nodes[-1].add(section)
         self.nodes.append(section)
         tokens = self.p_blocks(tokens)
         self.nodes.pop()
         return tokens
 
-    def p_monolistitem(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_monolistitem(self, tokens: TokenStream) -> TokenStream:
         # terminate
         accepted = (nd.DocumentNode, nd.SectionNode)
         if not isinstance(self.nodes[-1], accepted):
-            tokens.insert(0, Lexer.Token(-1, -1, -1, 'BLOCKS_TERMINATOR', ''))
+            tokens.push(Lexer.Token(-1, -1, -1, 'BLOCKS_TERMINATOR', ''))
             return tokens
         # body
-        m = re.match(r' *•\[([\^#])(.+)\] +', tokens[0].value)
+        m = re.match(r' *•\[([\^#])(.+)\] +', tokens.peek().value)
         assert m
         clstable = {'^': nd.FootnoteListBlockNode, '#': nd.ReferenceListBlockNode}
         children = self.nodes[-1].children
@@ -568,52 +767,54 @@ class TglyphParser(Parser):
         item.level = 1
         item.indent = 0
         item.title = m.group(2)
+        item.srctoken = tokens.peek()
         monolist.add(item)
-        tokens.pop(0)
+        tokens.advance()
         text = str()
         while tokens:
-            if tokens[0].key != 'STR_LINE':
+            if tokens.peek().key != 'STR_LINE':
                 break
-            text += tokens[0].value
-            tokens.pop(0)
+            text += tokens.peek().value
+            tokens.advance()
         # item.add(text)
         text = self.replace_text_attrs(text)
-        texttokens = self.lexer.lex_inline(text)
+        texttokens = TokenStream(self.lexer.lex_inline(text))
         self.nodes.append(item)
         self.p_inlinemarkup(texttokens)
         self.nodes.pop()
         return tokens
 
-    def p_scoped_blocks(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        begintoken = tokens[0]
-        tokens.pop(0)
+    def p_scoped_blocks(self, tokens: TokenStream) -> TokenStream:
+        begintoken = tokens.peek()
+        tokens.advance()
         nested = 1
-        subtokens = list()
+        begin = tokens.mark()
         while tokens:
-            if tokens[0].key == 'SCOPE_BEGIN_SYMBOL':
+            if tokens.peek().key == 'SCOPE_BEGIN_SYMBOL':
                 nested += 1
-            if tokens[0].key == 'SCOPE_END_SYMBOL':
+            if tokens.peek().key == 'SCOPE_END_SYMBOL':
                 nested -= 1
                 if nested == 0:
                     break
-            subtokens.append(tokens.pop(0))
+            tokens.advance()
         else:
             lineno = begintoken.line + 1
             msg = 'Scoped block is not closed.'
             msg = f'{self.reader.path}:{lineno}: {msg}'
             raise ThothglyphError(msg)
-        tokens.pop(0)
+        subtokens = tokens.slice(begin)
+        tokens.advance()
 
         dummylistblock = nd.ListBlockNode()
         self.nodes.append(dummylistblock)
         while subtokens:
-            if subtokens[0].key == 'BREAK_PARAGRAPH':
-                subtokens.pop(0)
-            elif subtokens[0].key == 'BLOCKS_TERMINATOR':
-                subtokens.pop(0)
+            if subtokens.peek().key == 'BREAK_PARAGRAPH':
+                subtokens.advance()
+            elif subtokens.peek().key == 'BLOCKS_TERMINATOR':
+                subtokens.advance()
                 break
-            elif subtokens[0].key == 'SECTION_TERMINATOR':
-                subtokens.pop(0)
+            elif subtokens.peek().key == 'SECTION_TERMINATOR':
+                subtokens.advance()
                 break
             else:
                 subtokens = self.p_block(subtokens)
@@ -642,7 +843,7 @@ class TglyphParser(Parser):
         }
         if token.key in table:
             listblock = table[token.key]()
-            m = re.match(Lexer.block_tokens[token.key], token.value)
+            m = grammar.block_tokens[token.key].match(token.value)
             assert m
             if m.group(1)[0] != '𐬹':
                 listblock.level = len(m.group(1))
@@ -655,7 +856,7 @@ class TglyphParser(Parser):
         msg = f'{self.reader.path}:{lineno}: {msg}'
         raise ThothglyphError(msg)
 
-    def p_listitem(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_listitem(self, tokens: TokenStream) -> TokenStream:
         # terminate
         table = {
             'BULLET_LIST_SYMBOL': nd.BulletListBlockNode,
@@ -664,7 +865,7 @@ class TglyphParser(Parser):
             'CHECK_LIST_SYMBOL': nd.CheckListBlockNode,
             'LIST_TERMINATOR_SYMBOL': object,
         }
-        m = re.match(Lexer.block_tokens[tokens[0].key], tokens[0].value)
+        m = grammar.block_tokens[tokens.peek().key].match(tokens.peek().value)
         assert m
         item = nd.ListItemNode()
         if m.group(1)[0] != '𐬹':
@@ -672,67 +873,68 @@ class TglyphParser(Parser):
         else:
             item.level = (len(m.group(1)) + 1) // 2
         item.indent = len(m.group(0))
-        item_type = table[tokens[0].key].__name__
-        if tokens[0].key == 'DESC_LIST_SYMBOL':
+        item_type = table[tokens.peek().key].__name__
+        if tokens.peek().key == 'DESC_LIST_SYMBOL':
             text = self.replace_text_attrs(m.group(2))
             if text[-1] == '◃':
                 item.titlebreak = True
                 text = text[:-1]
-            texttokens = self.lexer.lex_inline(text)
+            texttokens = TokenStream(self.lexer.lex_inline(text))
             title = nd.TitleNode()
             item.add(title)
             self.nodes.append(title)
             self.p_inlinemarkup(texttokens)
             self.nodes.pop()
-        elif tokens[0].key == 'CHECK_LIST_SYMBOL':
+        elif tokens.peek().key == 'CHECK_LIST_SYMBOL':
             checktext = m.group(2)[1]
             item.marker = checktext
         if isinstance(self.nodes[-1], nd.ListItemNode):
             item0 = self.nodes[-1]
             if item0.level >= item.level:
-                tokens.insert(0, Lexer.Token(-1, -1, -1, 'BLOCKS_TERMINATOR', ''))
+                tokens.push(Lexer.Token(-1, -1, -1, 'BLOCKS_TERMINATOR', ''))
                 return tokens
         # body
-        if tokens[0].key == 'LIST_TERMINATOR_SYMBOL':
-            tokens.pop(0)
+        if tokens.peek().key == 'LIST_TERMINATOR_SYMBOL':
+            tokens.advance()
             return tokens
         bros = self.nodes[-1].children
         if bros and isinstance(bros[-1], nd.ListBlockNode) and \
            item_type == bros[-1].__class__.__name__ and \
-           self._tokens(tokens[0], -1).key != 'LIST_TERMINATOR_SYMBOL':
+           self._tokens(tokens.peek(), -1).key != 'LIST_TERMINATOR_SYMBOL':
             listblock = self.nodes[-1].children[-1]
             assert listblock.children[-1].level == item.level
         else:
-            if tokens[0].key == 'LIST_TERMINATOR_SYMBOL':
-                tokens.pop(0)
+            if tokens.peek().key == 'LIST_TERMINATOR_SYMBOL':
+                tokens.advance()
                 return tokens
-            listblock = self._get_listblock_by_token(tokens[0])
+            listblock = self._get_listblock_by_token(tokens.peek())
             listblock.level = item.level
             listblock.indent = item.indent
             self.nodes[-1].add(listblock)
         listblock.add(item)
+        item.srctoken = tokens.peek()
 
         self.nodes.append(item)
-        tokens.pop(0)
+        tokens.advance()
         tokens = self.p_blocks(tokens)
         self.nodes.pop()
         return tokens
 
-    def p_quoteblock(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_quoteblock(self, tokens: TokenStream) -> TokenStream:
         quote = nd.QuoteBlockNode()
         self.nodes[-1].add(quote)
         subtokens = list()
-        prev = begintoken = tokens[0]
+        prev = begintoken = tokens.peek()
         prev = Lexer.Token(-1, -1, -1, 'DUMMY', '')
         text = str()
         while tokens:
-            if tokens[0].line != prev.line:
-                if tokens[0].key != 'QUOTE_SYMBOL':
+            if tokens.peek().line != prev.line:
+                if tokens.peek().key != 'QUOTE_SYMBOL':
                     break
             else:
-                text += tokens[0].value
-                subtokens.append(tokens[0])
-            prev = tokens.pop(0)
+                text += tokens.peek().value
+                subtokens.append(tokens.peek())
+            prev = tokens.advance()
         else:
             lineno = begintoken.line + 1
             msg = 'Quote block is not closed.'
@@ -740,46 +942,48 @@ class TglyphParser(Parser):
             raise ThothglyphError(msg)
         subtokens.append(Lexer.Token(-1, -1, -1, 'BLOCKS_TERMINATOR', ''))
         self.nodes.append(quote)
-        self.p_blocks(subtokens)
+        self.p_blocks(TokenStream(subtokens))
         self.nodes.pop()
         return tokens
 
     def _insert_linebreak(self, tokens: List[Lexer.Token]) -> None:
-        for i in reversed(range(1, len(tokens))):
-            prev = tokens[i - 1]
-            token = tokens[i]
+        # rebuilt in one pass; inserting in place is quadratic for long blocks
+        result: List[Lexer.Token] = tokens[:1]
+        for prev, token in zip(tokens, tokens[1:]):
             if token.line != prev.line:
                 lineno = prev.line
                 pos = prev.pos + len(prev.value)
-                tokens.insert(i, Lexer.Token(-1, lineno, pos, 'TEXT', '\n'))
+                result.append(Lexer.Token(-1, lineno, pos, 'TEXT', '\n'))
+            result.append(token)
+        tokens[:] = result
 
-    def p_codeblock(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        m = re.match(Lexer.block_tokens['CODE_LINE'], tokens[0].value)
+    def p_codeblock(self, tokens: TokenStream) -> TokenStream:
+        m = grammar.block_tokens['CODE_LINE'].match(tokens.peek().value)
         assert m
-        indent = tokens[0].pos + len(m.group(1))
+        indent = tokens.peek().pos + len(m.group(1))
         code = nd.CodeBlockNode()
         code.lang = m.group(2)
         self.nodes[-1].add(code)
-        begintoken = tokens[0]
-        tokens.pop(0)
-        subtokens = list()
+        begintoken = tokens.peek()
+        tokens.advance()
+        begin = tokens.mark()
         while tokens:
-            if tokens[0].key == 'CODE_LINE':
+            if tokens.peek().key == 'CODE_LINE':
                 break
-            subtokens.append(tokens.pop(0))
+            tokens.advance()
         else:
             lineno = begintoken.line + 1
             msg = 'Code block is not closed.'
             msg = f'{self.reader.path}:{lineno}: {msg}'
             raise ThothglyphError(msg)
-        tokens.pop(0)
-        roleline_pat = r'( *)' + Lexer.inline_tokens['ROLE']
-        m = re.match(roleline_pat, subtokens[0].value) if subtokens else None
+        subtokens = tokens.slice(begin)
+        tokens.advance()
+        m = grammar.roleline.match(subtokens.peek().value) if subtokens else None
         if m and m.group(2) == 'include':
             numspace = len(m.group(1))
             if numspace < indent:
                 msg = 'Code indentation is to the left of the block indentation.'
-                lineno = subtokens[0].line + 1
+                lineno = subtokens.peek().line + 1
                 msg = f'{self.reader.path}:{lineno}: {msg}'
                 logger.warn(msg)
             role = nd.RoleNode()
@@ -790,13 +994,13 @@ class TglyphParser(Parser):
             self.p_plaininclude(subtokens, role)
             self.nodes.pop()
         else:
-            text = str()
-            prev = subtokens[0]
+            parts: List[str] = list()
+            prev = subtokens.peek()
             warned = False
             for token in subtokens:
                 if token.line != prev.line:
                     if prev.key != 'CODE_LINE':
-                        text += '\n'
+                        parts.append('\n')
                     numspace = re.match(r' *', token.value).end()
                     if 0 < numspace < indent and not warned:
                         msg = 'Code indentation is to the left of the block indentation.'
@@ -804,45 +1008,45 @@ class TglyphParser(Parser):
                         msg = f'{self.reader.path}:{lineno}: {msg}'
                         logger.warn(msg)
                         warned = True
-                    text += token.value[indent:]
+                    parts.append(token.value[indent:])
                 else:
-                    text += token.value
+                    parts.append(token.value)
                 prev = token
-            text = self.replace_text_attrs(text)
+            text = self.replace_text_attrs(''.join(parts))
             texttokens = self.lexer.lex_inline_deco(text, begin=begintoken.line)
             self._insert_linebreak(texttokens)
             self.nodes.append(code)
-            self.p_decotext(texttokens)
+            self.p_decotext(TokenStream(texttokens))
             self.nodes.pop()
         return tokens
 
-    def p_customblock(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        m = re.match(Lexer.block_tokens['CUSTOM_BEGIN_LINE'], tokens[0].value)
+    def p_customblock(self, tokens: TokenStream) -> TokenStream:
+        m = grammar.block_tokens['CUSTOM_BEGIN_LINE'].match(tokens.peek().value)
         assert m
-        indent = tokens[0].pos + len(m.group(1))
+        indent = tokens.peek().pos + len(m.group(1))
         custom = nd.CustomBlockNode()
         custom.ext = m.group(2)
         self.nodes[-1].add(custom)
-        begintoken = tokens[0]
-        tokens.pop(0)
-        subtokens = list()
+        begintoken = tokens.peek()
+        tokens.advance()
+        begin = tokens.mark()
         while tokens:
-            if tokens[0].key == 'CUSTOM_END_LINE':
+            if tokens.peek().key == 'CUSTOM_END_LINE':
                 break
-            subtokens.append(tokens.pop(0))
+            tokens.advance()
         else:
             lineno = begintoken.line + 1
             msg = 'Custom block is not closed.'
             msg = f'{self.reader.path}:{lineno}: {msg}'
             raise ThothglyphError(msg)
-        tokens.pop(0)
-        roleline_pat = r'( *)' + Lexer.inline_tokens['ROLE']
-        m = re.match(roleline_pat, subtokens[0].value) if subtokens else None
+        subtokens = tokens.slice(begin)
+        tokens.advance()
+        m = grammar.roleline.match(subtokens.peek().value) if subtokens else None
         if m and m.group(2) == 'include':
             numspace = len(m.group(1))
             if numspace < indent:
                 msg = 'Custom indentation is to the left of the block indentation.'
-                lineno = subtokens[0].line + 1
+                lineno = subtokens.peek().line + 1
                 msg = f'{self.reader.path}:{lineno}: {msg}'
                 logger.warn(msg)
             role = nd.RoleNode()
@@ -853,51 +1057,51 @@ class TglyphParser(Parser):
             self.p_plaininclude(subtokens, role)
             self.nodes.pop()
         else:
-            prev = subtokens[0]
-            text = str()
+            prev = subtokens.peek()
+            parts: List[str] = list()
             warned = False
             for token in subtokens:
                 if token.line != prev.line:
                     if prev.key != 'CUSTOM_END_LINE':
-                        text += '\n'
+                        parts.append('\n')
                     numspace = re.match(r' *', token.value).end()
                     if 0 < numspace < indent and not warned:
                         msg = 'Code indentation is to the left of the block indentation.'
                         lineno = token.line + 1
                         msg = f'{self.reader.path}:{lineno}: {msg}'
                         warned = True
-                    text += token.value[indent:]
+                    parts.append(token.value[indent:])
                 else:
-                    text += token.value
+                    parts.append(token.value)
                 prev = token
-            text = self.replace_text_attrs(text)
+            text = self.replace_text_attrs(''.join(parts))
             custom.text = text
         return tokens
 
-    def p_horizon(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        tokens.pop(0)
+    def p_horizon(self, tokens: TokenStream) -> TokenStream:
+        tokens.advance()
         horizon = nd.HorizonBlockNode()
         self.nodes[-1].add(horizon)
         return tokens
 
-    def p_tocblock(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        m = re.match(Lexer.block_tokens['TOC_LINE'], tokens[0].value)
+    def p_tocblock(self, tokens: TokenStream) -> TokenStream:
+        m = grammar.block_tokens['TOC_LINE'].match(tokens.peek().value)
         assert m
         toc = nd.TocBlockNode()
         toc.opts = nd.parse_optargs(m.group(1))
         toc.value = m.group(2)
         self.nodes[-1].add(toc)
-        tokens.pop(0)
+        tokens.advance()
         return tokens
 
-    def p_figureblock(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        m = re.match(Lexer.block_tokens['FIGURE_LINE'], tokens[0].value)
+    def p_figureblock(self, tokens: TokenStream) -> TokenStream:
+        m = grammar.block_tokens['FIGURE_LINE'].match(tokens.peek().value)
         assert m
         fig = nd.FigureBlockNode()
         fig.opts = m.group(1).split(',') if m.group(1) is not None else ['']
         fig.caption = self.replace_text_attrs(m.group(2))
         self.nodes[-1].add(fig)
-        tokens.pop(0)
+        tokens.advance()
         self.nodes.append(fig)
         tokens = self.p_block(tokens)
         self.nodes.pop()
@@ -936,22 +1140,22 @@ class TglyphParser(Parser):
                     newopts['align'].append(m.group(2))
         return newopts
 
-    def p_basictableblock(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        prevtoken = self._tokens(tokens[0], -1)
+    def p_basictableblock(self, tokens: TokenStream) -> TokenStream:
+        prevtoken = self._tokens(tokens.peek(), -1)
         opts: Dict[str, str] = dict()
         if prevtoken and prevtoken.key == 'OPTION_LINE':
-            m = re.match(Lexer.block_tokens['OPTION_LINE'], prevtoken.value)
+            m = grammar.block_tokens['OPTION_LINE'].match(prevtoken.value)
             assert m
             opts = self._parse_table_optargs(m.group(1))
         table = nd.TableBlockNode()
         self.nodes[-1].add(table)
         lines = list()
-        begintoken = tokens[0]
+        begintoken = tokens.peek()
         while tokens:
-            if tokens[0].key != 'TABLE_LINE':
+            if tokens.peek().key != 'TABLE_LINE':
                 break
-            lines.append(tokens[0].value)
-            tokens.pop(0)
+            lines.append(tokens.peek().value)
+            tokens.advance()
         tabletexts = list()
         aligns = opts.get('align', list())
         header_splitter = -1
@@ -1014,7 +1218,7 @@ class TglyphParser(Parser):
                 text = self.replace_text_attrs(celltext)
                 text = self._tablecell_merge(table, cell, r, c, text)
                 try:
-                    texttokens = self.lexer.lex_inline(text)
+                    texttokens = TokenStream(self.lexer.lex_inline(text))
                     self.nodes.append(cell)
                     self.p_inlinemarkup(texttokens)
                     self.nodes.pop()
@@ -1022,43 +1226,45 @@ class TglyphParser(Parser):
                     cell.add(nd.TextNode(text))
         return tokens
 
-    def p_listtableblock(self, tokens: List[Lexer.Token], mode) -> List[Lexer.Token]:
+    def p_listtableblock(self, tokens: TokenStream, mode) -> TokenStream:
         if mode == 0:
-            m = re.match(Lexer.block_tokens['LISTTABLE_BEGIN_LINE'], tokens[0].value)
+            m = grammar.block_tokens['LISTTABLE_BEGIN_LINE'].match(tokens.peek().value)
             assert m
             # opts = nd.parse_optargs(m.group(1))
             opts = self._parse_table_optargs(m.group(1))
-            begintoken = tokens[0]
-            tokens.pop(0)
+            begintoken = tokens.peek()
+            tokens.advance()
             nested = 1
-            subtokens = list()
+            begin = tokens.mark()
             while tokens:
-                if tokens[0].key in ('LISTTABLE_BEGIN_LINE', 'CUSTOM_BEGIN_LINE'):
+                if tokens.peek().key in ('LISTTABLE_BEGIN_LINE', 'CUSTOM_BEGIN_LINE'):
                     nested += 1
-                if tokens[0].key == 'CUSTOM_END_LINE':
+                if tokens.peek().key == 'CUSTOM_END_LINE':
                     nested -= 1
                     if nested == 0:
                         break
-                subtokens.append(tokens.pop(0))
-            tokens.pop(0)
+                tokens.advance()
+            subtokens = tokens.slice(begin)
+            tokens.advance()
         else:
-            m = re.match(Lexer.block_tokens['LISTTABLE_obsoleted_BEGIN_LINE'], tokens[0].value)
+            m = grammar.block_tokens['LISTTABLE_obsoleted_BEGIN_LINE'].match(tokens.peek().value)
             assert m
             # opts = nd.parse_optargs(m.group(1))
             opts = self._parse_table_optargs(m.group(1))
-            begintoken = tokens[0]
-            tokens.pop(0)
+            begintoken = tokens.peek()
+            tokens.advance()
             nested = 1
-            subtokens = list()
+            begin = tokens.mark()
             while tokens:
-                if tokens[0].key == 'LISTTABLE_obsoleted_BEGIN_LINE':
+                if tokens.peek().key == 'LISTTABLE_obsoleted_BEGIN_LINE':
                     nested += 1
-                if tokens[0].key == 'LISTTABLE_obsoleted_END_LINE':
+                if tokens.peek().key == 'LISTTABLE_obsoleted_END_LINE':
                     nested -= 1
                     if nested == 0:
                         break
-                subtokens.append(tokens.pop(0))
-            tokens.pop(0)
+                tokens.advance()
+            subtokens = tokens.slice(begin)
+            tokens.advance()
         table = nd.TableBlockNode()
         self.nodes[-1].add(table)
         self.nodes.append(table)
@@ -1130,51 +1336,49 @@ class TglyphParser(Parser):
                 cell.children[0].children[0].text = text
         return tokens
 
-    def p_paragraph(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_paragraph(self, tokens: TokenStream) -> TokenStream:
         paragraph = nd.ParagraphNode()
         self.nodes[-1].add(paragraph)
-        text = str()
-        prev = begintoken = tokens[0]
+        parts: List[str] = list()
+        prev = begintoken = tokens.peek()
         while tokens:
-            if tokens[0].key != 'STR_LINE':
+            if tokens.peek().key != 'STR_LINE':
                 break
-            if tokens[0].line != prev.line:
-                text += '\n'
-                text += tokens[0].value
-            else:
-                text += tokens[0].value
-            prev = tokens.pop(0)
-        text = self.replace_text_attrs(text)
-        texttokens = self.lexer.lex_inline(text, begintoken.line)
+            if tokens.peek().line != prev.line:
+                parts.append('\n')
+            parts.append(tokens.peek().value)
+            prev = tokens.advance()
+        text = self.replace_text_attrs(''.join(parts))
+        texttokens = TokenStream(self.lexer.lex_inline(text, begintoken.line))
         self.nodes.append(paragraph)
         self.p_inlinemarkup(texttokens)
         self.nodes.pop()
         return tokens
 
-    def p_inlinemarkup(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_inlinemarkup(self, tokens: TokenStream) -> TokenStream:
         while tokens:
-            if tokens[0].key == 'EMOJI_ROLE':
+            if tokens.peek().key == 'EMOJI_ROLE':
                 tokens = self.p_emoji_role(tokens)
-            elif tokens[0].key == 'EMOJI_LINK':
+            elif tokens.peek().key == 'EMOJI_LINK':
                 tokens = self.p_emoji_link(tokens)
-            elif tokens[0].key == 'ROLE':
+            elif tokens.peek().key == 'ROLE':
                 tokens = self.p_role(tokens)
-            elif tokens[0].key == 'LINK':
+            elif tokens.peek().key == 'LINK':
                 tokens = self.p_link(tokens)
-            elif tokens[0].key == 'FOOTNOTE':
+            elif tokens.peek().key == 'FOOTNOTE':
                 tokens = self.p_footnote(tokens)
-            elif tokens[0].key == 'REFERENCE':
+            elif tokens.peek().key == 'REFERENCE':
                 tokens = self.p_reference(tokens)
-            elif tokens[0].key in Lexer.all_deco_keys:
+            elif tokens.peek().key in Lexer.all_deco_keys:
                 tokens = self.p_deco(tokens)
-            elif tokens[0].key in 'LINEBREAK':
+            elif tokens.peek().key in 'LINEBREAK':
                 tokens = self.p_linebreak(tokens)
             else:
                 tokens = self.p_text(tokens)
         return tokens
 
-    def p_emoji_role(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        m = re.match(Lexer.inline_tokens['EMOJI_ROLE'], tokens[0].value)
+    def p_emoji_role(self, tokens: TokenStream) -> TokenStream:
+        m = grammar.inline_tokens['EMOJI_ROLE'].match(tokens.peek().value)
         assert m
         role_emoji = m.group(1)
         role_table = {
@@ -1194,22 +1398,22 @@ class TglyphParser(Parser):
             tokens = self.p_menu(tokens, role)
         else:
             self.nodes[-1].add(role)
-            tokens.pop(0)
+            tokens.advance()
         return tokens
 
-    def p_emoji_link(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        m = re.match(Lexer.inline_tokens['EMOJI_LINK'], tokens[0].value)
+    def p_emoji_link(self, tokens: TokenStream) -> TokenStream:
+        m = grammar.inline_tokens['EMOJI_LINK'].match(tokens.peek().value)
         assert m
         link = nd.LinkNode()
         link.opts = m.group(2).split(',') if m.group(2) is not None else ['']
         link.value = self.replace_text_attrs(m.group(3))
-        link.srcpath = os.path.abspath(self.reader.path)
+        link.srcpath = self._abspath(self.reader.path)
         self.nodes[-1].add(link)
-        tokens.pop(0)
+        tokens.advance()
         return tokens
 
-    def p_role(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        m = re.match(Lexer.inline_tokens['ROLE'], tokens[0].value)
+    def p_role(self, tokens: TokenStream) -> TokenStream:
+        m = grammar.inline_tokens['ROLE'].match(tokens.peek().value)
         assert m
         role = nd.RoleNode()
         role.role = m.group(1)
@@ -1227,22 +1431,23 @@ class TglyphParser(Parser):
             tokens = self.p_menu(tokens, role)
         else:
             self.nodes[-1].add(role)
-            tokens.pop(0)
+            tokens.advance()
         return tokens
 
-    def p_image(self, tokens: List[Lexer.Token], role: nd.RoleNode) -> List[Lexer.Token]:
+    def p_image(self, tokens: TokenStream, role: nd.RoleNode) -> TokenStream:
         image = nd.ImageRoleNode()
         image.role = role.role
         image.opts = nd.parse_optargs(role.opts)
         image.value = role.value
         self.nodes[-1].add(image)
-        tokens.pop(0)
+        tokens.advance()
         return tokens
 
-    def p_plaininclude(self, tokens: List[Lexer.Token], role: nd.RoleNode) -> List[Lexer.Token]:
-        tokens.pop(0)
+    def p_plaininclude(self, tokens: TokenStream, role: nd.RoleNode) -> TokenStream:
+        tokens.advance()
         path = role.value
         block = self.nodes[-1]
+        self._add_dependency(path)
         if os.path.exists(path) and hasattr(block, 'text'):
             text = nd.TextNode()
             with open(path, 'r', encoding=self.reader.encoding) as f:
@@ -1259,20 +1464,15 @@ class TglyphParser(Parser):
             block.add(text)
         return tokens
 
-    def p_include(self, tokens: List[Lexer.Token], role: nd.RoleNode) -> List[Lexer.Token]:
-        tokens.pop(0)
+    def p_include(self, tokens: TokenStream, role: nd.RoleNode) -> TokenStream:
+        tokens.advance()
         path = role.value
         if self._check_recursive_include(path):
-            _, ext = os.path.splitext(path)
-            reader: Reader = ReaderClass(ext[1:])(parent=self.reader)
             # reader: Reader = TglyphReader(parent=self.reader)
-            subdoc = reader.read(path)
+            subdoc = self._read_include(path)
             lastsection = self._lastsection
-            for node, gofoward in subdoc.walk_depth():
-                if not gofoward:
-                    continue
-                if isinstance(node, nd.SectionNode):
-                    node.level += lastsection.level
+            for section in subdoc.nodes_of(nd.SectionNode):
+                section.level += lastsection.level
             p = self.nodes[-1]
             block = p.parent
             if len(p.children) == 0:
@@ -1281,117 +1481,117 @@ class TglyphParser(Parser):
                 block.remove(p)
         return tokens
 
-    def p_kbd(self, tokens: List[Lexer.Token], role: nd.RoleNode) -> List[Lexer.Token]:
+    def p_kbd(self, tokens: TokenStream, role: nd.RoleNode) -> TokenStream:
         kbd = nd.KbdRoleNode()
         kbd.role = role.role
         kbd.opts = role.opts
         kbd.value = role.value.strip().split()
         self.nodes[-1].add(kbd)
-        tokens.pop(0)
+        tokens.advance()
         return tokens
 
-    def p_btn(self, tokens: List[Lexer.Token], role: nd.RoleNode) -> List[Lexer.Token]:
+    def p_btn(self, tokens: TokenStream, role: nd.RoleNode) -> TokenStream:
         btn = nd.BtnRoleNode()
         btn.role = role.role
         btn.opts = role.opts
         btn.value = role.value
         self.nodes[-1].add(btn)
-        tokens.pop(0)
+        tokens.advance()
         return tokens
 
-    def p_menu(self, tokens: List[Lexer.Token], role: nd.RoleNode) -> List[Lexer.Token]:
+    def p_menu(self, tokens: TokenStream, role: nd.RoleNode) -> TokenStream:
         menu = nd.MenuRoleNode()
         menu.role = role.role
         menu.opts = role.opts
         menu.value = re.split(r' +\> +', role.value.strip())
         self.nodes[-1].add(menu)
-        tokens.pop(0)
+        tokens.advance()
         return tokens
 
-    def p_link(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        m = re.match(Lexer.inline_tokens['LINK'], tokens[0].value)
+    def p_link(self, tokens: TokenStream) -> TokenStream:
+        m = grammar.inline_tokens['LINK'].match(tokens.peek().value)
         assert m
         link = nd.LinkNode()
         link.opts = m.group(1).split(',') if m.group(1) is not None else ['']
         link.value = self.replace_text_attrs(m.group(2))
-        link.srcpath = os.path.abspath(self.reader.path)
+        link.srcpath = self._abspath(self.reader.path)
         self.nodes[-1].add(link)
-        tokens.pop(0)
+        tokens.advance()
         return tokens
 
-    def p_footnote(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        m = re.match(Lexer.inline_tokens['FOOTNOTE'], tokens[0].value)
+    def p_footnote(self, tokens: TokenStream) -> TokenStream:
+        m = grammar.inline_tokens['FOOTNOTE'].match(tokens.peek().value)
         assert m
         link = nd.FootnoteNode()
         link.value = m.group(1)
         self.nodes[-1].add(link)
-        tokens.pop(0)
+        tokens.advance()
         return tokens
 
-    def p_reference(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        m = re.match(Lexer.inline_tokens['REFERENCE'], tokens[0].value)
+    def p_reference(self, tokens: TokenStream) -> TokenStream:
+        m = grammar.inline_tokens['REFERENCE'].match(tokens.peek().value)
         assert m
         link = nd.ReferenceNode()
         link.value = m.group(1)
         self.nodes[-1].add(link)
-        tokens.pop(0)
+        tokens.advance()
         return tokens
 
-    def p_decotext(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_decotext(self, tokens: TokenStream) -> TokenStream:
         while tokens:
-            if tokens[0].key in Lexer.all_deco_keys:
+            if tokens.peek().key in Lexer.all_deco_keys:
                 tokens = self.p_deco(tokens)
-            elif tokens[0].key == 'TEXT':
+            elif tokens.peek().key == 'TEXT':
                 tokens = self.p_text(tokens)
-            elif tokens[0].key == 'ATTR':
+            elif tokens.peek().key == 'ATTR':
                 tokens = self.p_text(tokens)
             else:
-                lineno = tokens[0].line + 1
+                lineno = tokens.peek().line + 1
                 msg = 'Illegal text token.'
                 msg = f'{self.reader.path}:{lineno}: {msg}'
                 raise ThothglyphError(msg)
         return tokens
 
-    def p_deco(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_deco(self, tokens: TokenStream) -> TokenStream:
         deco = nd.DecorationRoleNode()
-        deco.role = tokens[0].key
-        begintoken = tokens[0]
-        tokens.pop(0)
+        deco.role = tokens.peek().key
+        begintoken = tokens.peek()
+        tokens.advance()
         self.nodes[-1].add(deco)
         self.nodes.append(deco)
         subtokens = list()
         depth = 0
         cur_deco = [deco.role]
         while tokens:
-            if tokens[0].key in Lexer.inline_deco_keys:
-                if tokens[0].key in cur_deco:
-                    idx = cur_deco.index(tokens[0].key)
+            if tokens.peek().key in Lexer.inline_deco_keys:
+                if tokens.peek().key in cur_deco:
+                    idx = cur_deco.index(tokens.peek().key)
                     while len(cur_deco) > idx + 1:
                         cur_deco.pop()
                         depth -= 1
             if cur_deco[-1] in Lexer.inline_deco_keys:
-                if tokens[0].key in (cur_deco[-1], 'DECO_END'):
+                if tokens.peek().key in (cur_deco[-1], 'DECO_END'):
                     if depth == 0:
                         break
                     cur_deco.pop()
                     depth -= 1
-                elif tokens[0].key == cur_deco[-1]:
+                elif tokens.peek().key == cur_deco[-1]:
                     cur_deco.pop()
                     depth -= 1
-                elif tokens[0].key in Lexer.all_deco_keys:
-                    cur_deco.append(tokens[0].key)
+                elif tokens.peek().key in Lexer.all_deco_keys:
+                    cur_deco.append(tokens.peek().key)
                     depth += 1
             else:  # color_deco_keys
-                if tokens[0].key == 'DECO_END':
+                if tokens.peek().key == 'DECO_END':
                     if depth == 0:
                         break
                     cur_deco.pop()
                     depth -= 1
-                elif tokens[0].key in Lexer.all_deco_keys:
-                    cur_deco.append(tokens[0].key)
+                elif tokens.peek().key in Lexer.all_deco_keys:
+                    cur_deco.append(tokens.peek().key)
                     depth += 1
-            subtokens.append(tokens[0])
-            tokens.pop(0)
+            subtokens.append(tokens.peek())
+            tokens.advance()
         else:
             lineno = begintoken.line + 1
             msg = f'Inline {deco.role} is not closed.'
@@ -1400,48 +1600,31 @@ class TglyphParser(Parser):
         if deco.role == 'CODE':
             for token in subtokens:
                 token.key = 'TEXT'
-        tokens.pop(0)
-        self.p_decotext(subtokens)
+        tokens.advance()
+        self.p_decotext(TokenStream(subtokens))
         self.nodes.pop()
         return tokens
 
     def replace_text_attrs(self, text: str) -> str:
-        def attrvalue(m):
-            attr = m.group(1)
-            assert isinstance(self.rootnode, nd.DocumentNode)
-            if hasattr(self.rootnode.config, 'attrs'):
-                attrs = self.rootnode.config.attrs
-                return str(attrs.get(attr, m.group(0)))
-            else:
-                return m.group(0)
-
-        newtext = re.sub(
-            Lexer.inline_tokens['ATTR'], attrvalue, text,
-            flags=re.MULTILINE | re.DOTALL
-        )
-        return newtext
+        assert self.attrexpander is not None
+        return self.attrexpander.expand(text)
 
-    def p_linebreak(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
+    def p_linebreak(self, tokens: TokenStream) -> TokenStream:
         lb = nd.LinebreakNode()
         self.nodes[-1].add(lb)
-        tokens.pop(0)
+        tokens.advance()
         return tokens
 
-    def p_text(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        last_children = self.nodes[-1].children
-        if len(last_children) == 0 or not isinstance(last_children, nd.TextNode):
-            text = nd.TextNode()
-            self.nodes[-1].add(text)
-            text.text += tokens[0].value
-        else:
-            text = self.nodes[-1].children[-1]
-            text.text += '' + tokens[0].value
-        tokens.pop(0)
+    def p_text(self, tokens: TokenStream) -> TokenStream:
+        # adjacent texts are merged by reader.TextMergePass, in linear time
+        text = nd.TextNode(tokens.peek().value)
+        self.nodes[-1].add(text)
+        tokens.advance()
         return tokens
 
-    def p_ignore_emptylines(self, tokens: List[Lexer.Token]) -> List[Lexer.Token]:
-        while tokens and tokens[0].key == 'EMPTY_LINE':
-            tokens.pop(0)
+    def p_ignore_emptylines(self, tokens: TokenStream) -> TokenStream:
+        while tokens and tokens.peek().key == 'EMPTY_LINE':
+            tokens.advance()
         return tokens
 
 
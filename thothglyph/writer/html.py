@@ -91,14 +91,10 @@ class HtmlWriter(Writer):
                 'dir': os.path.join(self.tmpdirname, self.imgdirname),
             },
         }
-        for n, gofoward in self.rootnode.walk_depth():
-            if not gofoward:
-                continue
-            if isinstance(n, nd.ImageRoleNode):
-                tp = 'img'
-                path = os.path.abspath(n.value)
-            else:
-                continue
+        assert isinstance(self.rootnode, nd.DocumentNode)
+        for n in self.rootnode.nodes_of(nd.ImageRoleNode):
+            tp = 'img'
+            path = os.path.abspath(n.value)
             rscs.setdefault(tp, list())
             if path not in rscs[tp]:
                 rscs[tp].append(path)
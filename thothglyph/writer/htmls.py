@@ -28,10 +28,9 @@ class HtmlsWriter(HtmlWriter):
         self.datas = []
 
     def collect_toc_sections(self):
-        for n, gofoward in self.rootnode.walk_depth():
-            if not gofoward:
-                continue
-            if isinstance(n, nd.SectionNode) and n.level == 1:
+        assert isinstance(self.rootnode, nd.DocumentNode)
+        for n in self.rootnode.nodes_of(nd.SectionNode):
+            if n.level == 1:
                 copy_section = copy.copy(n)
                 self.doc_sections.append(copy_section)
 
@@ -41,7 +40,8 @@ class HtmlsWriter(HtmlWriter):
                 continue
             if isinstance(n, nd.SectionNode) and n.level == 1:
                 parent = n.parent
-                parent.children.remove(n)
+                assert parent is not None
+                parent.remove(n)
                 # paragraph = nd.ParagraphNode()
                 # text = nd.TextNode()
                 # if n.opts.get('nonum'):
@@ -101,32 +101,29 @@ class Writer():
         return docdata
 
     def parse(self, node) -> None:
-        prev_continue: bool = False
-        continue_node: Optional[nd.ASTNode] = None
-        for n, gofoward in node.walk_depth():
-            if not self.__continue or n == continue_node:
-                if n == continue_node:
-                    self.__continue = False
+        walker = node.walk_depth()
+        for n, gofoward in walker:
+            if gofoward:
+                mname: str = 'visit_{}'
+            else:
+                mname = 'leave_{}'
+            nodename = re.sub(r'Node$', r'', n.__class__.__name__).lower()
+            methodname = mname.format(nodename)
+            try:
+                if not hasattr(self, methodname):
+                    raise NotImplementedError()
+                method = getattr(self, methodname)
+                method(n)
+            except NotImplementedError:
+                methodname = mname.format('other')
+                method = getattr(self, methodname)
+                method(n)
+            except Exception as e:
+                logger.error('{}: {}'.format(methodname, e))
+            if self.__continue:
                 if gofoward:
-                    mname: str = 'visit_{}'
-                else:
-                    mname = 'leave_{}'
-                nodename = re.sub(r'Node$', r'', n.__class__.__name__).lower()
-                methodname = mname.format(nodename)
-                try:
-                    if not hasattr(self, methodname):
-                        raise NotImplementedError()
-                    method = getattr(self, methodname)
-                    method(n)
-                except NotImplementedError:
-                    methodname = mname.format('other')
-                    method = getattr(self, methodname)
-                    method(n)
-                except Exception as e:
-                    logger.error('{}: {}'.format(methodname, e))
-            if self.__continue and not prev_continue:
-                continue_node = n
-            prev_continue = self.__continue
+                    walker.skip()
+                self.__continue = False
 
     def _continue(self) -> None:
         self.__continue = True